@@ -28,9 +28,7 @@ INSTALLED_APPS = [
 from datetime import timedelta
 
 MIDDLEWARE = [
-    "health_app.middleware.RequestLoggingMiddleware",
-    "health_app.middleware.AuditLogMiddleware",
-    "health_app.middleware.PerformanceMonitoringMiddleware",
+    "health_app.middleware.RequestObservabilityMiddleware",
     "health_app.middleware.SecurityHeadersMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -53,6 +51,7 @@ CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_HEADERS = list(default_headers) + [
     'Authorization',
 ]
+CORS_EXPOSE_HEADERS = ['X-Older-Cursor', 'X-Newer-Cursor', 'Link']
 
 
 import dj_database_url
@@ -127,6 +126,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'health_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'health_app.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_THROTTLE_CLASSES': [
         'health_app.throttling.BurstRateThrottle',
         'health_app.throttling.SustainedRateThrottle',
@@ -138,6 +146,7 @@ REST_FRAMEWORK = {
         'premium': '5000/hour',
         'ai_analysis': '20/hour',
         'image_upload': '10/hour',
+        'data_export': '10/hour',
         'admin': '10000/hour',
     },
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -179,9 +188,97 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'throttle-cache',
         'TIMEOUT': 3600,
+    },
+    # Shared by all workers on a host so signal invalidation reaches every process
+    'health_records': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'health_records'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000
+        }
     }
 }
 
+# GDPR data export (health_app.gdpr.DataExporter)
+GDPR_EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,                # Rows fetched per round trip while streaming
+    'BUFFER_SIZE': 64 * 1024,          # Bytes buffered before each write/yield
+    'DEFAULT_COMPRESSION': 'gzip',     # None, 'gzip' or 'zstd'
+}
+
+# Background export jobs (health_app.services.export_jobs)
+# Web workers run queued jobs in-process; `manage.py run_export_jobs` runs a dedicated worker
+EXPORT_JOB_SETTINGS = {
+    'RUN_IN_PROCESS': True,
+    'WORKERS': 2,                # Export threads per runner
+    'MAX_CONCURRENT': 2,         # Exports running at once across all runners (<= 8 with FileLockBackend)
+    'POLL_INTERVAL': 5.0,        # Seconds between checks for queued jobs
+    'POLL_AFTER': 2,             # Retry-After hint for clients polling job status
+    'STALE_AFTER': 1800,         # Seconds before a PROCESSING job is assumed dead and requeued
+    'MAX_ATTEMPTS': 3,
+    'PROGRESS_INTERVAL': 1.0,    # Min seconds between progress writes
+    'FILE_RETENTION_DAYS': 7,    # Finished export files are deleted by enforce_retention after this
+}
+
+# Dashboard health record (HealthRecordView)
+# Sections are newest first; ?<section>_limit= and ?<section>_before=<cursor> page them
+HEALTH_RECORD_SETTINGS = {
+    'CACHE_ALIAS': 'health_records',
+    'CACHE_TIMEOUT': 300,
+    'SECTION_LIMITS': {
+        'symptoms': 50,
+        'diagnoses': 20,
+        'chat_history': 20,
+    },
+    'MAX_SECTION_LIMIT': 200,
+}
+
+# Rate Limiting Engine (GCRA, one timestamp per throttle key)
+# LocalMemoryBackend: per-process; FileLockBackend: shared by all workers on a host;
+# RedisBackend: shared across hosts (OPTIONS: {'URL': 'redis://...'})
+RATE_LIMIT_SETTINGS = {
+    'BACKEND': 'health_app.ratelimit.FileLockBackend',
+    'OPTIONS': {
+        'PATH': os.path.join(BASE_DIR, 'ratelimit', 'gcra.bin'),
+        'SLOTS': 65536,
+        'LEASE_SLOTS': 16384,
+    },
+}
+
+# Cost-weighted AI quotas (AIAnalysisThrottle) and concurrent stream cap
+AI_QUOTA_SETTINGS = {
+    'TOKENS_PER_UNIT': 1000,           # Prompt tokens per quota unit
+    'CONTEXT_TOKENS': 500,             # Retrieved history/system prompt added to every call
+    'IMAGE_BYTES_PER_UNIT': 1024 * 1024,
+    'ENDPOINT_MODELS': {
+        'ai-diagnose': 'gemini-1.5-flash',
+        'img-diagnose': 'gemini-1.5-flash',
+        'chat-with-memory': 'gemini-1.5-flash',
+        'diagnose-with-memory': 'gemini-1.5-flash',
+    },
+    'MODEL_COST_MULTIPLIERS': {
+        'gemini-1.5-flash': 1.0,
+        'gpt-3.5-turbo': 1.0,
+        'gemini-1.5-pro': 4.0,
+        'gpt-4o': 5.0,
+    },
+    'MAX_CONCURRENT_STREAMS': config('MAX_CONCURRENT_STREAMS', default=2, cast=int),
+    'STREAM_LEASE_SECONDS': 300,       # Lease expiry if a worker dies mid-stream
+    'STREAM_RETRY_AFTER': 5,
+}
+
+# Per-process admission control for outbound LLM calls. Running plus queued
+# calls each hold a gunicorn thread, so keep MAX_CONCURRENT + MAX_QUEUE below
+# the thread count (--threads=8 in render.yaml): cheap endpoints still get a
+# thread and callers beyond the queue are rejected at once ('queue_full')
+LLM_ADMISSION_SETTINGS = {
+    'MAX_CONCURRENT': config('LLM_MAX_CONCURRENT', default=6, cast=int),
+    'MAX_QUEUE': config('LLM_MAX_QUEUE', default=1, cast=int),  # At most threads - MAX_CONCURRENT - 1
+    'QUEUE_TIMEOUT': 5.0,              # Seconds a call may wait for a slot
+    'RETRY_AFTER': 5,
+}
+
 # Logging Configuration (Enterprise-grade)
 LOGGING = {
     'version': 1,
@@ -257,6 +354,22 @@ LOGGING = {
     },
 }
 
+# Request Observability (logging, audit and slow-request alerts)
+OBSERVABILITY_SETTINGS = {
+    'DEFAULT_LOG_SAMPLE_RATE': 1.0,  # Fraction of successful requests logged at INFO
+    'LOG_SAMPLE_RATES': {  # Per-route overrides, keyed by URL route
+        '/metrics': 0.0,
+        '/chat/history/': 0.1,
+        '/health/records/': 0.1,
+        '/api/token/refresh/': 0.1,
+    },
+    'SLOW_REQUEST_THRESHOLD': 2.0,  # seconds
+    'SLOW_FIRST_CHUNK_THRESHOLD': 2.0,  # seconds until a stream sends its first byte
+    'SLOW_STREAM_THRESHOLD': 30.0,  # seconds for a full streamed response
+    'ASYNC_LOGGING': True,  # Write log records from background QueueListener threads
+    'QUEUED_LOGGERS': ['django', 'django.request', 'health_app', 'security'],
+}
+
 # Create logs directory if it doesn't exist
 os.makedirs(os.path.join(BASE_DIR, 'logs'), exist_ok=True)
 
@@ -265,7 +378,21 @@ GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 
 # Note: Embeddings use HuggingFace sentence-transformers (local, no API key needed)
 
-OPENAI_CLIENT = None
+# OpenAI is the fallback LLM backend (skipped when no key is configured)
+OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='')
+
+# LLM backend routing and circuit breakers
+LLM_ROUTER_SETTINGS = {
+    'BACKENDS': ['gemini', 'openai'],  # Priority order
+    'HEDGE_AFTER': config('LLM_HEDGE_AFTER', default=0.0, cast=float),  # Seconds without a token before also asking the next backend (0 disables)
+    'SLOW_TTFT_THRESHOLD': 8.0,  # A first token slower than this counts as a failure
+    'CONSECUTIVE_FAILURES': 3,  # Open the circuit after this many failures in a row
+    'FAILURE_RATE_THRESHOLD': 0.5,  # ...or this failure ratio over the window
+    'MIN_REQUESTS': 5,
+    'WINDOW_SECONDS': 60,
+    'OPEN_SECONDS': 30,  # Time before a half-open probe is allowed
+}
 
 # Vector Store Configuration (Learning System)
 VECTOR_STORE_SETTINGS = {
@@ -274,9 +401,53 @@ VECTOR_STORE_SETTINGS = {
     'ENABLE_LEARNING': True,  # Master switch for vector database learning
     'CONTEXT_WEIGHT_DECAY': 0.9,  # Reduce importance of older conversations (exponential decay)
     'EMBEDDING_MODEL': 'sentence-transformers/all-MiniLM-L6-v2',  # HuggingFace model (384 dims)
+    'EMBEDDING_BACKEND': 'huggingface',  # 'huggingface' (sentence-transformers/PyTorch), 'onnx' (ONNX Runtime) or 'remote' (embedding server)
+    'ONNX_MODEL_DIR': None,  # Local copy of the model repo; downloaded from the Hub when unset
+    'ONNX_QUANTIZED': False,  # Use the int8-quantized weights (ONNX_QUANTIZED_MODEL_FILE)
+    'ONNX_MODEL_FILE': 'onnx/model.onnx',
+    'ONNX_QUANTIZED_MODEL_FILE': 'onnx/model_quint8_avx2.onnx',
+    'ONNX_THREADS': 2,  # Intra-op threads per embedding call
+    'EMBEDDING_BATCH_SIZE': 32,  # Texts per ONNX forward pass
+    'EMBEDDING_MAX_LENGTH': 256,  # Token truncation, as in sentence-transformers
     'CHROMA_DB_PATH': os.path.join(BASE_DIR, 'chroma_db'),  # Local ChromaDB storage path
     'COLLECTION_NAME': 'health_conversations',  # ChromaDB collection name
     'ENABLE_CONTEXT_LOGGING': True,  # Log retrieved context for debugging
+    'BACKEND': 'chroma',  # Conversation vector backend: 'chroma' or 'faiss'
+    'FAISS_PATH': os.path.join(BASE_DIR, 'faiss_db'),  # FAISS index + SQLite side table
+    'FAISS_INDEX': 'IVF',  # 'IVF' (IVFFlat) or 'HNSW' (IDMap2 over HNSWFlat)
+    'FAISS_NPROBE': 16,  # IVF lists scanned per query
+    'FAISS_HNSW_M': 32,  # HNSW graph degree
+    'FAISS_EF_SEARCH': 128,  # HNSW candidate list size per query
+    'FAISS_EXACT_LIMIT': 4096,  # Users with at most this many vectors are scored exactly
+    'FAISS_MERGE_AFTER': 50000,  # merge_vector_index rebuilds the base index once this many rows are pending
+    'FAISS_MERGE_INTERVAL': 60,  # Seconds between merge_vector_index checks
+    'FAISS_QUANTIZATION': None,  # None (float32), 'int8' (4x smaller) or 'pq' (FAISS_PQ_M bytes/vector)
+    'FAISS_PQ_M': 48,  # PQ sub-quantizers, 8 bits each
+    'FAISS_RERANK_FACTOR': 4,  # Quantized candidates per result, re-scored with float vectors
+    # manage.py rebuild_vector_store
+    'REBUILD_WORKERS': 2,  # Embedding processes (each loads its own model); 1 embeds in-process
+    'REBUILD_BATCH_SIZE': 256,  # Texts per embedding call and per upsert
+    'REBUILD_LATENCY_SAMPLES': 50,  # Queries timed before and after the rebuild
+}
+
+# Embedding server (manage.py run_embedding_server), used when VECTOR_STORE_SETTINGS['EMBEDDING_BACKEND'] is 'remote'
+EMBEDDING_SERVER_SETTINGS = {
+    'SOCKET_PATH': os.path.join(BASE_DIR, 'run', 'embeddings.sock'),
+    'MODEL_BACKEND': 'onnx',  # Model the server processes load: 'onnx' or 'huggingface'
+    'WORKERS': 2,  # Model processes
+    'MAX_BATCH': 64,  # Texts merged into one model call across requests
+    'BATCH_WAIT_MS': 5,  # How long a batch waits for more requests
+    'MAX_REQUEST_TEXTS': 256,  # Client splits larger calls
+    'TIMEOUT': 30,  # Seconds per request
+    'FALLBACK_TO_LOCAL': True,  # Load the model in the web worker if the server is down
+}
+
+# Metrics Configuration (Prometheus exposition at /metrics)
+METRICS_SETTINGS = {
+    'ENABLED': True,  # Master switch for request/LLM/vector store metrics
+    'MULTIPROCESS_DIR': os.path.join(BASE_DIR, 'metrics'),  # Per-worker snapshots merged on scrape
+    'FLUSH_INTERVAL': 5,  # Seconds between per-worker snapshot writes
+    'AUTH_TOKEN': config('METRICS_AUTH_TOKEN', default=''),  # Bearer token for scrapes; without it /metrics answers 403 unless DEBUG
 }
 
 # Security Settings (Enterprise-grade)
@@ -311,6 +482,43 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@healthassista
 DATA_RETENTION_DAYS = 365  # Keep data for 1 year
 AUDIT_LOG_RETENTION_DAYS = 730  # Keep audit logs for 2 years
 
+# Retention enforcement (health_app.services.retention, manage.py enforce_retention)
+RETENTION_SETTINGS = {
+    'CHUNK_SIZE': 5000,           # Rows per DELETE statement
+    'PRUNE_VECTORS': True,        # Remove Chroma vectors past DATA_RETENTION_DAYS
+    'VECTOR_BATCH_SIZE': 5000,    # Chroma vectors per delete call
+    'COMPACT_VECTORS': True,      # VACUUM the Chroma SQLite store afterwards
+}
+
+# Bulk anonymization/deletion engine (health_app.services.data_deletion, manage.py purge_user_data)
+DATA_DELETION_SETTINGS = {
+    'GRACE_DAYS': 30,             # Days between an account deletion request and the purge
+    'USER_BATCH_SIZE': 100,       # Users per batch; progress is saved after each batch
+    'CHUNK_SIZE': 5000,           # Rows per DELETE statement
+    'VECTOR_BATCH_SIZE': 5000,    # Chroma vectors per delete call
+    'PURGE_VECTORS': True,
+    'LEASE_SECONDS': 3600,        # Only one run at a time across processes
+}
+
+# Security Audit Log Writer (buffered, batch-inserted off the request path)
+AUDIT_LOG_SETTINGS = {
+    'BUFFERED': True,  # False writes each SecurityAuditLog row synchronously
+    'BATCH_SIZE': 100,  # Flush when this many events are pending
+    'FLUSH_INTERVAL': 2.0,  # seconds between background flushes
+    'MAX_QUEUE_SIZE': 10000,  # Beyond this, events are written synchronously
+    'SPILL_DIR': os.path.join(BASE_DIR, 'spool'),  # JSON lines replayed once the DB is back
+}
+
+# User Activity Tracking (analytics events, batch-inserted)
+ACTIVITY_LOG_SETTINGS = {
+    'BATCH_SIZE': 500,  # Flush when this many events are pending
+    'FLUSH_INTERVAL': 5.0,  # seconds between background flushes
+    'MAX_QUEUE_SIZE': 50000,  # Beyond this, events are written synchronously (or dropped)
+    'DROP_WHEN_FULL': False,  # Drop instead of writing synchronously when the buffer is full
+    'SPILL_DIR': os.path.join(BASE_DIR, 'spool'),
+    'PRUNE_CHUNK_SIZE': 5000,  # Rows per DELETE when enforcing DATA_RETENTION_DAYS
+}
+
 # API Versioning
 API_VERSION = 'v1'
 
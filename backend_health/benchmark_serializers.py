@@ -0,0 +1,157 @@
+"""
+Benchmark for the read-only list serialization fast path
+Compares ModelSerializer + JSONRenderer against .values() + ORJSONRenderer and checks the bytes match
+
+Times cover the queries plus building and rendering the body, with a fresh
+queryset per run. The fast path only saves Python time, so the speedup
+shrinks toward 1x where query latency dominates (a remote database) or
+pages are small; run with --rows/--page against the deployment's database.
+"""
+import argparse
+import os
+import platform
+import sys
+import statistics
+import time
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_health.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment
+from rest_framework.renderers import JSONRenderer
+
+from health_app.fast_serializers import (
+    chat_log_values,
+    serialize_chat_logs,
+    serialize_diagnoses,
+    serialize_symptom_logs,
+)
+from health_app.models import AIDiagnosisResponse, ChatLog, MedicalCondition, Symptom, UserSymptomLog
+from health_app.renderers import ORJSONRenderer
+from health_app.serializers import AIDiagnosisResponseSerializer, ChatLogSerializer, UserSymptomLogSerializer
+
+ROWS = 500
+REPEATS = 50
+
+
+def seed(rows=ROWS):
+    user = get_user_model().objects.create_user(email='bench@example.com', password='bench')
+    symptoms = [Symptom.objects.create(name=f"symptom-{i}") for i in range(10)]
+    condition = MedicalCondition.objects.create(name='condition', description='')
+
+    diagnoses = []
+    for i in range(rows):
+        diagnosis = AIDiagnosisResponse.objects.create(user=user, ai_notes=f"notes {i}   ünïcode")
+        diagnosis.symptoms.set(symptoms[:i % 4 + 1])
+        diagnosis.probable_conditions.set([condition])
+        diagnoses.append(diagnosis)
+        UserSymptomLog.objects.create(user=user, symptom=symptoms[i % 10], severity=i % 10 + 1)
+
+    previous = None
+    for i in range(rows):
+        chat = ChatLog.objects.create(
+            user=user,
+            message=f"message {i} with some text",
+            is_user=i % 2 == 0,
+            image='chat_images/scan.jpg' if i % 25 == 0 else None,
+            diagnosis=diagnoses[i] if i % 3 == 0 else None,
+            related_message=previous,
+        )
+        chat.symptom_references.set(symptoms[:i % 3 + 1])
+        chat.diagnosis_references.set([diagnoses[i]])
+        previous = chat
+    return user
+
+
+def measure(label, fn, repeats):
+    fn()  # Warm-up: first use pays for imports, URL resolution and statement caches
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings) * 1000
+    print(f"  {label:<28} {median:8.2f} ms  ({len(body)} bytes)")
+    return body, median
+
+
+def compare(name, rows, baseline, fast, repeats):
+    print(f"\n{name} ({rows} rows)")
+    baseline_body, baseline_ms = measure('ModelSerializer + json', baseline, repeats)
+    fast_body, fast_ms = measure('values() + orjson', fast, repeats)
+    status = 'identical' if baseline_body == fast_body else 'DIFFERENT'
+    print(f"  speedup {baseline_ms / fast_ms:.1f}x, output {status}")
+    return baseline_body == fast_body
+
+
+def describe_environment():
+    import orjson
+    import rest_framework
+    print(
+        f"Python {platform.python_version()}, Django {django.get_version()}, DRF {rest_framework.VERSION}, "
+        f"orjson {orjson.__version__}, {connection.vendor} {connection.Database.__name__}, DEBUG={settings.DEBUG}"
+    )
+
+
+def chat_history(chats, request):
+    return (
+        lambda: JSONRenderer().render(
+            ChatLogSerializer(ChatLogSerializer.prefetch(chats), many=True, context={'request': request}).data
+        ),
+        lambda: ORJSONRenderer().render(serialize_chat_logs(chat_log_values(chats), request)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=ROWS, help="Rows seeded per model and serialized per list")
+    parser.add_argument('--page', type=int, default=settings.REST_FRAMEWORK.get('PAGE_SIZE', 50),
+                        help="Chat history page size also timed (default PAGE_SIZE)")
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        describe_environment()
+        user = seed(args.rows)
+        request = RequestFactory().get('/chat/history/', secure=True)
+        request.user = user
+
+        chats = ChatLog.objects.filter(user=user).order_by('timestamp', 'id')
+        page = ChatLog.objects.filter(user=user).order_by('-timestamp', '-id')[:args.page]
+        symptom_logs = UserSymptomLog.objects.filter(user=user)
+        diagnoses = AIDiagnosisResponse.objects.filter(user=user)
+
+        results = [
+            compare('Chat history', args.rows, *chat_history(chats, request), args.repeats),
+            compare('Chat history page', min(args.page, args.rows), *chat_history(page, request), args.repeats),
+            compare(
+                'Symptom logs', args.rows,
+                # .all() per run: a reused queryset would serve the baseline from its result cache
+                lambda: JSONRenderer().render(UserSymptomLogSerializer(symptom_logs.all(), many=True).data),
+                lambda: ORJSONRenderer().render(serialize_symptom_logs(symptom_logs.all())),
+                args.repeats,
+            ),
+            compare(
+                'Diagnoses', args.rows,
+                lambda: JSONRenderer().render(AIDiagnosisResponseSerializer(diagnoses.all(), many=True).data),
+                lambda: ORJSONRenderer().render(serialize_diagnoses(diagnoses.all())),
+                args.repeats,
+            ),
+        ]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
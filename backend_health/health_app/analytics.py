@@ -0,0 +1,88 @@
+"""
+User activity tracking for analytics
+Cheap track() calls backed by a batched UserActivityLog writer
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def track(user, activity_type, details=None, session_id=''):
+    """
+    Record a user activity event
+
+    The row is appended to an in-memory buffer and inserted in batches,
+    so views can call this on every request without an extra write.
+    """
+    if user is None or not user.is_authenticated:
+        return
+    get_activity_writer().submit(
+        user_id=user.id,
+        activity_type=activity_type,
+        activity_details=details or {},
+        session_id=session_id or '',
+        timestamp=timezone.now(),
+    )
+
+
+def prune_activity_logs(retention_days=None, chunk_size=None):
+    """
+    Delete activity rows older than the retention period in bounded chunks
+
+    Args:
+        retention_days: Days to keep (defaults to DATA_RETENTION_DAYS)
+        chunk_size: Rows deleted per statement
+
+    Returns:
+        Dict with rows removed and time spent
+    """
+    from .models import UserActivityLog
+
+    config = getattr(settings, 'ACTIVITY_LOG_SETTINGS', {})
+    retention_days = retention_days or settings.DATA_RETENTION_DAYS
+    chunk_size = chunk_size or config.get('PRUNE_CHUNK_SIZE', 5000)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    started = time.monotonic()
+    removed = 0
+    while True:
+        pks = list(
+            UserActivityLog.objects.filter(timestamp__lt=cutoff)
+            .order_by()
+            .values_list('pk', flat=True)[:chunk_size]
+        )
+        if not pks:
+            break
+        removed += UserActivityLog.objects.filter(pk__in=pks).delete()[0]
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Pruned {removed} activity log rows older than {retention_days} days in {elapsed:.2f}s")
+    return {'removed': removed, 'seconds': round(elapsed, 2), 'cutoff': cutoff.isoformat()}
+
+
+_activity_writer = None
+
+
+def get_activity_writer():
+    """Get or create the activity log writer singleton"""
+    global _activity_writer
+    if _activity_writer is None:
+        from .models import UserActivityLog
+        from .services.buffered_writer import BufferedModelWriter
+
+        config = getattr(settings, 'ACTIVITY_LOG_SETTINGS', {})
+        _activity_writer = BufferedModelWriter(
+            UserActivityLog,
+            name='user_activity',
+            batch_size=config.get('BATCH_SIZE', 500),
+            flush_interval=config.get('FLUSH_INTERVAL', 5.0),
+            max_queue_size=config.get('MAX_QUEUE_SIZE', 50000),
+            spill_dir=config.get('SPILL_DIR'),
+            drop_when_full=config.get('DROP_WHEN_FULL', False),
+        )
+    return _activity_writer
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class HealthAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "health_app"
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
+
+        observability = getattr(settings, 'OBSERVABILITY_SETTINGS', {})
+        if observability.get('ASYNC_LOGGING'):
+            from .log_queue import install_queue_logging
+            install_queue_logging(observability.get('QUEUED_LOGGERS', []))
@@ -0,0 +1,110 @@
+"""
+Conditional GET support for read endpoints
+ETags come from cheap validators, so a 304 costs no serialization and little or no DB work
+"""
+import functools
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .health_records import get_chat_version, get_record_version
+from .metrics import CONDITIONAL_REQUESTS, get_route, metrics_enabled
+from .models import UserProfile
+
+
+def make_etag(request, validator):
+    """
+    Strong ETag for a validator value
+
+    The user, full path (query string included), host and negotiated media
+    type are mixed in, so different pages or representations never share
+    an ETag even when the validator is coarse.
+    """
+    raw = '|'.join((
+        str(request.user.pk),
+        request.get_full_path(),
+        request.build_absolute_uri('/'),
+        getattr(request, 'accepted_media_type', '') or '',
+        str(validator),
+    ))
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    """If-None-Match check using weak comparison (RFC 9110 13.1.2)"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    if candidates == ['*']:
+        return True
+    stripped = etag.removeprefix('W/')
+    return any(candidate.removeprefix('W/') == stripped for candidate in candidates)
+
+
+def conditional_get(validator):
+    """
+    Answer GET/HEAD with 304 Not Modified when If-None-Match matches
+
+    validator(request, *args, **kwargs) must return a value that changes
+    whenever the response body would. It runs after authentication and
+    permission checks; the view only runs when the client's copy is stale.
+    Works on function views (below @api_view) and, through
+    method_decorator, on APIView/ViewSet handlers.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            etag = make_etag(request, validator(request, *args, **kwargs))
+            not_modified = etag_matches(request, etag)
+            if metrics_enabled():
+                CONDITIONAL_REQUESTS.inc(
+                    route=get_route(request), result='not_modified' if not_modified else 'modified'
+                )
+
+            if not_modified:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+# ──────── Validators ────────
+
+def chat_history_validator(request, *args, **kwargs):
+    """
+    The per-user chat version token, replaced by signals on any change
+
+    Edits and reference changes leave timestamps and counts alone, so
+    those can't serve as the validator. The session filter is part of
+    the full path mixed into the ETag.
+    """
+    return get_chat_version(request.user.pk)
+
+
+def profile_validator(request, *args, **kwargs):
+    """The profile's version counter, bumped on every save"""
+    return list(UserProfile.objects.filter(user=request.user).values_list('id', 'version'))
+
+
+def health_record_validator(request, *args, **kwargs):
+    """The per-user record version token, replaced by signals on any change"""
+    return get_record_version(request.user.pk)
+
+
+def research_categories_validator(request, *args, **kwargs):
+    """Categories come from a static paper list, so they only change on deploy"""
+    from .services.medical_knowledge_base import MedicalKnowledgeBase
+    return ','.join(MedicalKnowledgeBase.get_available_categories())
@@ -20,6 +20,11 @@ def custom_exception_handler(exc, context):
     # Call REST framework's default exception handler first
     response = exception_handler(exc, context)
     
+    # Throttled or failed requests never stream, so free any stream slot they took
+    if context.get('request') is not None:
+        from .throttling import release_stream_slot
+        release_stream_slot(context['request'])
+    
     # Generate unique error ID for tracking
     error_id = str(uuid.uuid4())
     
@@ -33,6 +38,23 @@ def custom_exception_handler(exc, context):
         exc_info=True
     )
     
+    # Project exceptions carry their own status and error code
+    if response is None and isinstance(exc, APIException):
+        response = Response(
+            {
+                'error': {
+                    'code': exc.code,
+                    'message': exc.message,
+                    'error_id': error_id,
+                }
+            },
+            status=exc.status_code
+        )
+        retry_after = getattr(exc, 'retry_after', None)
+        if retry_after:
+            response['Retry-After'] = str(int(retry_after))
+        return response
+    
     # If the exception was not handled by DRF
     if response is None:
         # Handle unexpected exceptions
@@ -145,3 +167,19 @@ class ServiceUnavailableException(APIException):
     default_code = 'SERVICE_UNAVAILABLE'
     default_message = 'The requested service is temporarily unavailable.'
     status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+class LLMCapacityExceeded(ServiceUnavailableException):
+    """Raised when the LLM admission controller is saturated"""
+    default_code = 'LLM_CAPACITY_EXCEEDED'
+    default_message = 'The assistant is handling too many requests right now. Please try again shortly.'
+    
+    def __init__(self, message=None, code=None, status_code=None, retry_after=None):
+        super().__init__(message, code, status_code)
+        self.retry_after = retry_after
+
+
+class LLMBackendUnavailable(ServiceUnavailableException):
+    """Raised when no LLM backend could produce a response"""
+    default_code = 'LLM_UNAVAILABLE'
+    default_message = 'The assistant is temporarily unavailable. Please try again shortly.'
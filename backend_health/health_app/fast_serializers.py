@@ -0,0 +1,101 @@
+"""
+Read-only list serialization straight from .values() rows
+Builds the same JSON shape as the ModelSerializers without instantiating models or fields per row
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .models import AIDiagnosisResponse, ChatLog
+
+# Formatting is delegated to DRF's own field so output matches the serializers exactly
+_datetime_field = serializers.DateTimeField()
+
+CHAT_LOG_COLUMNS = (
+    'id', 'message', 'is_user', 'timestamp', 'image', 'related_message_id', 'diagnosis_id',
+)
+
+
+def format_datetime(value):
+    return _datetime_field.to_representation(value) if value is not None else None
+
+
+def m2m_ids(model, field_name, pks):
+    """
+    Map each pk to the ids on the other side of a many-to-many field
+    One values_list query on the through table, no join
+    """
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = f"{field.m2m_field_name()}_id"
+    target = f"{field.m2m_reverse_field_name()}_id"
+
+    ids = defaultdict(list)
+    if pks:
+        rows = through.objects.filter(**{f"{source}__in": pks}).order_by('pk').values_list(source, target)
+        for pk, related_id in rows:
+            ids[pk].append(related_id)
+    return ids
+
+
+def chat_log_values(queryset):
+    """Narrow a ChatLog queryset to the columns serialize_chat_logs needs"""
+    return queryset.prefetch_related(None).values(*CHAT_LOG_COLUMNS)
+
+
+def serialize_chat_logs(rows, request):
+    """Same output as ChatLogSerializer(many=True) for chat_log_values() rows"""
+    rows = list(rows)
+    pks = [row['id'] for row in rows]
+    symptom_ids = m2m_ids(ChatLog, 'symptom_references', pks)
+    diagnosis_ids = m2m_ids(ChatLog, 'diagnosis_references', pks)
+    storage = ChatLog._meta.get_field('image').storage
+
+    return [
+        {
+            'id': row['id'],
+            'message': row['message'],
+            'is_user': row['is_user'],
+            'timestamp': format_datetime(row['timestamp']),
+            'image_url': request.build_absolute_uri(storage.url(row['image'])) if row['image'] else None,
+            'symptom_references': symptom_ids.get(row['id'], []),
+            'diagnosis_references': diagnosis_ids.get(row['id'], []),
+            'related_message_id': row['related_message_id'],
+            'diagnosis_id': row['diagnosis_id'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_symptom_logs(queryset):
+    """Same output as UserSymptomLogSerializer(many=True)"""
+    rows = queryset.values('id', 'severity', 'noted_at', 'user_id', 'symptom_id')
+    return [
+        {
+            'id': row['id'],
+            'severity': row['severity'],
+            'noted_at': format_datetime(row['noted_at']),
+            'user': row['user_id'],
+            'symptom': row['symptom_id'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_diagnoses(queryset):
+    """Same output as AIDiagnosisResponseSerializer(many=True)"""
+    rows = list(queryset.values('id', 'ai_notes', 'created_at', 'user_id'))
+    pks = [row['id'] for row in rows]
+    symptom_ids = m2m_ids(AIDiagnosisResponse, 'symptoms', pks)
+    condition_ids = m2m_ids(AIDiagnosisResponse, 'probable_conditions', pks)
+    return [
+        {
+            'id': row['id'],
+            'ai_notes': row['ai_notes'],
+            'created_at': format_datetime(row['created_at']),
+            'user': row['user_id'],
+            'symptoms': symptom_ids.get(row['id'], []),
+            'probable_conditions': condition_ids.get(row['id'], []),
+        }
+        for row in rows
+    ]
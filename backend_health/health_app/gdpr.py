@@ -2,16 +2,73 @@
 GDPR Compliance utilities for data export and deletion
 Enterprise-grade data privacy features
 """
-import json
+import functools
+import itertools
+import zlib
 from datetime import datetime
-from django.http import HttpResponse
+from xml.sax.saxutils import escape
+
+import orjson
+import zstandard
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.core import serializers
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import Frame, PageTemplate, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from io.core.files.base import ContentFile
+from django.core.files.base import ContentFile
+
+# Content type and file extension per export compression
+EXPORT_CONTENT_TYPES = {
+    None: ('application/json', ''),
+    'gzip': ('application/gzip', '.gz'),
+    'zstd': ('application/zstd', '.zst'),
+}
+
+
+def _export_settings():
+    return getattr(settings, 'GDPR_EXPORT_SETTINGS', {})
+
+
+def _dumps(value):
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def compress_chunks(chunks, compression=None, level=None):
+    """
+    Compress a stream of byte chunks on the fly
+    Output is buffered up to BUFFER_SIZE so small rows don't become tiny writes
+    """
+    if compression not in EXPORT_CONTENT_TYPES:
+        raise ValueError(f"Unsupported export compression: {compression}")
+    
+    buffer_size = _export_settings().get('BUFFER_SIZE', 64 * 1024)
+    if compression == 'gzip':
+        compressor = zlib.compressobj(level or 6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    elif compression == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=level or 3).compressobj()
+    else:
+        compressor = None
+    
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            pending.append(chunk)
+            pending_size += len(chunk)
+        if pending_size >= buffer_size:
+            yield b''.join(pending)
+            pending = []
+            pending_size = 0
+    
+    if compressor is not None:
+        pending.append(compressor.flush())
+    if pending:
+        yield b''.join(pending)
 
 
 class DataExporter:
@@ -19,108 +76,146 @@ class DataExporter:
     Export user data in GDPR-compliant formats (JSON, PDF)
     """
     
+    # (key, model, columns, ordering) for each per-user table in the export
+    JSON_SECTIONS = (
+        ('chat_history', 'ChatLog', ('message', 'is_user', 'timestamp', 'image'), ('timestamp', 'id')),
+        ('symptom_logs', 'UserSymptomLog', ('symptom__name', 'severity', 'noted_at'), ('noted_at', 'id')),
+        ('diagnoses', 'AIDiagnosisResponse', ('ai_notes', 'created_at'), ('created_at', 'id')),
+        ('security_audit', 'SecurityAuditLog',
+         ('event_type', 'success', 'timestamp', 'ip_address'), ('timestamp', 'id')),
+        ('activity_logs', 'UserActivityLog', ('activity_type', 'activity_details', 'timestamp'), ('timestamp', 'id')),
+    )
+    
     @staticmethod
-    def export_user_data_json(user):
-        """Export all user data as JSON"""
-        from .models import (
-            UserProfile, ChatLog, UserSymptomLog, 
-            AIDiagnosisResponse, SecurityAuditLog, UserActivityLog
-        )
+    def iter_user_data_json(user, chunk_size=None, progress=None):
+        """
+        Yield the JSON export as byte chunks
+        Tables are walked with .iterator(chunk_size) and each row is encoded
+        on its own, so memory stays flat however long the history is.
+        progress(rows_written), if given, is called after every chunk_size rows.
+        """
+        from django.apps import apps
+        from .models import UserProfile
         
-        data = {
-            'export_date': datetime.now().isoformat(),
-            'user_information': {
-                'email': user.email,
-                'full_name': user.full_name,
-                'date_joined': user.date_joined.isoformat(),
-                'last_login': user.last_login.isoformat() if user.last_login else None,
-            }
-        }
+        chunk_size = chunk_size or _export_settings().get('CHUNK_SIZE', 2000)
         
-        # User profile
-        try:
-            profile = UserProfile.objects.get(user=user)
-            data['profile'] = {
-                'age': profile.age,
-                'gender': profile.gender,
-                'height_cm': profile.height_cm,
-                'weight_kg': profile.weight_kg,
-                'blood_group': profile.blood_group,
-                'allergies': profile.allergies,
-            }
-        except UserProfile.DoesNotExist:
-            data['profile'] = None
+        yield b'{\n  "export_date": ' + _dumps(datetime.now().isoformat())
+        yield b',\n  "user_information": ' + _dumps({
+            'email': user.email,
+            'full_name': user.full_name,
+            'date_joined': user.date_joined.isoformat(),
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+        })
         
-        # Chat history
-        chats = ChatLog.objects.filter(user=user).values(
-            'message', 'is_user', 'timestamp', 'image'
-        )
-        data['chat_history'] = list(chats)
+        profile = UserProfile.objects.filter(user=user).values(
+            'age', 'gender', 'height_cm', 'weight_kg', 'blood_group', 'allergies'
+        ).first()
+        yield b',\n  "profile": ' + _dumps(profile)
         
-        # Symptom logs
-        symptoms = UserSymptomLog.objects.filter(user=user).values(
-            'symptom__name', 'severity', 'noted_at'
-        )
-        data['symptom_logs'] = list(symptoms)
+        written = 0
+        for key, model_name, columns, ordering in DataExporter.JSON_SECTIONS:
+            model = apps.get_model('health_app', model_name)
+            rows = model.objects.filter(user=user).order_by(*ordering).values(*columns)
+            
+            yield b',\n  ' + _dumps(key) + b': ['
+            separator = b'\n    '
+            for row in rows.iterator(chunk_size=chunk_size):
+                yield separator + _dumps(row)
+                separator = b',\n    '
+                written += 1
+                if progress is not None and written % chunk_size == 0:
+                    progress(written)
+            yield b']' if separator == b'\n    ' else b'\n  ]'
         
-        # AI diagnoses
-        diagnoses = AIDiagnosisResponse.objects.filter(user=user).values(
-            'ai_notes', 'created_at'
-        )
-        data['diagnoses'] = list(diagnoses)
+        if progress is not None:
+            progress(written)
         
-        # Security audit logs
-        audit_logs = SecurityAuditLog.objects.filter(user=user).values(
-            'event_type', 'success', 'timestamp', 'ip_address'
-        )
-        data['security_audit'] = list(audit_logs)
+        yield b'\n}\n'
+    
+    @staticmethod
+    def export_user_data_json(user):
+        """Export all user data as a JSON string (builds it in memory; prefer the streaming helpers)"""
+        return b''.join(DataExporter.iter_user_data_json(user)).decode()
+    
+    @staticmethod
+    def count_user_rows(user):
+        """Rows iter_user_data_json will write, for progress reporting"""
+        from django.apps import apps
         
-        # Activity logs
-        activities = UserActivityLog.objects.filter(user=user).values(
-            'activity_type', 'activity_details', 'timestamp'
+        return sum(
+            apps.get_model('health_app', model_name).objects.filter(user=user).count()
+            for _key, model_name, _columns, _ordering in DataExporter.JSON_SECTIONS
         )
-        data['activity_logs'] = list(activities)
-        
-        return json.dumps(data, indent=2, default=str)
+    
+    @staticmethod
+    def write_user_data_json(user, fileobj, compression=None, progress=None):
+        """Stream the JSON export into a binary file object, optionally gzip/zstd compressed"""
+        chunks = DataExporter.iter_user_data_json(user, progress=progress)
+        for chunk in compress_chunks(chunks, compression):
+            fileobj.write(chunk)
+    
+    @staticmethod
+    def streaming_json_response(user, compression=None):
+        """Download response that encodes and compresses the export as it is sent"""
+        content_type, extension = EXPORT_CONTENT_TYPES[compression]
+        response = StreamingHttpResponse(
+            compress_chunks(DataExporter.iter_user_data_json(user), compression),
+            content_type=content_type,
+        )
+        filename = f"health-data-{datetime.now().strftime('%Y%m%d')}.json{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
     
     @staticmethod
     def export_user_data_pdf(user):
-        """Export user data as PDF"""
-        from .models import UserProfile, ChatLog, UserSymptomLog
-        
-        # Create PDF buffer
+        """Export user data as PDF bytes (builds it in memory; prefer write_user_data_pdf)"""
         from io import BytesIO
-        buffer = BytesIO()
         
-        # Create PDF document
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
+        buffer = BytesIO()
+        DataExporter.write_user_data_pdf(user, buffer)
+        return buffer.getvalue()
+    
+    @staticmethod
+    def count_user_pdf_rows(user):
+        """Rows write_user_data_pdf will render, for progress reporting"""
+        from .models import AIDiagnosisResponse, ChatLog, UserSymptomLog
         
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#128C7E'),
-            spaceAfter=30,
+        return sum(
+            model.objects.filter(user=user).count()
+            for model in (UserSymptomLog, AIDiagnosisResponse, ChatLog)
         )
-        title = Paragraph("Health Assistant - Personal Data Export", title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 0.2 * inch))
-        
-        # Export info
-        info_text = f"""
-        <b>Export Date:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>
-        <b>User:</b> {user.full_name}<br/>
-        <b>Email:</b> {user.email}<br/>
+    
+    @staticmethod
+    def write_user_data_pdf(user, fileobj, progress=None):
+        """
+        Render the full PDF export into a file name or binary file object
+        Rows are read with .iterator() and laid out one chunk at a time, so
+        only the current chunk's flowables are ever held in memory.
+        progress(rows_rendered), if given, is called after every chunk.
         """
-        elements.append(Paragraph(info_text, styles['Normal']))
-        elements.append(Spacer(1, 0.3 * inch))
+        from .models import AIDiagnosisResponse, ChatLog, UserProfile, UserSymptomLog
+        
+        chunk_size = _export_settings().get('CHUNK_SIZE', 2000)
+        styles = _pdf_styles()
+        doc = ChunkedDocTemplate(fileobj, pagesize=letter, pageCompression=1)
+        doc.begin()
+        
+        doc.add([
+            Paragraph("Health Assistant - Personal Data Export", styles['title']),
+            Spacer(1, 0.2 * inch),
+            Paragraph(
+                f"<b>Export Date:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>"
+                f"<b>User:</b> {escape(user.full_name or '')}<br/>"
+                f"<b>Email:</b> {escape(user.email)}<br/>",
+                styles['body']
+            ),
+            Spacer(1, 0.3 * inch),
+        ])
         
         # User Profile
-        try:
-            profile = UserProfile.objects.get(user=user)
+        profile = UserProfile.objects.filter(user=user).first()
+        if profile is not None:
             profile_data = [
                 ['Profile Information', ''],
                 ['Age', str(profile.age)],
@@ -128,42 +223,149 @@ class DataExporter:
                 ['Height (cm)', str(profile.height_cm) if profile.height_cm else 'N/A'],
                 ['Weight (kg)', str(profile.weight_kg) if profile.weight_kg else 'N/A'],
                 ['Blood Group', profile.blood_group or 'N/A'],
-                ['Allergies', profile.allergies or 'None'],
+                ['Allergies', Paragraph(escape(profile.allergies or 'None'), styles['cell'])],
             ]
-            
             profile_table = Table(profile_data, colWidths=[3 * inch, 3 * inch])
-            profile_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#128C7E')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ]))
-            elements.append(profile_table)
-            elements.append(Spacer(1, 0.3 * inch))
-        except UserProfile.DoesNotExist:
-            pass
+            profile_table.setStyle(PROFILE_TABLE_STYLE)
+            doc.add([profile_table, Spacer(1, 0.3 * inch)])
         
-        # Chat History Summary
-        chat_count = ChatLog.objects.filter(user=user).count()
-        elements.append(Paragraph(f"<b>Chat History:</b> {chat_count} messages", styles['Heading2']))
-        elements.append(Spacer(1, 0.2 * inch))
+        rendered = 0
         
-        # Symptom Logs Summary
-        symptom_count = UserSymptomLog.objects.filter(user=user).count()
-        elements.append(Paragraph(f"<b>Symptom Logs:</b> {symptom_count} entries", styles['Heading2']))
+        def report(rows):
+            nonlocal rendered
+            rendered += rows
+            if progress is not None:
+                progress(rendered)
         
-        # Build PDF
-        doc.build(elements)
+        # Symptom Logs
+        symptom_logs = UserSymptomLog.objects.filter(user=user).order_by('noted_at', 'id').values_list(
+            'noted_at', 'symptom__name', 'severity'
+        )
+        doc.add([Paragraph(f"Symptom Logs ({symptom_logs.count()} entries)", styles['heading'])])
+        for chunk in _chunks(symptom_logs.iterator(chunk_size=chunk_size), chunk_size):
+            rows = [['Date', 'Symptom', 'Severity']]
+            rows.extend(
+                [noted_at.strftime('%Y-%m-%d %H:%M'), Paragraph(escape(name), styles['cell']), str(severity)]
+                for noted_at, name, severity in chunk
+            )
+            table = Table(rows, colWidths=[1.8 * inch, 3.4 * inch, 1 * inch], repeatRows=1)
+            table.setStyle(LOG_TABLE_STYLE)
+            doc.add([table])
+            report(len(chunk))
+        doc.add([Spacer(1, 0.3 * inch)])
         
-        # Get PDF value
-        pdf_value = buffer.getvalue()
-        buffer.close()
+        # AI Diagnoses
+        diagnoses = AIDiagnosisResponse.objects.filter(user=user).order_by('created_at', 'id').values_list(
+            'created_at', 'ai_notes'
+        )
+        doc.add([Paragraph(f"AI Diagnoses ({diagnoses.count()} entries)", styles['heading'])])
+        for chunk in _chunks(diagnoses.iterator(chunk_size=chunk_size), chunk_size):
+            flowables = []
+            for created_at, notes in chunk:
+                flowables.append(Paragraph(created_at.strftime('%Y-%m-%d %H:%M'), styles['meta']))
+                flowables.append(Paragraph(_pdf_text(notes), styles['body']))
+            doc.add(flowables)
+            report(len(chunk))
+        doc.add([Spacer(1, 0.3 * inch)])
+        
+        # Chat History
+        chats = ChatLog.objects.filter(user=user).order_by('timestamp', 'id').values_list(
+            'timestamp', 'is_user', 'message'
+        )
+        doc.add([Paragraph(f"Chat History ({chats.count()} messages)", styles['heading'])])
+        for chunk in _chunks(chats.iterator(chunk_size=chunk_size), chunk_size):
+            flowables = []
+            for timestamp, is_user, message in chunk:
+                speaker = 'You' if is_user else 'Assistant'
+                header = f"<b>{speaker}</b> - {timestamp.strftime('%Y-%m-%d %H:%M')}"
+                flowables.append(Paragraph(header, styles['meta']))
+                flowables.append(Paragraph(_pdf_text(message), styles['body']))
+            doc.add(flowables)
+            report(len(chunk))
         
-        return pdf_value
+        doc.finish()
+
+
+class ChunkedDocTemplate(SimpleDocTemplate):
+    """
+    SimpleDocTemplate that is fed flowables in batches instead of one story list
+    begin(), add(flowables) as many times as needed, then finish(); pages are
+    laid out as each batch arrives and the batch is released afterwards
+    """
+    
+    def begin(self):
+        # Same page templates SimpleDocTemplate.build sets up
+        self._calc()
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        self.addPageTemplates([
+            PageTemplate(id='First', frames=frame, pagesize=self.pagesize),
+            PageTemplate(id='Later', frames=frame, pagesize=self.pagesize),
+        ])
+        self._startBuild()
+        self._savedInfo = self.canv._doc.info
+        self.canv._doctemplate = self
+    
+    def add(self, flowables):
+        flowables = list(flowables)
+        while flowables:
+            self.clean_hanging()
+            self.handle_flowable(flowables)
+    
+    def finish(self):
+        del self.canv._doctemplate
+        self.canv._doc.info = self._savedInfo
+        self._endBuild()
+
+
+PROFILE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#128C7E')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+LOG_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#128C7E')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+])
+
+
+@functools.lru_cache(maxsize=1)
+def _pdf_styles():
+    """Paragraph styles shared by every PDF export (built once per process)"""
+    sample = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=sample['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#128C7E'),
+            spaceAfter=30,
+        ),
+        'heading': sample['Heading2'],
+        'body': ParagraphStyle('ExportBody', parent=sample['Normal'], spaceAfter=8),
+        'meta': ParagraphStyle('ExportMeta', parent=sample['Normal'], fontSize=8, textColor=colors.grey),
+        'cell': ParagraphStyle('ExportCell', parent=sample['Normal'], fontSize=9, leading=11),
+    }
+
+
+def _pdf_text(text):
+    """Escape free text for a Paragraph, keeping its line breaks"""
+    return escape(text or '').replace('\n', '<br/>')
+
+
+def _chunks(rows, size):
+    """Group an iterator into lists of at most size items"""
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
 
 
 class DataDeletionManager:
@@ -198,25 +400,12 @@ class DataDeletionManager:
     def anonymize_user_data(user):
         """
         Anonymize user data instead of full deletion
-        Retains data for analytics but removes PII
+        Retains data for analytics but removes PII, stored files and vectors
         """
-        from .models import UserProfile, ChatLog, SecurityAuditLog
+        from .services.data_deletion import process_users
         
-        # Anonymize user profile
-        user.email = f"deleted_user_{user.id}@anonymized.com"
-        user.full_name = f"Deleted User {user.id}"
-        user.save()
-        
-        # Anonymize profile
-        try:
-            profile = UserProfile.objects.get(user=user)
-            profile.allergies = "ANONYMIZED"
-            profile.save()
-        except UserProfile.DoesNotExist:
-            pass
-        
-        # Remove images from chat logs
-        ChatLog.objects.filter(user=user, image__isnull=False).update(image=None)
+        process_users('ANONYMIZE', [user.pk])
+        user.refresh_from_db()
         
         return {
             'status': 'anonymized',
@@ -232,12 +421,12 @@ class PrivacyPolicyManager:
     @staticmethod
     def record_policy_acceptance(user, policy_version, ip_address):
         """Record user acceptance of privacy policy"""
-        from .models import UserActivityLog
+        from .analytics import track
         
-        UserActivityLog.objects.create(
-            user=user,
-            activity_type='PRIVACY_POLICY_ACCEPTED',
-            activity_details={
+        track(
+            user,
+            'PRIVACY_POLICY_ACCEPTED',
+            {
                 'policy_version': policy_version,
                 'ip_address': ip_address,
                 'timestamp': datetime.now().isoformat()
@@ -0,0 +1,137 @@
+"""
+Composed dashboard health record
+Bounded, cursor-paginated sections cached per user under a version token
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import NotFound
+
+from .fast_serializers import chat_log_values, serialize_chat_logs, serialize_diagnoses, serialize_symptom_logs
+from .metrics import record_cache_lookup
+from .models import AIDiagnosisResponse, ChatLog, UserProfile, UserSymptomLog
+from .pagination import decode_keyset_cursor, encode_keyset_cursor, keyset_filter
+from .serializers import UserProfileSerializer
+
+# (name, model, timestamp field, serializer for a sliced queryset)
+SECTIONS = (
+    ('symptoms', UserSymptomLog, 'noted_at', lambda queryset, request: serialize_symptom_logs(queryset)),
+    ('diagnoses', AIDiagnosisResponse, 'created_at', lambda queryset, request: serialize_diagnoses(queryset)),
+    ('chat_history', ChatLog, 'timestamp',
+     lambda queryset, request: serialize_chat_logs(chat_log_values(queryset), request)),
+)
+
+
+def _settings():
+    return getattr(settings, 'HEALTH_RECORD_SETTINGS', {})
+
+
+def _cache():
+    return caches[_settings().get('CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f"health_record_version:{user_id}"
+
+
+def _chat_version_key(user_id):
+    return f"chat_history_version:{user_id}"
+
+
+def _get_version(key):
+    """
+    Current version token under key
+
+    Tokens are random rather than counters, so a token lost to eviction
+    can never come back and revalidate an ETag for older data.
+    """
+    cache = _cache()
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key) or version
+    return version
+
+
+def get_record_version(user_id):
+    """Current version token for a user's record"""
+    return _get_version(_version_key(user_id))
+
+
+def get_chat_version(user_id):
+    """Current version token for a user's chat history, replaced on any ChatLog change"""
+    return _get_version(_chat_version_key(user_id))
+
+
+def invalidate_health_record(user_id):
+    """Move the user to a new version; cached records and ETags for the old one stop matching"""
+    _cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_chat_history(user_id):
+    """Move the user's chat history to a new version, so /chat/history/ ETags stop matching"""
+    _cache().set(_chat_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def get_section_params(request):
+    """
+    Per-section (limit, cursor) from ?<section>_limit= and ?<section>_before=
+    Invalid cursors raise NotFound, as in KeysetPagination
+    """
+    config = _settings()
+    limits = config.get('SECTION_LIMITS', {})
+    max_limit = config.get('MAX_SECTION_LIMIT', 200)
+
+    params = []
+    for name, _model, _field, _serialize in SECTIONS:
+        default = limits.get(name, 20)
+        try:
+            limit = int(request.query_params.get(f'{name}_limit', default))
+        except (TypeError, ValueError):
+            limit = default
+        before = request.query_params.get(f'{name}_before') or None
+        if before is not None:
+            try:
+                decode_keyset_cursor(before)
+            except ValueError:
+                raise NotFound(f'Invalid {name} cursor')
+        params.append((name, max(1, min(limit, max_limit)), before))
+    return tuple(params)
+
+
+def build_health_record(request, params):
+    """Profile plus each section's page, newest first, with a cursor for the next older page"""
+    user = request.user
+    record = {'profile': UserProfileSerializer(UserProfile.objects.get(user=user)).data}
+    cursors = {}
+
+    for (name, model, field, serialize), (_name, limit, before) in zip(SECTIONS, params):
+        queryset = model.objects.filter(user=user)
+        if before is not None:
+            queryset = queryset.filter(keyset_filter(field, decode_keyset_cursor(before), 'lt'))
+        rows = serialize(queryset.order_by(f'-{field}', '-id')[:limit + 1], request)
+
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        record[name] = rows
+        cursors[name] = encode_keyset_cursor(rows[-1][field], rows[-1]['id']) if has_older else None
+
+    record['cursors'] = cursors
+    return record
+
+
+def get_health_record(request, version, params):
+    """Cached record for this version and page, built on a miss"""
+    cache = _cache()
+    raw = f"{request.user.pk}|{version}|{request.build_absolute_uri('/')}|{params}"
+    key = 'health_record:' + hashlib.sha1(raw.encode()).hexdigest()
+    record = cache.get(key)
+    record_cache_lookup('health_records', record is not None)
+
+    if record is None:
+        record = build_health_record(request, params)
+        cache.set(key, record, timeout=_settings().get('CACHE_TIMEOUT', 300))
+    return record
@@ -0,0 +1,71 @@
+"""
+Non-blocking logging via QueueHandler/QueueListener
+Moves console and RotatingFileHandler I/O off the request threads
+"""
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listeners = []
+
+
+class _QueuedLogger:
+    """Queue and listener thread replacing one logger's handlers"""
+
+    def __init__(self, logger, handlers):
+        self.queue = queue.SimpleQueue()
+        self.handlers = handlers
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        logger.handlers = [QueueHandler(self.queue)]
+
+    def start(self):
+        self.listener.start()
+
+    def restart(self):
+        """Start a fresh listener thread in a forked worker"""
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        try:
+            self.listener.stop()
+        except AttributeError:
+            # Listener thread was never started in this process
+            pass
+
+
+def install_queue_logging(logger_names):
+    """
+    Route the configured loggers' handlers through background listener threads
+
+    The original handlers (console, RotatingFileHandler, ...) keep their levels
+    and formatters; request threads only enqueue records.
+    """
+    if _listeners:
+        return
+
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+        if not handlers:
+            continue
+        queued = _QueuedLogger(logger, handlers)
+        queued.start()
+        _listeners.append(queued)
+
+    atexit.register(stop_queue_logging)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listeners)
+
+
+def stop_queue_logging():
+    """Drain queued records to their handlers"""
+    for queued in _listeners:
+        queued.stop()
+
+
+def _restart_listeners():
+    for queued in _listeners:
+        queued.restart()
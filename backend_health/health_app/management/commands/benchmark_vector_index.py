@@ -0,0 +1,49 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from health_app.services.vector_benchmark import benchmark, store_vectors, synthetic_vectors
+
+
+class Command(BaseCommand):
+    help = "Recall@k, latency and size of float, int8 and PQ FAISS index modes against exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=100000, help="Vectors to index")
+        parser.add_argument('--queries', type=int, default=200, help="Queries to score")
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--dim', type=int, default=384, help="Dimensions of synthetic vectors")
+        parser.add_argument('--index', choices=['IVF', 'HNSW'], default='IVF')
+        parser.add_argument('--rerank-factor', type=int, default=4, help="Candidates per result before re-ranking")
+        parser.add_argument('--nprobe', type=int, default=16)
+        parser.add_argument('--from-store', action='store_true',
+                            help="Use vectors from the FAISS store's side table instead of synthetic ones")
+
+    def handle(self, *args, **options):
+        vectors = None
+        if options['from_store']:
+            from health_app.services.faiss_store import FaissVectorStore
+            vectors = store_vectors(FaissVectorStore(), options['vectors'] + options['queries'])
+            if vectors is None:
+                self.stdout.write(self.style.WARNING("FAISS store is empty; using synthetic vectors"))
+        if vectors is None:
+            vectors = synthetic_vectors(options['vectors'] + options['queries'], options['dim'])
+
+        # Held-out queries, so no query is its own nearest neighbour
+        rng = np.random.default_rng(2)
+        order = rng.permutation(len(vectors))
+        queries = vectors[order[:options['queries']]]
+        vectors = np.ascontiguousarray(vectors[order[options['queries']:]])
+
+        self.stdout.write(
+            f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, "
+            f"{options['index']} index, recall@{options['k']}"
+        )
+        self.stdout.write(f"{'mode':<10}{'rerank':<8}{'recall':>8}{'p50 ms':>10}{'bytes/vec':>11}{'build s':>9}")
+        for row in benchmark(
+            vectors, queries, k=options['k'], index_type=options['index'],
+            rerank_factor=options['rerank_factor'], nprobe=options['nprobe'],
+        ):
+            self.stdout.write(
+                f"{row['mode']:<10}{'yes' if row['rerank'] else 'no':<8}{row['recall']:>8.4f}"
+                f"{row['p50_ms']:>10.3f}{row['bytes_per_vector']:>11.1f}{row['build_seconds']:>9.2f}"
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from health_app.services.retention import enforce_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete chats, conversation memory, vectors and activity past DATA_RETENTION_DAYS, "
+        "audit logs past AUDIT_LOG_RETENTION_DAYS and export files past FILE_RETENTION_DAYS, "
+        "then compact the vector store"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Override DATA_RETENTION_DAYS")
+        parser.add_argument('--audit-days', type=int, help="Override AUDIT_LOG_RETENTION_DAYS")
+        parser.add_argument('--export-days', type=int, help="Override EXPORT_JOB_SETTINGS['FILE_RETENTION_DAYS']")
+        parser.add_argument('--chunk-size', type=int, help="Rows deleted per statement")
+        parser.add_argument('--skip-vectors', action='store_true', help="Leave the Chroma collection alone")
+        parser.add_argument('--no-compact', action='store_true', help="Skip the VACUUM after pruning vectors")
+
+    def handle(self, *args, **options):
+        result = enforce_retention(
+            retention_days=options.get('days'),
+            audit_retention_days=options.get('audit_days'),
+            chunk_size=options.get('chunk_size'),
+            prune_vectors=False if options['skip_vectors'] else None,
+            compact=False if options['no_compact'] else None,
+            export_retention_days=options.get('export_days'),
+        )
+        for name, target in result['targets'].items():
+            self.stdout.write(f"{name}: removed {target['removed']} in {target['seconds']}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {result['removed']} rows/vectors older than {result['cutoff']} "
+            f"(audit logs older than {result['audit_cutoff']}), reclaimed {result['bytes_reclaimed']} bytes "
+            f"in {result['seconds']}s"
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from health_app.services.faiss_store import FaissVectorStore
+from health_app.services.vector_store_service import get_vector_store
+
+
+class Command(BaseCommand):
+    help = "Fold new FAISS conversation vectors into the base index whenever FAISS_MERGE_AFTER rows are pending"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Check once, merge if due, then exit")
+        parser.add_argument('--force', action='store_true', help="Merge even if fewer rows are pending")
+        parser.add_argument('--interval', type=int, help="Seconds between checks (default FAISS_MERGE_INTERVAL)")
+
+    def handle(self, *args, **options):
+        store = get_vector_store()
+        if not isinstance(store, FaissVectorStore):
+            raise CommandError("merge_vector_index only applies to VECTOR_STORE_SETTINGS['BACKEND'] = 'faiss'")
+
+        if options['once']:
+            pending = store.pending_merge()
+            if store.merge(force=options['force']):
+                self.stdout.write(self.style.SUCCESS(f"Merged {pending} pending vectors into the base index"))
+            else:
+                self.stdout.write(f"{pending} vectors pending; no merge")
+            return
+
+        interval = options.get('interval') or settings.VECTOR_STORE_SETTINGS.get('FAISS_MERGE_INTERVAL', 60)
+        self.stdout.write(f"Merging FAISS index every {store.merge_after} new vectors, checking every {interval}s")
+        force = options['force']
+        try:
+            while True:
+                pending = store.pending_merge()
+                if store.merge(force=force):
+                    self.stdout.write(f"Merged {pending} pending vectors into the base index")
+                force = False
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from health_app.analytics import prune_activity_logs
+
+
+class Command(BaseCommand):
+    help = "Delete UserActivityLog rows older than DATA_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Override the retention period in days")
+        parser.add_argument('--chunk-size', type=int, help="Rows deleted per statement")
+
+    def handle(self, *args, **options):
+        result = prune_activity_logs(
+            retention_days=options.get('days'),
+            chunk_size=options.get('chunk_size'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {result['removed']} activity rows older than {result['cutoff']} "
+            f"in {result['seconds']}s"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health_app.services.data_deletion import execute_run, resume_runs, start_run, users_due_for_deletion
+
+
+class Command(BaseCommand):
+    help = "Bulk delete or anonymize user data; unfinished runs are resumed first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', choices=['delete', 'anonymize'], default='delete')
+        parser.add_argument('--users', type=int, nargs='+', help="User ids to process")
+        parser.add_argument('--due', action='store_true',
+                            help="Users whose deletion request is older than DATA_DELETION_SETTINGS['GRACE_DAYS']")
+        parser.add_argument('--batch-size', type=int, help="Users per batch")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options.get('batch_size')
+
+        for run in resume_runs(batch_size=batch_size):
+            self._report(run)
+
+        user_ids = list(options.get('users') or [])
+        if options['due']:
+            user_ids.extend(users_due_for_deletion())
+        if not user_ids:
+            if not (options.get('users') or options['due']):
+                return
+            self.stdout.write("No users to process")
+            return
+
+        run = start_run(options['action'].upper(), user_ids)
+        if not execute_run(run, batch_size=batch_size):
+            raise CommandError(f"Another deletion run is in progress; run {run.pk} will resume next time")
+        self._report(run)
+        self.stdout.write(f"Finished in {time.monotonic() - started:.2f}s")
+
+    def _report(self, run):
+        style = self.style.SUCCESS if run.status == 'COMPLETED' else self.style.ERROR
+        self.stdout.write(style(
+            f"Run {run.pk} ({run.action}) {run.status}: {run.processed}/{len(run.user_ids)} users, "
+            f"{run.rows_changed} rows, {run.files_deleted} files, {run.vectors_deleted} vectors"
+            + (f" - {run.error}" if run.error else "")
+        ))
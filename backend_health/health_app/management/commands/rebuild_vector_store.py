@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from health_app.services.vector_maintenance import rebuild_collection
+
+
+class Command(BaseCommand):
+    help = "Rebuild the conversation vector collection from ConversationMemory and swap it in atomically"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Embedding processes (1 embeds in-process)")
+        parser.add_argument('--batch-size', type=int, help="Texts per embedding call and upsert")
+        parser.add_argument('--samples', type=int, help="Queries timed before and after")
+        parser.add_argument('--keep-old', action='store_true', help="Keep the previous collection instead of dropping it")
+
+    def handle(self, *args, **options):
+        try:
+            report = rebuild_collection(
+                workers=options.get('workers'),
+                batch_size=options.get('batch_size'),
+                samples=options.get('samples'),
+                keep_old=options['keep_old'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for label in ('before', 'after'):
+            stats = report[label]
+            self.stdout.write(
+                f"{label}: {stats['vectors']} vectors, {stats['bytes'] / 1024 / 1024:.1f} MB on disk, "
+                f"query p50 {stats['p50_ms']} ms / p95 {stats['p95_ms']} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {report['old_collection']} into {report['new_collection']}: "
+            f"{report['embedded']} vectors embedded, {report['copied_unbacked']} diagnosis vectors copied, "
+            f"{report['dropped_deleted']} deleted meanwhile dropped in {report['seconds']}s"
+        ))
@@ -0,0 +1,35 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from health_app.services.embedding_server import EmbeddingServer
+
+
+class Command(BaseCommand):
+    help = "Serve embeddings to the web workers over a Unix socket until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help="Socket path (default EMBEDDING_SERVER_SETTINGS['SOCKET_PATH'])")
+        parser.add_argument('--workers', type=int, help="Model processes (default EMBEDDING_SERVER_SETTINGS['WORKERS'])")
+        parser.add_argument('--max-batch', type=int, help="Texts merged into one model call")
+        parser.add_argument('--batch-wait-ms', type=int, help="How long a batch waits for more requests")
+
+    def handle(self, *args, **options):
+        server = EmbeddingServer(
+            socket_path=options.get('socket'),
+            workers=options.get('workers'),
+            max_batch=options.get('max_batch'),
+            batch_wait_ms=options.get('batch_wait_ms'),
+        )
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Embedding server on {server.socket_path} with {server.workers} model processes")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from health_app.services.export_jobs import ExportJobRunner
+
+
+class Command(BaseCommand):
+    help = "Run queued GDPR export jobs (DataExportRequest) until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Export threads (default EXPORT_JOB_SETTINGS['WORKERS'])")
+        parser.add_argument('--once', action='store_true', help="Run jobs until the queue is empty, then exit")
+
+    def handle(self, *args, **options):
+        runner = ExportJobRunner(workers=options.get('workers'))
+
+        if options['once']:
+            started = 0
+            while True:
+                started += runner.run_once()
+                if not runner.busy:
+                    break
+                time.sleep(0.5)
+            runner.shutdown(wait=True)
+            self.stdout.write(self.style.SUCCESS(f"Ran {started} export jobs"))
+            return
+
+        self.stdout.write(f"Export job worker {runner.worker_id} running with {runner.workers} threads")
+        try:
+            runner.serve_forever()
+        except KeyboardInterrupt:
+            runner.shutdown(wait=True)
@@ -0,0 +1,552 @@
+"""
+Prometheus-style metrics registry
+Multi-process safe counters, gauges and histograms exposed at /metrics
+"""
+import atexit
+import glob
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import orjson
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Counters and histograms of exited workers, folded together so restarts don't grow MULTIPROCESS_DIR
+RETIRED_FILE = 'retired_metrics.json'
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _metrics_settings():
+    return getattr(settings, 'METRICS_SETTINGS', {})
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class for a labelled metric family
+    Values are keyed by the tuple of label values
+    """
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        self._values = {}
+
+    def samples(self):
+        """Return JSON-serializable samples for snapshots"""
+        return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """Monotonically increasing counter, summed across worker processes"""
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock():
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Point-in-time value, summed across live worker processes
+    Snapshots of exited workers are ignored
+    """
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock():
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock():
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Bucketed distribution with sum and count, mergeable across processes"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock():
+            state = self._values.get(key)
+            if state is None:
+                state = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the wrapped block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        return [
+            [list(key), {'buckets': list(state['buckets']), 'sum': state['sum'], 'count': state['count']}]
+            for key, state in self._values.items()
+        ]
+
+
+class MetricsRegistry:
+    """
+    In-process metric registry with multi-process aggregation
+
+    Each gunicorn worker periodically writes a snapshot of its own values to
+    MULTIPROCESS_DIR; the /metrics view merges every snapshot with the live
+    values of the serving worker. Snapshots left by exited workers are
+    folded into RETIRED_FILE and removed.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flusher = None
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    @contextmanager
+    def lock(self):
+        self._check_fork()
+        with self._lock:
+            yield
+
+    def _check_fork(self):
+        """Drop values inherited from the master process after a fork"""
+        pid = os.getpid()
+        if pid == self._pid:
+            if self._flusher is None:
+                self._start_flusher()
+            return
+        with self._lock:
+            if pid != self._pid:
+                for metric in self._metrics.values():
+                    metric.reset()
+                self._pid = pid
+                self._flusher = None
+        self._start_flusher()
+
+    @property
+    def multiprocess_dir(self):
+        return _metrics_settings().get('MULTIPROCESS_DIR')
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.multiprocess_dir, f"metrics_{pid or self._pid}.json")
+
+    def _start_flusher(self):
+        if not self.multiprocess_dir:
+            self._flusher = False
+            return
+        # A snapshot under our pid belongs to an exited worker whose pid was reused
+        if os.path.exists(self._snapshot_path()):
+            self._retire([self._pid])
+        with self._flush_lock:
+            if self._flusher and self._flusher.is_alive():
+                return
+            interval = _metrics_settings().get('FLUSH_INTERVAL', 5)
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(interval,), name='metrics-flusher', daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self, interval):
+        pid = os.getpid()
+        while pid == self._pid:
+            time.sleep(interval)
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: metric.samples()
+                for name, metric in self._metrics.items()
+            }
+
+    def flush(self):
+        """Write this worker's values to its snapshot file"""
+        if not self.multiprocess_dir or os.getpid() != self._pid:
+            return
+        snapshot = self.snapshot()
+        if not any(snapshot.values()):
+            return
+        try:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            path = self._snapshot_path()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as handle:
+                handle.write(orjson.dumps(snapshot))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to flush metrics snapshot: {e}")
+
+    @staticmethod
+    def _read_snapshot(path):
+        try:
+            with open(path, 'rb') as handle:
+                return orjson.loads(handle.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def _other_snapshots(self):
+        """Yield (pid, alive, snapshot) for every other worker's snapshot file"""
+        for path in glob.glob(os.path.join(self.multiprocess_dir, 'metrics_*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics_'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == self._pid:
+                continue
+            data = self._read_snapshot(path)
+            if data is not None:
+                yield pid, _pid_alive(pid), data
+
+    @contextmanager
+    def _directory_lock(self, exclusive):
+        """Scrapes read the snapshot files under a shared lock; retiring them takes it exclusively"""
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        path = os.path.join(self.multiprocess_dir, 'metrics.lock')
+        if fcntl is None:
+            from filelock import FileLock
+            with FileLock(path):
+                yield
+            return
+        with open(path, 'a') as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _retire(self, pids):
+        """
+        Fold exited workers' snapshots into RETIRED_FILE and delete them
+
+        Counters and histograms keep their totals; gauges of dead workers
+        are dropped, as in collect(). The retired file is written before the
+        snapshots are removed, so a crash in between can only double count.
+        """
+        retired_path = os.path.join(self.multiprocess_dir, RETIRED_FILE)
+        try:
+            with self._directory_lock(exclusive=True):
+                merged = {name: {} for name in self._metrics}
+                self._merge(merged, self._read_snapshot(retired_path) or {}, alive=False)
+                paths = []
+                for pid in pids:
+                    path = self._snapshot_path(pid)
+                    data = self._read_snapshot(path)
+                    if data is not None:
+                        # Another worker may have retired it already
+                        self._merge(merged, data, alive=False)
+                        paths.append(path)
+                if not paths:
+                    return
+                tmp_path = f"{retired_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as handle:
+                    handle.write(orjson.dumps({
+                        name: [[list(key), value] for key, value in samples.items()]
+                        for name, samples in merged.items() if samples
+                    }))
+                os.replace(tmp_path, retired_path)
+                for path in paths:
+                    os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to retire metrics snapshots: {e}")
+
+    def _merge(self, merged, data, alive):
+        for name, samples in data.items():
+            metric = self._metrics.get(name)
+            if metric is None or (metric.type_name == 'gauge' and not alive):
+                continue
+            target = merged[name]
+            for key, value in samples:
+                key = tuple(key)
+                if metric.type_name == 'histogram':
+                    if len(value['buckets']) != len(metric.buckets):
+                        continue
+                    state = target.setdefault(
+                        key, {'buckets': [0] * len(metric.buckets), 'sum': 0.0, 'count': 0}
+                    )
+                    state['buckets'] = [a + b for a, b in zip(state['buckets'], value['buckets'])]
+                    state['sum'] += value['sum']
+                    state['count'] += value['count']
+                else:
+                    target[key] = target.get(key, 0) + value
+
+    def collect(self):
+        """Merge live values with every other worker's latest snapshot and the retired totals"""
+        self._check_fork()
+        merged = {name: {} for name in self._metrics}
+        self._merge(merged, self.snapshot(), alive=True)
+        if not self.multiprocess_dir:
+            return merged
+
+        dead = []
+        with self._directory_lock(exclusive=False):
+            retired = self._read_snapshot(os.path.join(self.multiprocess_dir, RETIRED_FILE))
+            if retired:
+                self._merge(merged, retired, alive=False)
+            for pid, alive, data in self._other_snapshots():
+                self._merge(merged, data, alive)
+                if not alive:
+                    dead.append(pid)
+        if dead:
+            self._retire(dead)
+        return merged
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            for key, value in sorted(merged[name].items()):
+                if metric.type_name == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value['buckets']):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, key, ('le', _format_value(bound)))
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, key, ('le', '+Inf'))
+                    lines.append(f"{name}_bucket{labels} {value['count']}")
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{labels} {value['count']}")
+                else:
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
+
+
+# ──────── Metric definitions ────────
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route',
+    labelnames=('method', 'route', 'status'),
+)
+STREAM_DURATION = Histogram(
+    'llm_stream_duration_seconds',
+    'Total duration of streamed LLM responses',
+    labelnames=('endpoint',),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 120.0),
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    'llm_time_to_first_token_seconds',
+    'Time until the first streamed LLM chunk',
+    labelnames=('endpoint',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0),
+)
+TOKENS_EMITTED = Counter(
+    'llm_tokens_emitted_total',
+    'Estimated LLM tokens streamed to clients',
+    labelnames=('endpoint',),
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    'embedding_batch_size',
+    'Number of texts per embedding call',
+    labelnames=('operation',),
+    buckets=SIZE_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Cache lookups by cache name and result (hit/miss)',
+    labelnames=('cache', 'result'),
+)
+CONDITIONAL_REQUESTS = Counter(
+    'conditional_requests_total',
+    'Conditional GETs by route and result (not_modified/modified)',
+    labelnames=('route', 'result'),
+)
+CHROMA_QUERY_LATENCY = Histogram(
+    'chroma_query_duration_seconds',
+    'ChromaDB query latency',
+    labelnames=('collection', 'operation'),
+)
+FAISS_QUERY_LATENCY = Histogram(
+    'faiss_query_duration_seconds',
+    'FAISS vector store query latency',
+    labelnames=('collection', 'operation'),
+)
+THROTTLE_REJECTIONS = Counter(
+    'throttle_rejections_total',
+    'Requests rejected by API throttles',
+    labelnames=('scope',),
+)
+LLM_IN_FLIGHT = Gauge(
+    'llm_requests_in_flight',
+    'LLM calls currently holding an admission slot',
+)
+LLM_QUEUE_DEPTH = Gauge(
+    'llm_admission_queue_depth',
+    'LLM calls waiting for an admission slot',
+)
+LLM_ADMISSION_WAIT = Histogram(
+    'llm_admission_wait_seconds',
+    'Time spent waiting for an LLM admission slot',
+    labelnames=('outcome',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LLM_ADMISSION_REJECTIONS = Counter(
+    'llm_admission_rejections_total',
+    'LLM calls rejected by the admission controller',
+    labelnames=('reason',),
+)
+LLM_BACKEND_CALLS = Counter(
+    'llm_backend_calls_total',
+    'LLM backend stream attempts by outcome (success/error/empty/slow/cancelled)',
+    labelnames=('backend', 'outcome'),
+)
+LLM_CIRCUIT_STATE = Gauge(
+    'llm_circuit_state',
+    'LLM backend circuit breaker state (0 closed, 1 half-open, 2 open)',
+    labelnames=('backend',),
+)
+LLM_HEDGED_REQUESTS = Counter(
+    'llm_hedged_requests_total',
+    'Hedged LLM requests fired at a secondary backend',
+    labelnames=('backend',),
+)
+
+
+# ──────── Instrumentation helpers ────────
+
+def metrics_enabled():
+    return _metrics_settings().get('ENABLED', True)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) for streamed text"""
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def get_route(request):
+    """Low-cardinality route label for a request"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route if match.route else (match.view_name or 'unknown')
+
+
+def observe_request(request, status_code, duration):
+    """Record request latency for the resolved route"""
+    if not metrics_enabled():
+        return
+    REQUEST_LATENCY.observe(
+        duration, method=request.method, route=get_route(request), status=status_code
+    )
+
+
+def record_cache_lookup(cache_name, hit):
+    """Record a cache hit or miss"""
+    if metrics_enabled():
+        CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def track_stream(chunks, endpoint):
+    """
+    Wrap a text stream to record time-to-first-token, total duration and
+    estimated tokens emitted, including streams closed by a disconnect
+    """
+    if not metrics_enabled():
+        yield from chunks
+        return
+
+    start = time.perf_counter()
+    first_chunk = True
+    tokens = 0
+    try:
+        for chunk in chunks:
+            if first_chunk:
+                TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start, endpoint=endpoint)
+                first_chunk = False
+            if isinstance(chunk, str):
+                tokens += estimate_tokens(chunk)
+            yield chunk
+    finally:
+        STREAM_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+        if tokens:
+            TOKENS_EMITTED.inc(tokens, endpoint=endpoint)
@@ -3,60 +3,150 @@ Enterprise logging and monitoring middleware
 Tracks all requests, responses, and errors with detailed context
 """
 import logging
-import json
+import random
 import time
+
+import orjson
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
-from django.http import JsonResponse
+
+from .metrics import get_route, observe_request
 
 logger = logging.getLogger(__name__)
 
 
-class RequestLoggingMiddleware(MiddlewareMixin):
+class TimedStreamingContent:
     """
-    Middleware to log all incoming requests and outgoing responses
-    Includes timing, user info, IP address, and error tracking
+    Iterator wrapper for StreamingHttpResponse bodies
+    Records time-to-first-chunk, total stream time, bytes and chunk count and
+    notifies callbacks once, when the stream is exhausted or closed early
+    (e.g. by a client disconnect)
     """
     
+    def __init__(self, content, start_time):
+        self._iterator = iter(content)
+        self.start_time = start_time
+        self.first_chunk_time = None
+        self.end_time = None
+        self.bytes_sent = 0
+        self.chunk_count = 0
+        self.completed = False
+        self._finished = False
+        self._callbacks = []
+    
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+    
+    @property
+    def time_to_first_chunk(self):
+        if self.first_chunk_time is None:
+            return None
+        return self.first_chunk_time - self.start_time
+    
+    @property
+    def total_duration(self):
+        return (self.end_time or time.time()) - self.start_time
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self.completed = True
+            self._finish()
+            raise
+        except Exception:
+            self._finish()
+            raise
+        
+        if self.first_chunk_time is None:
+            self.first_chunk_time = time.time()
+        self.chunk_count += 1
+        self.bytes_sent += len(chunk)
+        return chunk
+    
+    def close(self):
+        self._finish()
+    
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self.end_time = time.time()
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Stream completion callback failed")
+
+
+def on_stream_complete(request, response, callback):
+    """
+    Register a callback for when a streaming response body finishes
+    Returns False for regular responses so callers can log immediately
+    """
+    if not getattr(response, 'streaming', False) or getattr(response, 'is_async', False):
+        return False
+    
+    timer = getattr(response, '_stream_timer', None)
+    if timer is None:
+        start_time = getattr(request, 'start_time', None) or time.time()
+        timer = TimedStreamingContent(response.streaming_content, start_time)
+        response.streaming_content = timer
+        response._stream_timer = timer
+    timer.add_callback(callback)
+    return True
+
+
+class RequestObservabilityMiddleware(MiddlewareMixin):
+    """
+    Single request logging, audit and performance middleware
+    Stamps timing once per request, samples successful request logs per
+    route and always logs failures, slow requests and sensitive operations
+    """
+    
+    SENSITIVE_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE']
+    SENSITIVE_PATHS = ['/api/profile/', '/user/profile/', '/api/register/']
+    
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = getattr(settings, 'OBSERVABILITY_SETTINGS', {})
+        self.sample_rates = config.get('LOG_SAMPLE_RATES', {})
+        self.default_sample_rate = config.get('DEFAULT_LOG_SAMPLE_RATE', 1.0)
+        self.slow_request_threshold = config.get('SLOW_REQUEST_THRESHOLD', 2.0)
+        self.slow_first_chunk_threshold = config.get('SLOW_FIRST_CHUNK_THRESHOLD', 2.0)
+        self.slow_stream_threshold = config.get('SLOW_STREAM_THRESHOLD', 30.0)
+    
     def process_request(self, request):
-        """Log request details"""
         request.start_time = time.time()
+    
+    def process_response(self, request, response):
+        if not hasattr(request, 'start_time'):
+            return response
         
-        # Get client IP address
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
+        if on_stream_complete(request, response, lambda timer: self._record_stream(request, response, timer)):
+            return response
         
-        # Prepare log data
-        log_data = {
-            'method': request.method,
-            'path': request.path,
-            'ip_address': ip,
-            'user_agent': request.META.get('HTTP_USER_AGENT', 'Unknown'),
-            'user': str(request.user) if request.user.is_authenticated else 'Anonymous'
-        }
+        duration = time.time() - request.start_time
+        observe_request(request, response.status_code, duration)
         
-        logger.info(f"Request started: {json.dumps(log_data)}")
-    
-    def process_response(self, request, response):
-        """Log response details with timing"""
-        if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-            
-            log_data = {
-                'method': request.method,
-                'path': request.path,
-                'status_code': response.status_code,
-                'duration_ms': round(duration * 1000, 2),
-                'user': str(request.user) if request.user.is_authenticated else 'Anonymous'
-            }
-            
-            if response.status_code >= 400:
-                logger.warning(f"Request failed: {json.dumps(log_data)}")
-            else:
-                logger.info(f"Request completed: {json.dumps(log_data)}")
+        log_data = self._base_log_data(request, response)
+        log_data['duration_ms'] = round(duration * 1000, 2)
         
+        if response.status_code >= 400:
+            logger.warning(f"Request failed: {_dumps(log_data)}")
+        elif self._sampled(request):
+            logger.info(f"Request completed: {_dumps(log_data)}")
+        
+        if duration > self.slow_request_threshold:
+            logger.warning(
+                f"SLOW REQUEST: {request.method} {request.path} "
+                f"took {round(duration, 2)}s for user {log_data['user']}"
+            )
+        
+        self._audit(request, response, log_data)
         return response
     
     def process_exception(self, request, exception):
@@ -66,67 +156,93 @@ class RequestLoggingMiddleware(MiddlewareMixin):
             'path': request.path,
             'exception_type': type(exception).__name__,
             'exception_message': str(exception),
-            'user': str(request.user) if request.user.is_authenticated else 'Anonymous'
+            'user': _user_label(request)
         }
         
-        logger.error(f"Request exception: {json.dumps(log_data)}", exc_info=True)
+        logger.error(f"Request exception: {_dumps(log_data)}", exc_info=True)
         
         return None
-
-
-class AuditLogMiddleware(MiddlewareMixin):
-    """
-    Audit logging for sensitive operations
-    Tracks CREATE, UPDATE, DELETE operations
-    """
     
-    SENSITIVE_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE']
-    SENSITIVE_PATHS = ['/api/profile/', '/user/profile/', '/api/register/']
-    
-    def process_response(self, request, response):
-        """Log sensitive operations"""
-        if request.method in self.SENSITIVE_METHODS:
-            # Check if this is a sensitive path
-            is_sensitive = any(path in request.path for path in self.SENSITIVE_PATHS)
-            
-            if is_sensitive or request.method == 'DELETE':
-                audit_data = {
-                    'timestamp': time.time(),
-                    'user': str(request.user) if request.user.is_authenticated else 'Anonymous',
-                    'user_id': request.user.id if request.user.is_authenticated else None,
-                    'method': request.method,
-                    'path': request.path,
-                    'status_code': response.status_code,
-                    'success': 200 <= response.status_code < 300
-                }
-                
-                logger.info(f"AUDIT: {json.dumps(audit_data)}")
+    def _record_stream(self, request, response, timer):
+        """Log, alert and audit a streamed response once its body has been sent"""
+        observe_request(request, response.status_code, timer.total_duration)
         
-        return response
-
-
-class PerformanceMonitoringMiddleware(MiddlewareMixin):
-    """
-    Monitor slow requests and database queries
-    Alerts when requests exceed performance thresholds
-    """
+        ttfc = timer.time_to_first_chunk
+        log_data = self._base_log_data(request, response)
+        log_data.update({
+            'time_to_first_chunk_ms': round(ttfc * 1000, 2) if ttfc is not None else None,
+            'duration_ms': round(timer.total_duration * 1000, 2),
+            'bytes': timer.bytes_sent,
+            'chunks': timer.chunk_count,
+            'completed': timer.completed,
+        })
+        
+        if not timer.completed:
+            logger.warning(f"Stream interrupted: {_dumps(log_data)}")
+        elif self._sampled(request):
+            logger.info(f"Stream completed: {_dumps(log_data)}")
+        
+        first_chunk_wait = ttfc if ttfc is not None else timer.total_duration
+        if first_chunk_wait > self.slow_first_chunk_threshold or timer.total_duration > self.slow_stream_threshold:
+            ttfc_text = f"{round(ttfc, 2)}s" if ttfc is not None else "never"
+            logger.warning(
+                f"SLOW STREAM: {request.method} {request.path} "
+                f"first chunk after {ttfc_text}, took {round(timer.total_duration, 2)}s "
+                f"({timer.chunk_count} chunks, {timer.bytes_sent} bytes, "
+                f"completed={timer.completed}) for user {log_data['user']}"
+            )
+        
+        self._audit(request, response, log_data)
     
-    SLOW_REQUEST_THRESHOLD = 2.0  # seconds
+    def _audit(self, request, response, log_data):
+        """Audit sensitive CREATE, UPDATE and DELETE operations"""
+        if request.method not in self.SENSITIVE_METHODS:
+            return
+        
+        is_sensitive = any(path in request.path for path in self.SENSITIVE_PATHS)
+        if is_sensitive or request.method == 'DELETE':
+            user = getattr(request, 'user', None)
+            authenticated = user is not None and user.is_authenticated
+            audit_data = {
+                'timestamp': request.start_time,
+                'user': log_data['user'],
+                'user_id': user.id if authenticated else None,
+                'method': request.method,
+                'path': request.path,
+                'status_code': response.status_code,
+                'success': 200 <= response.status_code < 300
+            }
+            
+            logger.info(f"AUDIT: {_dumps(audit_data)}")
     
-    def process_request(self, request):
-        request.start_time = time.time()
+    def _sampled(self, request):
+        rate = self.sample_rates.get(get_route(request), self.default_sample_rate)
+        return rate >= 1.0 or (rate > 0 and random.random() < rate)
     
-    def process_response(self, request, response):
-        if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-            
-            if duration > self.SLOW_REQUEST_THRESHOLD:
-                logger.warning(
-                    f"SLOW REQUEST: {request.method} {request.path} "
-                    f"took {round(duration, 2)}s for user {request.user}"
-                )
+    def _base_log_data(self, request, response):
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = request.META.get('REMOTE_ADDR')
         
-        return response
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'ip_address': ip,
+            'user_agent': request.META.get('HTTP_USER_AGENT', 'Unknown'),
+            'user': _user_label(request)
+        }
+
+
+def _user_label(request):
+    user = getattr(request, 'user', None)
+    return str(user) if user is not None and user.is_authenticated else 'Anonymous'
+
+
+def _dumps(data):
+    return orjson.dumps(data, default=str).decode()
 
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
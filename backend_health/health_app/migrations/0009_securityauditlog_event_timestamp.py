@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 10:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0008_dataexportrequest_securityauditlog_useractivitylog"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="securityauditlog",
+            name="timestamp",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
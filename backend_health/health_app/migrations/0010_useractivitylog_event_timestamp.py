@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 10:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0009_securityauditlog_event_timestamp"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="useractivitylog",
+            name="timestamp",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0010_useractivitylog_event_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="aidiagnosisresponse",
+            index=models.Index(
+                fields=["user", "created_at"], name="health_app__user_id_41dab0_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usersymptomlog",
+            index=models.Index(
+                fields=["user", "noted_at"], name="health_app__user_id_42dd63_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0011_health_record_section_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-19 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0012_userprofile_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="compression",
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="progress",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="dataexportrequest",
+            name="worker",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name="dataexportrequest",
+            index=models.Index(
+                fields=["status", "requested_at"], name="health_app__status_20a048_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("health_app", "0014_datadeletionrun"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dataexportrequest",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("COMPLETED", "Completed"),
+                    ("FAILED", "Failed"),
+                    ("EXPIRED", "Expired"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+    ]
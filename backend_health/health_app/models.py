@@ -58,6 +58,18 @@ class UserProfile(models.Model):
     weight_kg = models.FloatField(null=True, blank=True)
     blood_group = models.CharField(max_length=5, blank=True)
     allergies = models.TextField(blank=True)
+    version = models.PositiveIntegerField(default=0, editable=False)  # Conditional GET validator
+
+    def save(self, *args, **kwargs):
+        # Bumped in SQL so concurrent saves can never end on the same version
+        bump = self.pk is not None
+        if bump:
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
 
     def __str__(self):
         return self.user.full_name or self.user.email
@@ -83,6 +95,11 @@ class UserSymptomLog(models.Model):
     severity = models.IntegerField(choices=[(i, str(i)) for i in range(1, 11)])
     noted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'noted_at']),  # Health record section pages
+        ]
+
     def __str__(self):
         return f"{self.user.full_name or self.user.email} - {self.symptom.name}"
 
@@ -93,6 +110,11 @@ class AIDiagnosisResponse(models.Model):
     ai_notes = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),  # Health record section pages
+        ]
+
     def __str__(self):
         return f"Diagnosis for {self.user.full_name} on {self.created_at.date()}"
 
@@ -171,7 +193,8 @@ class SecurityAuditLog(models.Model):
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField(blank=True)
     details = models.JSONField(default=dict, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered writer inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-timestamp']
@@ -194,6 +217,7 @@ class DataExportRequest(models.Model):
         ('PROCESSING', 'Processing'),
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
+        ('EXPIRED', 'Expired'),  # File deleted after EXPORT_JOB_SETTINGS['FILE_RETENTION_DAYS']
     ]
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -202,9 +226,20 @@ class DataExportRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     export_format = models.CharField(max_length=10, choices=[('JSON', 'JSON'), ('PDF', 'PDF')])
     file_path = models.FileField(upload_to='exports/', null=True, blank=True)
+    compression = models.CharField(max_length=10, blank=True)  # '', 'gzip' or 'zstd' (JSON only)
+    
+    # Job runner state (services/export_jobs.py)
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent
+    started_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
     
     class Meta:
         ordering = ['-requested_at']
+        indexes = [
+            models.Index(fields=['status', 'requested_at']),  # Claiming the oldest pending job
+        ]
     
     def __str__(self):
         return f"Export for {self.user.email} - {self.status}"
@@ -217,7 +252,8 @@ class UserActivityLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     activity_type = models.CharField(max_length=100)
     activity_details = models.JSONField(default=dict, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event is tracked, not when the buffered writer inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     session_id = models.CharField(max_length=100, blank=True)
     
     class Meta:
@@ -229,3 +265,41 @@ class UserActivityLog(models.Model):
     
     def __str__(self):
         return f"{self.user.email} - {self.activity_type} - {self.timestamp}"
+
+
+class DataDeletionRun(models.Model):
+    """
+    Progress of a bulk anonymization/deletion run (services/data_deletion.py)
+    Users are processed in batches; processed marks the resume point after a crash
+    """
+    ACTION_CHOICES = [
+        ('ANONYMIZE', 'Anonymize'),
+        ('DELETE', 'Delete'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    user_ids = models.JSONField(default=list)
+    processed = models.PositiveIntegerField(default=0)  # Users fully handled, in user_ids order
+    vectors_deleted = models.PositiveIntegerField(default=0)
+    files_deleted = models.PositiveIntegerField(default=0)
+    rows_changed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} run {self.pk} - {self.status} ({self.processed}/{len(self.user_ids)})"
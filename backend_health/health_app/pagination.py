@@ -0,0 +1,134 @@
+"""
+Keyset (seek) pagination for append-only, time-ordered tables
+Pages are located with an index range scan, so cost does not grow with history size
+"""
+import base64
+from urllib.parse import urlencode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+def encode_keyset_cursor(timestamp, pk):
+    """Opaque cursor for a (timestamp, id) position; timestamp may be a datetime or ISO string"""
+    if not isinstance(timestamp, str):
+        timestamp = timestamp.isoformat()
+    raw = f"{timestamp}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_keyset_cursor(cursor):
+    """(timestamp, id) for a cursor from encode_keyset_cursor, ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+    except (TypeError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    timestamp = parse_datetime(timestamp)
+    if timestamp is None:
+        raise ValueError('Invalid cursor timestamp')
+    return timestamp, int(pk)
+
+
+def keyset_filter(timestamp_field, cursor, op):
+    """Rows strictly before ('lt') or after ('gt') a decoded cursor in (timestamp, id) order"""
+    timestamp, pk = cursor
+    return (
+        Q(**{f'{timestamp_field}__{op}': timestamp})
+        | Q(**{timestamp_field: timestamp, f'id__{op}': pk})
+    )
+
+
+class KeysetPagination:
+    """
+    Paginate on (timestamp, id) with opaque before/after cursors
+
+    - No cursor: the newest page
+    - ?before=<cursor>: the page of rows just older than the cursor
+    - ?after=<cursor>: the page of rows just newer than the cursor
+
+    Rows within a page are always returned oldest first. The body stays a
+    plain list; cursors for the neighbouring pages are sent in the
+    X-Older-Cursor / X-Newer-Cursor headers (and a Link header) when those
+    pages have rows.
+    """
+
+    timestamp_field = 'timestamp'
+    page_size = 100
+    max_page_size = 500
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        limit = self.get_page_size(request)
+        before = self.decode_cursor(request.query_params.get('before'))
+        after = self.decode_cursor(request.query_params.get('after'))
+        ts = self.timestamp_field
+
+        if after is not None:
+            rows = list(
+                queryset.filter(self._seek_filter(after, 'gt')).order_by(ts, 'id')[:limit + 1]
+            )
+            self.has_newer = len(rows) > limit
+            rows = rows[:limit]
+            self.has_older = True
+        else:
+            if before is not None:
+                queryset = queryset.filter(self._seek_filter(before, 'lt'))
+            rows = list(queryset.order_by(f'-{ts}', '-id')[:limit + 1])
+            self.has_older = len(rows) > limit
+            rows = rows[:limit]
+            rows.reverse()
+            self.has_newer = before is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        links = []
+        if self.page and self.has_older:
+            cursor = self.encode_cursor(self.page[0])
+            response['X-Older-Cursor'] = cursor
+            links.append(f'<{self._page_url("before", cursor)}>; rel="prev"')
+        if self.page and self.has_newer:
+            cursor = self.encode_cursor(self.page[-1])
+            response['X-Newer-Cursor'] = cursor
+            links.append(f'<{self._page_url("after", cursor)}>; rel="next"')
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row):
+        timestamp = row[self.timestamp_field] if isinstance(row, dict) else getattr(row, self.timestamp_field)
+        pk = row['id'] if isinstance(row, dict) else row.id
+        return encode_keyset_cursor(timestamp, pk)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            return decode_keyset_cursor(cursor)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _seek_filter(self, cursor, op):
+        return keyset_filter(self.timestamp_field, cursor, op)
+
+    def _page_url(self, direction, cursor):
+        params = {
+            key: value for key, value in self.request.query_params.items()
+            if key not in ('before', 'after')
+        }
+        params[direction] = cursor
+        return self.request.build_absolute_uri(self.request.path) + '?' + urlencode(params)
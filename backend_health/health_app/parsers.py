@@ -0,0 +1,43 @@
+"""
+orjson-backed JSON parser
+Drop-in replacement for DRF's JSONParser
+"""
+import io
+import re
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer
+
+# orjson silently turns integers beyond 64 bits into floats; any run of 20+
+# digits might be one, so those bodies take the exact stdlib path instead
+_WIDE_INTEGER = re.compile(rb'\d{20}')
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parse request bodies with orjson
+
+    Bodies orjson rejects or would read differently (NaN/Infinity when
+    STRICT_JSON is off, integers beyond 64 bits, malformed JSON, ...) are
+    handed to DRF's stdlib parser, so accepted input, parsed values and
+    error messages stay the same.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        body = stream.read() if stream is not None else b''
+        if _WIDE_INTEGER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
+        try:
+            if encoding.lower().replace('-', '') == 'utf8':
+                return orjson.loads(body)
+            return orjson.loads(body.decode(encoding))
+        except (orjson.JSONDecodeError, UnicodeDecodeError):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,377 @@
+"""
+Atomic GCRA rate limiting engine
+Single-timestamp state per key with pluggable in-process, shared-file and Redis backends
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def gcra_update(tat, now, emission_interval, delay_tolerance, cost=1):
+    """
+    Generic Cell Rate Algorithm step
+
+    Args:
+        tat: Stored theoretical arrival time for the key (0 when unseen)
+        now: Current time in seconds
+        emission_interval: Seconds "paid" per unit of cost (period / limit)
+        delay_tolerance: Burst window in seconds (the full period)
+        cost: Units charged for this request
+
+    Returns:
+        (allowed, new_tat, retry_after)
+    """
+    new_tat = max(tat, now) + emission_interval * cost
+    allow_at = new_tat - delay_tolerance
+    if now < allow_at:
+        return False, tat, allow_at - now
+    return True, new_tat, 0.0
+
+
+class RateLimitBackend:
+    """
+    Base class for rate limit state stores
+    Every check must be atomic across all callers sharing the backend
+    """
+
+    def gcra(self, key, emission_interval, delay_tolerance, cost=1):
+        """Charge cost units to key; return (allowed, retry_after_seconds)"""
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+    def acquire_lease(self, key, limit, ttl):
+        """
+        Take one of `limit` concurrent leases on key, each expiring after ttl seconds
+        Returns a token for release_lease, or None when all leases are taken
+        """
+        raise NotImplementedError
+
+    def release_lease(self, key, token):
+        raise NotImplementedError
+
+
+class LocalMemoryBackend(RateLimitBackend):
+    """
+    In-process backend: one float per key behind a lock
+    Limits and leases are per worker process
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._state = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def gcra(self, key, emission_interval, delay_tolerance, cost=1):
+        now = time.time()
+        with self._lock:
+            allowed, new_tat, retry_after = gcra_update(
+                self._state.get(key, 0.0), now, emission_interval, delay_tolerance, cost
+            )
+            if allowed:
+                if key not in self._state and len(self._state) >= self.max_keys:
+                    self._evict(now)
+                self._state[key] = new_tat
+        return allowed, retry_after
+
+    def reset(self, key):
+        with self._lock:
+            self._state.pop(key, None)
+
+    def acquire_lease(self, key, limit, ttl):
+        now = time.time()
+        with self._lock:
+            live = [expires for expires in self._leases.get(key, []) if expires > now]
+            if len(live) >= limit:
+                self._leases[key] = live
+                return None
+            token = now + ttl
+            while token in live:
+                token += 1e-6
+            live.append(token)
+            self._leases[key] = live
+        return token
+
+    def release_lease(self, key, token):
+        now = time.time()
+        with self._lock:
+            live = [expires for expires in self._leases.get(key, []) if expires > now and expires != token]
+            if live:
+                self._leases[key] = live
+            else:
+                self._leases.pop(key, None)
+
+    def _evict(self, now):
+        # A key whose TAT has passed is equivalent to an unseen key
+        expired = [k for k, tat in self._state.items() if tat <= now]
+        for k in expired:
+            del self._state[k]
+        if len(self._state) >= self.max_keys:
+            self._state.pop(min(self._state, key=self._state.get))
+
+
+class _SlotTable:
+    """
+    Memory-mapped hash table of fixed-size slots shared between processes
+
+    Each slot holds a 64-bit key hash followed by `width` float64 values.
+    Keys are addressed by open addressing with a short linear probe; slots
+    whose values have all expired are reused. Access is serialized by an
+    exclusive lock on the file.
+    """
+
+    HEADER = struct.Struct('<8sQQ')
+    MAGIC = b'GCRA0002'
+    PROBE_LIMIT = 16
+
+    def __init__(self, path, slots, width):
+        self.path = path
+        self.slots = slots
+        self.width = width
+        self.slot = struct.Struct('<Q' + 'd' * width)
+        self._pid = None
+        self._file = None
+        self._map = None
+        self._thread_lock = threading.Lock()
+        self._file_lock = None
+
+    @staticmethod
+    def hash_key(key):
+        # Stable across processes (unlike hash()); 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def find(self, key_hash, now):
+        """Return (slot index, stored values) for key_hash, or a reusable slot with zeroed values"""
+        start = key_hash % self.slots
+        reusable = None
+        oldest = None
+        for offset in range(self.PROBE_LIMIT):
+            index = (start + offset) % self.slots
+            slot_hash, *values = self.slot.unpack_from(self._map, self._offset(index))
+            if slot_hash == key_hash:
+                return index, values
+            expires = max(values)
+            if reusable is None and (slot_hash == 0 or expires <= now):
+                reusable = index
+            if oldest is None or expires < oldest[1]:
+                oldest = (index, expires)
+        # Probe window full of live keys: overwrite the one closest to expiry
+        index = reusable if reusable is not None else oldest[0]
+        return index, [0.0] * self.width
+
+    def write(self, index, key_hash, values):
+        self.slot.pack_into(self._map, self._offset(index), key_hash, *values)
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.slot.size
+
+    def locked(self):
+        self._open()
+        return _FileLockContext(self)
+
+    def _open(self):
+        """Map the state file once per process (re-opened after fork)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        size = self.HEADER.size + self.slots * self.slot.size
+        handle = open(self.path, 'a+b')
+        if fcntl is None:
+            from filelock import FileLock
+            self._file_lock = FileLock(f"{self.path}.lock")
+        self._lock_file(handle)
+        try:
+            handle.seek(0, os.SEEK_END)
+            if handle.tell() != size:
+                handle.truncate(0)
+                handle.write(self.HEADER.pack(self.MAGIC, self.slots, self.width))
+                handle.write(b'\0' * (size - self.HEADER.size))
+                handle.flush()
+        finally:
+            self._unlock_file(handle)
+
+        self._file = handle
+        self._map = mmap.mmap(handle.fileno(), size)
+        self._pid = pid
+
+    def _lock_file(self, handle):
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file_lock.acquire()
+
+    def _unlock_file(self, handle):
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file_lock.release()
+
+
+class _FileLockContext:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        self.table._thread_lock.acquire()
+        self.table._lock_file(self.table._file)
+
+    def __exit__(self, *exc_info):
+        self.table._unlock_file(self.table._file)
+        self.table._thread_lock.release()
+
+
+class FileLockBackend(RateLimitBackend):
+    """
+    Shared-memory backend for all gunicorn workers on one host
+
+    GCRA state is one float64 TAT per key in a memory-mapped slot table;
+    concurrency leases are up to MAX_LEASES expiry times per key in a second
+    table. Each check holds an exclusive file lock for a handful of memory
+    reads and writes.
+    """
+
+    MAX_LEASES = 8
+
+    def __init__(self, path, slots=65536, lease_slots=16384):
+        self._rates = _SlotTable(path, slots, 1)
+        self._leases = _SlotTable(f"{path}.leases", lease_slots, self.MAX_LEASES)
+
+    def gcra(self, key, emission_interval, delay_tolerance, cost=1):
+        key_hash = _SlotTable.hash_key(key)
+        with self._rates.locked():
+            now = time.time()
+            index, (tat,) = self._rates.find(key_hash, now)
+            allowed, new_tat, retry_after = gcra_update(
+                tat, now, emission_interval, delay_tolerance, cost
+            )
+            if allowed:
+                self._rates.write(index, key_hash, [new_tat])
+        return allowed, retry_after
+
+    def reset(self, key):
+        key_hash = _SlotTable.hash_key(key)
+        with self._rates.locked():
+            index, (tat,) = self._rates.find(key_hash, time.time())
+            if tat:
+                self._rates.write(index, 0, [0.0])
+
+    def acquire_lease(self, key, limit, ttl):
+        limit = min(limit, self.MAX_LEASES)
+        key_hash = _SlotTable.hash_key(key)
+        with self._leases.locked():
+            now = time.time()
+            index, values = self._leases.find(key_hash, now)
+            live = [expires for expires in values if expires > now]
+            if len(live) >= limit:
+                return None
+            token = now + ttl
+            while token in live:
+                token += 1e-6
+            live.append(token)
+            self._leases.write(index, key_hash, live + [0.0] * (self.MAX_LEASES - len(live)))
+        return token
+
+    def release_lease(self, key, token):
+        key_hash = _SlotTable.hash_key(key)
+        with self._leases.locked():
+            now = time.time()
+            index, values = self._leases.find(key_hash, now)
+            live = [expires for expires in values if expires > now and expires != token]
+            self._leases.write(index, key_hash, live + [0.0] * (self.MAX_LEASES - len(live)))
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    Redis backend for limits shared across hosts
+    The GCRA step runs as a Lua script so read-modify-write is atomic
+    """
+
+    SCRIPT = """
+    local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local now = tonumber(ARGV[1])
+    local emission_interval = tonumber(ARGV[2])
+    local delay_tolerance = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local new_tat = math.max(tat, now) + emission_interval * cost
+    local allow_at = new_tat - delay_tolerance
+    if now < allow_at then
+        return {0, tostring(allow_at - now)}
+    end
+    redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+    return {1, '0'}
+    """
+
+    LEASE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+    return 1
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='gcra:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBackend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+        self._lease_script = self.client.register_script(self.LEASE_SCRIPT)
+
+    def gcra(self, key, emission_interval, delay_tolerance, cost=1):
+        allowed, retry_after = self._script(
+            keys=[self.prefix + key],
+            args=[time.time(), emission_interval, delay_tolerance, cost],
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def reset(self, key):
+        self.client.delete(self.prefix + key)
+
+    def acquire_lease(self, key, limit, ttl):
+        token = uuid.uuid4().hex
+        acquired = self._lease_script(
+            keys=[f"{self.prefix}lease:{key}"],
+            args=[time.time(), limit, ttl, token],
+        )
+        return token if int(acquired) else None
+
+    def release_lease(self, key, token):
+        self.client.zrem(f"{self.prefix}lease:{key}", token)
+
+
+_backend = None
+
+
+def get_rate_limit_backend():
+    """Get or create the configured rate limit backend singleton"""
+    global _backend
+    if _backend is None:
+        config = getattr(settings, 'RATE_LIMIT_SETTINGS', {})
+        backend_path = config.get('BACKEND', 'health_app.ratelimit.LocalMemoryBackend')
+        options = {k.lower(): v for k, v in config.get('OPTIONS', {}).items()}
+        _backend = import_string(backend_path)(**options)
+    return _backend
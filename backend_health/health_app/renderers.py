@@ -0,0 +1,61 @@
+"""
+orjson-backed JSON renderer
+Drop-in replacement for DRF's JSONRenderer with the same compact output (float exponents aside)
+"""
+import math
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+def has_non_finite_float(data):
+    """Whether any float nested in data's dicts, lists and tuples is NaN or infinite"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Render with orjson, matching DRF's compact JSONRenderer byte for byte
+
+    - Datetimes go through DRF's encoder (millisecond precision, 'Z' suffix)
+      instead of orjson's native format
+    - Other types orjson can't handle (Decimal, lazy strings, timedelta, ...)
+      also fall back to the DRF encoder
+    - U+2028/U+2029 are escaped as DRF does for JavaScript compatibility
+    - Indented (browsable/?indent) output and data orjson rejects outright
+      (integers beyond 64 bits, very deep nesting) are left to JSONRenderer
+    - orjson writes NaN and Infinity as null; data containing them is left
+      to JSONRenderer, which raises ValueError under STRICT_JSON (the
+      default) as before
+    - One known difference: exponents lose their zero padding (1e-7 where
+      json writes 1e-07); both parse to the same float
+    """
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Any NaN/Infinity became null, so only bodies containing null need the scan
+        if b'null' in ret and has_non_finite_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -216,13 +216,18 @@ class SecurityAuditLogger:
     """
     Logs security-related events for audit trails
     GDPR and HIPAA compliant logging
+    Events are buffered and batch-inserted off the request path
     """
     
+    @classmethod
+    def _record(cls, **fields):
+        fields.setdefault('timestamp', timezone.now())
+        get_audit_sink().submit(**fields)
+    
     @classmethod
     def log_login(cls, username, success, ip_address, user_agent):
         """Log login attempt"""
-        from .models import SecurityAuditLog
-        SecurityAuditLog.objects.create(
+        cls._record(
             event_type='LOGIN',
             username=username,
             success=success,
@@ -234,10 +239,9 @@ class SecurityAuditLogger:
     @classmethod
     def log_password_change(cls, user, ip_address):
         """Log password change"""
-        from .models import SecurityAuditLog
-        SecurityAuditLog.objects.create(
+        cls._record(
             event_type='PASSWORD_CHANGE',
-            user=user,
+            user_id=user.id,
             username=user.email,
             success=True,
             ip_address=ip_address,
@@ -247,10 +251,9 @@ class SecurityAuditLogger:
     @classmethod
     def log_data_export(cls, user, export_type, ip_address):
         """Log data export request"""
-        from .models import SecurityAuditLog
-        SecurityAuditLog.objects.create(
+        cls._record(
             event_type='DATA_EXPORT',
-            user=user,
+            user_id=user.id,
             username=user.email,
             success=True,
             ip_address=ip_address,
@@ -260,12 +263,50 @@ class SecurityAuditLogger:
     @classmethod
     def log_data_deletion(cls, user, ip_address):
         """Log data deletion request"""
-        from .models import SecurityAuditLog
-        SecurityAuditLog.objects.create(
+        cls._record(
             event_type='DATA_DELETION',
-            user=user,
+            user_id=user.id,
             username=user.email,
             success=True,
             ip_address=ip_address,
             details={'action': 'account_deletion_requested'}
         )
+
+
+class SynchronousAuditSink:
+    """
+    Writes each audit event immediately (AUDIT_LOG_SETTINGS['BUFFERED'] = False)
+    """
+    
+    def submit(self, **fields):
+        from .models import SecurityAuditLog
+        SecurityAuditLog.objects.create(**fields)
+    
+    def flush(self):
+        pass
+
+
+_audit_sink = None
+
+
+def get_audit_sink():
+    """Get or create the security audit sink singleton"""
+    global _audit_sink
+    if _audit_sink is None:
+        from django.conf import settings
+        from .models import SecurityAuditLog
+        from .services.buffered_writer import BufferedModelWriter
+        
+        config = getattr(settings, 'AUDIT_LOG_SETTINGS', {})
+        if config.get('BUFFERED', True):
+            _audit_sink = BufferedModelWriter(
+                SecurityAuditLog,
+                name='security_audit',
+                batch_size=config.get('BATCH_SIZE', 100),
+                flush_interval=config.get('FLUSH_INTERVAL', 2.0),
+                max_queue_size=config.get('MAX_QUEUE_SIZE', 10000),
+                spill_dir=config.get('SPILL_DIR'),
+            )
+        else:
+            _audit_sink = SynchronousAuditSink()
+    return _audit_sink
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from .models import Symptom, UserProfile, UserSymptomLog, AIDiagnosisResponse, ChatLog,Medication
+from .models import Symptom, UserProfile, UserSymptomLog, AIDiagnosisResponse, ChatLog,Medication, DataExportRequest
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs): 
@@ -49,7 +50,7 @@ class SymptomSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = '__all__'
+        exclude = ['version']
 
 class UserSymptomLogSerializer(serializers.ModelSerializer):
     class Meta:
@@ -61,10 +62,37 @@ class AIDiagnosisResponseSerializer(serializers.ModelSerializer):
         model = AIDiagnosisResponse
         fields = '__all__' 
 
+class PrefetchedManyRelatedField(serializers.ManyRelatedField):
+    """
+    Many-to-many field that reads a Prefetch(to_attr=...) list when the
+    queryset provides one, instead of querying the relation per row
+    """
+    
+    def __init__(self, prefetch_attr, **kwargs):
+        self.prefetch_attr = prefetch_attr
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        prefetched = getattr(instance, self.prefetch_attr, None)
+        if prefetched is not None:
+            return prefetched
+        return super().get_attribute(instance)
+
+
 class ChatLogSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
-    related_message_id = serializers.SerializerMethodField()
-    diagnosis_id = serializers.SerializerMethodField()
+    related_message_id = serializers.ReadOnlyField()
+    diagnosis_id = serializers.ReadOnlyField()
+    symptom_references = PrefetchedManyRelatedField(
+        'prefetched_symptom_references',
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=Symptom.objects.all()),
+        required=False
+    )
+    diagnosis_references = PrefetchedManyRelatedField(
+        'prefetched_diagnosis_references',
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=AIDiagnosisResponse.objects.all()),
+        required=False
+    )
     
     class Meta:
         model = ChatLog
@@ -72,17 +100,56 @@ class ChatLogSerializer(serializers.ModelSerializer):
                 'symptom_references', 'diagnosis_references', 'related_message_id',
                 'diagnosis_id']
 
+    @staticmethod
+    def prefetch(queryset):
+        """
+        Load both M2M id lists in one query each for the whole page
+        Only primary keys are fetched since the serializer emits ids
+        """
+        return queryset.prefetch_related(
+            Prefetch(
+                'symptom_references',
+                queryset=Symptom.objects.only('id'),
+                to_attr='prefetched_symptom_references'
+            ),
+            Prefetch(
+                'diagnosis_references',
+                queryset=AIDiagnosisResponse.objects.only('id'),
+                to_attr='prefetched_diagnosis_references'
+            ),
+        )
+
     def get_image_url(self, obj):
         if obj.image:
             return self.context['request'].build_absolute_uri(obj.image.url)
         return None
-        
-    def get_related_message_id(self, obj):
-        return obj.related_message.id if obj.related_message else None
-        
-    def get_diagnosis_id(self, obj):
-        return obj.diagnosis.id if obj.diagnosis else None
+
+
 class MedicationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Medication
         fields = '__all__'
+
+
+class DataExportRequestSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DataExportRequest
+        fields = [
+            'id', 'status', 'export_format', 'compression', 'progress', 'error',
+            'requested_at', 'started_at', 'completed_at', 'status_url', 'download_url',
+        ]
+
+    def _url(self, name, obj):
+        from django.urls import reverse
+        request = self.context.get('request')
+        url = reverse(name, kwargs={'job_id': obj.pk})
+        return request.build_absolute_uri(url) if request else url
+
+    def get_status_url(self, obj):
+        return self._url('data-export-job', obj)
+
+    def get_download_url(self, obj):
+        return self._url('data-export-download', obj) if obj.status == 'COMPLETED' else None
@@ -0,0 +1,173 @@
+"""
+Admission control for outbound LLM calls
+Bounds concurrent upstream streams per process and rejects fast when saturated
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from health_app.exceptions import LLMCapacityExceeded
+from health_app.metrics import (
+    LLM_ADMISSION_REJECTIONS,
+    LLM_ADMISSION_WAIT,
+    LLM_IN_FLIGHT,
+    LLM_QUEUE_DEPTH,
+    metrics_enabled,
+)
+from health_app.middleware import on_stream_complete
+
+logger = logging.getLogger(__name__)
+
+
+class LLMAdmissionController:
+    """
+    Semaphore with a bounded FIFO wait queue and a queue-time deadline
+
+    - At most max_concurrent LLM calls run at once in this process
+    - Up to max_queue further calls wait, each for at most queue_timeout seconds
+    - Anything beyond that is rejected immediately with LLMCapacityExceeded
+
+    Admission is reentrant per thread: a view that admits up front (so it can
+    still answer 503 before streaming starts) holds one slot for the helper
+    calls it makes while streaming.
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=16, queue_timeout=5.0, retry_after=5):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def acquire(self):
+        """Take a slot for the current thread, waiting in the queue if needed"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            return
+
+        started = time.monotonic()
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                waiter = None
+            elif len(self._waiters) >= self.max_queue:
+                self._reject('queue_full')
+            else:
+                waiter = threading.Event()
+                self._waiters.append(waiter)
+                self._update_gauges()
+
+        if waiter is not None and not waiter.wait(self.queue_timeout):
+            with self._lock:
+                # release() may have handed us the slot just after the deadline
+                if not waiter.is_set():
+                    self._waiters.remove(waiter)
+                    self._update_gauges()
+                    self._observe_wait(started, 'timeout')
+                    self._reject('timeout')
+
+        self._local.depth = 1
+        with self._lock:
+            self._update_gauges()
+        self._observe_wait(started, 'admitted')
+
+    def release(self):
+        """Give back the current thread's slot, waking the next waiter"""
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            return
+        self._local.depth = depth - 1
+        if depth > 1:
+            return
+
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter
+                self._waiters.pop(0).set()
+            else:
+                self.active -= 1
+            self._update_gauges()
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def hold(self, open_stream):
+        """
+        Admit, then open and relay an upstream stream, keeping the slot until
+        the stream is exhausted or closed
+        """
+        with self.admit():
+            yield from open_stream()
+
+    def _reject(self, reason):
+        if metrics_enabled():
+            LLM_ADMISSION_REJECTIONS.inc(reason=reason)
+        logger.warning(
+            f"LLM admission rejected ({reason}): {self.active} in flight, {len(self._waiters)} queued"
+        )
+        raise LLMCapacityExceeded(retry_after=self.retry_after)
+
+    def _update_gauges(self):
+        if metrics_enabled():
+            LLM_IN_FLIGHT.set(self.active)
+            LLM_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _observe_wait(self, started, outcome):
+        if metrics_enabled():
+            LLM_ADMISSION_WAIT.observe(time.monotonic() - started, outcome=outcome)
+
+
+def admit_llm_request(view_func):
+    """
+    Admit an LLM-backed view before it runs so saturation is answered with a
+    fast 503 instead of a stalled stream; the slot is held until the streamed
+    body finishes
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        controller = get_admission_controller()
+        controller.acquire()
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            controller.release()
+            raise
+
+        if not on_stream_complete(request, response, lambda stream: controller.release()):
+            controller.release()
+        return response
+    return wrapper
+
+
+_admission_controller = None
+
+
+def get_admission_controller():
+    """Get or create the process-wide LLM admission controller singleton"""
+    global _admission_controller
+    if _admission_controller is None:
+        config = getattr(settings, 'LLM_ADMISSION_SETTINGS', {})
+        _admission_controller = LLMAdmissionController(
+            max_concurrent=config.get('MAX_CONCURRENT', 6),
+            max_queue=config.get('MAX_QUEUE', 1),
+            queue_timeout=config.get('QUEUE_TIMEOUT', 5.0),
+            retry_after=config.get('RETRY_AFTER', 5),
+        )
+    return _admission_controller
@@ -0,0 +1,248 @@
+"""
+Buffered, batched model writer
+Queues rows in memory and inserts them with bulk_create from a background thread
+"""
+import atexit
+import glob
+import logging
+import os
+import queue
+import threading
+
+import orjson
+from django.db import DataError, IntegrityError, InterfaceError, OperationalError, connection, models, transaction
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the database can't be reached; anything else is the rows' fault
+UNREACHABLE_ERRORS = (OperationalError, InterfaceError)
+REJECTED_ROW_ERRORS = (IntegrityError, DataError)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class BufferedModelWriter:
+    """
+    Bounded in-memory buffer flushed with bulk_create on size/time thresholds
+
+    - Rows are flushed when BATCH_SIZE rows are pending or every FLUSH_INTERVAL seconds
+    - Pending rows are flushed on interpreter shutdown (gunicorn worker exit)
+    - Batches that fail because the database is unreachable are spilled to
+      JSON lines in spill_dir and replayed after the next successful flush
+    - Batches rejected by constraints are retried row by row; rows that
+      still fail are logged and dropped
+    - When the queue is full, rows are written synchronously, or dropped when
+      drop_when_full is set (for best-effort analytics)
+    """
+
+    def __init__(
+        self,
+        model,
+        name,
+        batch_size=100,
+        flush_interval=2.0,
+        max_queue_size=10000,
+        spill_dir=None,
+        drop_when_full=False,
+    ):
+        self.model = model
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.spill_dir = spill_dir
+        self.drop_when_full = drop_when_full
+        self.dropped = 0
+        self.rejected = 0
+
+        self._datetime_fields = [
+            field.attname for field in model._meta.concrete_fields
+            if isinstance(field, models.DateTimeField)
+        ]
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = None
+        self._wake = threading.Event()
+        self._stopping = False
+        atexit.register(self.close)
+
+    def submit(self, **fields):
+        """Queue one row; fields must use attnames (e.g. user_id, not user)"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            if self.drop_when_full:
+                self.dropped += 1
+                return
+            self._write([fields])
+            return
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write every pending row to the database"""
+        if self._queue is None:
+            return
+        with self._flush_lock:
+            while True:
+                rows = self._drain(self.batch_size)
+                if not rows:
+                    break
+                self._write(rows)
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        if self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=max(self.flush_interval * 2, 5))
+        self.flush()
+        self._close_connection()
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # Fresh buffer per process: rows queued before a fork belong to the parent
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-writer", daemon=True
+            )
+            self._pid = pid
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(f"{self.name} writer flush failed")
+            finally:
+                self._close_connection()
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        unwritten = self._insert(rows)
+        if unwritten:
+            self._spill(unwritten)
+            return
+        self._replay_spilled()
+
+    def _insert(self, rows):
+        """
+        Insert rows; returns those left unwritten because the database is unreachable
+
+        A batch rejected by a constraint (e.g. an FK to a user deleted while
+        the row was buffered) is retried one row at a time, and the rows that
+        still fail are dropped so they can't block every later replay.
+        """
+        try:
+            self.model.objects.bulk_create(
+                [self.model(**row) for row in rows], batch_size=self.batch_size
+            )
+            return []
+        except UNREACHABLE_ERRORS as e:
+            logger.error(f"{self.name} writer could not reach the database, spilling {len(rows)} rows: {e}")
+            return rows
+        except REJECTED_ROW_ERRORS as e:
+            logger.warning(f"{self.name} writer batch of {len(rows)} rejected, retrying row by row: {e}")
+
+        for index, row in enumerate(rows):
+            try:
+                with transaction.atomic():
+                    self.model(**row).save(force_insert=True)
+            except UNREACHABLE_ERRORS as e:
+                logger.error(f"{self.name} writer lost the database, spilling {len(rows) - index} rows: {e}")
+                return rows[index:]
+            except REJECTED_ROW_ERRORS as e:
+                self.rejected += 1
+                logger.error(f"{self.name} writer dropped a row the database rejected: {e}")
+        return []
+
+    def _close_connection(self):
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+    # ──────── Spill-to-disk fallback ────────
+
+    def _spill(self, rows):
+        if not self.spill_dir:
+            logger.error(f"{self.name} writer has no spill directory, {len(rows)} rows lost")
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"{self.name}-{os.getpid()}.jsonl")
+            with open(path, 'ab') as handle:
+                for row in rows:
+                    handle.write(orjson.dumps(row, default=str) + b'\n')
+        except OSError:
+            logger.exception(f"{self.name} writer failed to spill {len(rows)} rows")
+
+    def _spilled_files(self):
+        """Spill files plus claims left behind by workers that died mid-replay"""
+        pattern = os.path.join(self.spill_dir, f"{self.name}-*.jsonl")
+        paths = glob.glob(pattern)
+        for path in glob.glob(f"{pattern}.replaying-*"):
+            pid = path.rpartition('.replaying-')[2]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                paths.append(path)
+        return paths
+
+    def _replay_spilled(self):
+        if not self.spill_dir:
+            return
+        for path in self._spilled_files():
+            # Claim the file so only one worker replays it
+            claimed = f"{path.partition('.replaying-')[0]}.replaying-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+
+            with open(claimed, 'rb') as handle:
+                rows = [self._decode(line) for line in handle if line.strip()]
+            for start in range(0, len(rows), self.batch_size):
+                unwritten = self._insert(rows[start:start + self.batch_size])
+                if unwritten:
+                    # Keep the remainder for the next successful flush
+                    self._spill(unwritten + rows[start + self.batch_size:])
+                    os.remove(claimed)
+                    return
+            os.remove(claimed)
+            logger.info(f"{self.name} writer replayed {len(rows)} spilled rows")
+
+    def _decode(self, line):
+        row = orjson.loads(line)
+        for name in self._datetime_fields:
+            if isinstance(row.get(name), str):
+                row[name] = parse_datetime(row[name])
+        return row
@@ -0,0 +1,230 @@
+"""
+Bulk anonymization and deletion of user data
+Set-based, chunked statements over batches of users, with resumable progress in DataDeletionRun
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from health_app.health_records import invalidate_chat_history, invalidate_health_record
+from health_app.models import (
+    AIDiagnosisResponse,
+    ChatLog,
+    ConversationMemory,
+    DataDeletionRun,
+    DataExportRequest,
+    UserActivityLog,
+    UserProfile,
+    UserSymptomLog,
+)
+from health_app.ratelimit import get_rate_limit_backend
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY = 'data_deletion_runs'
+UNFINISHED_STATUSES = ('PENDING', 'RUNNING', 'FAILED')
+
+
+def _settings():
+    return getattr(settings, 'DATA_DELETION_SETTINGS', {})
+
+
+def users_due_for_deletion(grace_days=None):
+    """Inactive users whose account deletion request is older than the grace period"""
+    grace_days = grace_days if grace_days is not None else _settings().get('GRACE_DAYS', 30)
+    cutoff = timezone.now() - timedelta(days=grace_days)
+    return list(
+        get_user_model().objects.filter(
+            is_active=False,
+            securityauditlog__event_type='DATA_DELETION',
+            securityauditlog__timestamp__lt=cutoff,
+        ).order_by('pk').values_list('pk', flat=True).distinct()
+    )
+
+
+def chunked_delete(queryset, chunk_size=None):
+    """
+    DELETE the queryset's rows chunk_size primary keys per statement
+
+    Uses _raw_delete, so no instances are loaded and no signals fire;
+    callers clear foreign keys pointing at the rows first.
+    """
+    chunk_size = chunk_size or _settings().get('CHUNK_SIZE', 5000)
+    model = queryset.model
+    removed = 0
+    while True:
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return removed
+        removed += model._base_manager.filter(pk__in=pks)._raw_delete(model._base_manager.db)
+
+
+def _through_rows(model, field_name, user_ids, reverse=False):
+    """Rows of a many-to-many through table whose owning (or, with reverse, target) row belongs to user_ids"""
+    field = model._meta.get_field(field_name)
+    side = field.m2m_reverse_field_name() if reverse else field.m2m_field_name()
+    return field.remote_field.through.objects.filter(**{f"{side}__user_id__in": user_ids})
+
+
+def purge_vectors(user_ids):
+    if not _settings().get('PURGE_VECTORS', True):
+        return 0
+    from health_app.services.vector_store_service import get_vector_store
+    return get_vector_store().delete_users_conversations(
+        user_ids, batch_size=_settings().get('VECTOR_BATCH_SIZE', 5000)
+    )
+
+
+def delete_files(user_ids):
+    """Delete chat images and finished export files from storage; returns files removed"""
+    removed = 0
+    for model, field_name in ((ChatLog, 'image'), (DataExportRequest, 'file_path')):
+        storage = model._meta.get_field(field_name).storage
+        names = (
+            model.objects.filter(user_id__in=user_ids)
+            .exclude(**{field_name: ''}).exclude(**{f"{field_name}__isnull": True})
+            .values_list(field_name, flat=True)
+        )
+        for name in names.iterator(chunk_size=_settings().get('CHUNK_SIZE', 5000)):
+            try:
+                storage.delete(name)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Could not delete {name}: {e}")
+    return removed
+
+
+def anonymize_users(user_ids):
+    """Strip PII from the users while keeping their history for analytics"""
+    changed = 0
+    changed += ChatLog.objects.filter(user_id__in=user_ids).exclude(image='').exclude(
+        image__isnull=True
+    ).update(image=None)
+    changed += DataExportRequest.objects.filter(user_id__in=user_ids).update(file_path=None)
+    changed += UserProfile.objects.filter(user_id__in=user_ids).update(allergies='ANONYMIZED')
+
+    user_id = Cast('id', output_field=CharField())
+    changed += get_user_model().objects.filter(pk__in=user_ids).update(
+        email=Concat(Value('deleted_user_'), user_id, Value('@anonymized.com')),
+        full_name=Concat(Value('Deleted User '), user_id),
+        password=make_password(None),
+        is_active=False,
+    )
+    return changed
+
+
+def delete_users(user_ids):
+    """
+    Delete the users and everything they own
+
+    The large per-user tables go first in chunked DELETEs; the final
+    user delete then only finds small or empty relations to cascade.
+    """
+    changed = 0
+    changed += ChatLog.objects.filter(related_message__user_id__in=user_ids).update(related_message=None)
+    changed += ChatLog.objects.filter(diagnosis__user_id__in=user_ids).update(diagnosis=None)
+
+    for queryset in (
+        ConversationMemory.objects.filter(Q(user_id__in=user_ids) | Q(chat_log__user_id__in=user_ids)),
+        _through_rows(ChatLog, 'symptom_references', user_ids),
+        _through_rows(ChatLog, 'diagnosis_references', user_ids),
+        _through_rows(ChatLog, 'diagnosis_references', user_ids, reverse=True),
+        ChatLog.objects.filter(user_id__in=user_ids),
+        _through_rows(AIDiagnosisResponse, 'symptoms', user_ids),
+        _through_rows(AIDiagnosisResponse, 'probable_conditions', user_ids),
+        AIDiagnosisResponse.objects.filter(user_id__in=user_ids),
+        UserSymptomLog.objects.filter(user_id__in=user_ids),
+        UserActivityLog.objects.filter(user_id__in=user_ids),
+        DataExportRequest.objects.filter(user_id__in=user_ids),
+    ):
+        changed += chunked_delete(queryset)
+
+    changed += get_user_model().objects.filter(pk__in=user_ids).delete()[0]
+    return changed
+
+
+def process_users(action, user_ids):
+    """
+    Run one batch: vectors, then files, then database rows
+
+    Every step is idempotent, so a batch interrupted part-way is simply
+    run again on resume.
+    """
+    counts = {
+        'vectors_deleted': purge_vectors(user_ids),
+        'files_deleted': delete_files(user_ids),
+    }
+    if action == 'DELETE':
+        counts['rows_changed'] = delete_users(user_ids)
+    else:
+        counts['rows_changed'] = anonymize_users(user_ids)
+
+    for user_id in user_ids:
+        invalidate_health_record(user_id)
+        invalidate_chat_history(user_id)
+    return counts
+
+
+def start_run(action, user_ids):
+    return DataDeletionRun.objects.create(action=action, user_ids=sorted(set(user_ids)))
+
+
+def execute_run(run, batch_size=None):
+    """
+    Process the run's remaining users in batches, saving progress after each
+
+    Returns False without doing anything when another process holds the
+    deletion lease. Failures mark the run FAILED; it resumes from the last
+    completed batch next time.
+    """
+    batch_size = batch_size or _settings().get('USER_BATCH_SIZE', 100)
+    backend = get_rate_limit_backend()
+    token = backend.acquire_lease(LEASE_KEY, 1, _settings().get('LEASE_SECONDS', 3600))
+    if token is None:
+        logger.info(f"Deletion run {run.pk} skipped: another run is in progress")
+        return False
+
+    runs = DataDeletionRun.objects.filter(pk=run.pk)
+    try:
+        runs.update(status='RUNNING', error='')
+        run.refresh_from_db()
+        while run.processed < len(run.user_ids):
+            batch = run.user_ids[run.processed:run.processed + batch_size]
+            counts = process_users(run.action, batch)
+            runs.update(
+                processed=F('processed') + len(batch),
+                vectors_deleted=F('vectors_deleted') + counts['vectors_deleted'],
+                files_deleted=F('files_deleted') + counts['files_deleted'],
+                rows_changed=F('rows_changed') + counts['rows_changed'],
+                updated_at=timezone.now(),
+            )
+            run.refresh_from_db()
+        runs.update(status='COMPLETED', completed_at=timezone.now())
+    except Exception as e:
+        logger.exception(f"Deletion run {run.pk} failed after {run.processed} users")
+        runs.update(status='FAILED', error=str(e)[:1000])
+    finally:
+        backend.release_lease(LEASE_KEY, token)
+
+    run.refresh_from_db()
+    return True
+
+
+def resume_runs(batch_size=None):
+    """Finish every run left PENDING, RUNNING (crashed) or FAILED, oldest first"""
+    runs = list(DataDeletionRun.objects.filter(status__in=UNFINISHED_STATUSES).order_by('created_at'))
+    for run in runs:
+        started = time.monotonic()
+        if execute_run(run, batch_size=batch_size):
+            logger.info(
+                f"Deletion run {run.pk} {run.status}: {run.processed}/{len(run.user_ids)} users "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+    return runs
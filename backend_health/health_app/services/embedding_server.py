@@ -0,0 +1,361 @@
+"""
+Out-of-process embedding service
+A pool of model processes behind a Unix socket, batching requests from every web worker
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import numpy as np
+import orjson
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct('>I')
+# No server behind the socket, or it went away mid-request: retried, then local fallback.
+# ConnectionError covers refused, reset and broken pipe (and a socket closed mid-frame).
+UNREACHABLE_ERRORS = (FileNotFoundError, ConnectionError)
+_worker_model = None
+
+
+def _settings():
+    return getattr(settings, 'EMBEDDING_SERVER_SETTINGS', {})
+
+
+class EmbeddingServerError(Exception):
+    """The embedding server returned an error"""
+
+
+class EmbeddingServerUnavailable(EmbeddingServerError):
+    """The embedding server could not be reached"""
+
+
+# ──────── Wire format: length-prefixed frames ────────
+# Request:  JSON {"texts": [...]}
+# Response: JSON {"ok": true, "count": n, "dim": d} then n*d little-endian float32,
+#           or JSON {"ok": false, "error": "..."}
+
+def send_frame(sock, payload: bytes) -> None:
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock) -> bytes:
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    return _recv_exact(sock, _FRAME_HEADER.unpack(header)[0])
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(min(size - len(chunks), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        chunks.extend(chunk)
+    return bytes(chunks)
+
+
+# ──────── Model processes ────────
+
+def _init_model_worker(model_factory=None):
+    """Pool initializer: each process sets up Django and loads the model once"""
+    global _worker_model
+    if model_factory is not None:
+        _worker_model = model_factory()
+        return
+    import django
+    django.setup()
+    from health_app.services.embeddings import build_local_embeddings
+    _worker_model = build_local_embeddings()
+
+
+def _embed_in_worker(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_model.embed_documents(texts), dtype='<f4')
+
+
+class _Batcher:
+    """
+    Merge concurrent requests into batches for the process pool
+
+    A batch closes at MAX_BATCH texts or BATCH_WAIT_MS after its first
+    request; at most two batches per model process are in flight.
+
+    A model process that dies (OOM kill, segfault) breaks the whole pool:
+    the next batch starts a fresh one from new_executor, and batches lost
+    with the old pool are queued once more. If no new pool can be started,
+    on_fatal stops the server so clients fall back and a supervisor can
+    restart it.
+    """
+
+    def __init__(self, new_executor, workers, max_batch, batch_wait, on_fatal=None):
+        self.new_executor = new_executor
+        self.executor = new_executor()
+        self.on_fatal = on_fatal
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.pending = queue.Queue()
+        self.in_flight = threading.BoundedSemaphore(workers * 2)
+        self.thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self.thread.start()
+
+    def embed(self, texts: List[str], timeout: float) -> np.ndarray:
+        done = threading.Event()
+        slot = {'done': done, 'retried': False}
+        self.pending.put((texts, slot))
+        if not done.wait(timeout):
+            raise TimeoutError("Embedding request timed out")
+        if 'error' in slot:
+            raise slot['error']
+        return slot['result']
+
+    def _run(self):
+        while True:
+            requests = [self.pending.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.batch_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            self.in_flight.acquire()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                future = self._submit(texts)
+            except Exception as e:
+                self.in_flight.release()
+                self._fail(requests, e)
+                continue
+            future.add_done_callback(lambda f, requests=requests: self._deliver(f, requests))
+
+    def _submit(self, texts):
+        try:
+            return self.executor.submit(_embed_in_worker, texts)
+        except BrokenProcessPool:
+            logger.error("Embedding process pool is broken; starting a new one")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.executor = self.new_executor()
+        except Exception:
+            logger.exception("Could not restart the embedding process pool")
+            if self.on_fatal is not None:
+                self.on_fatal()
+            raise
+        return self.executor.submit(_embed_in_worker, texts)
+
+    @staticmethod
+    def _fail(requests, error):
+        for _texts, slot in requests:
+            slot['error'] = error
+            slot['done'].set()
+
+    def _deliver(self, future, requests):
+        self.in_flight.release()
+        try:
+            embeddings = future.result()
+        except BrokenProcessPool as e:
+            # Lost with a dead process; a batch that breaks the pool twice is failed, not retried forever
+            self._fail([(texts, slot) for texts, slot in requests if slot['retried']], e)
+            for texts, slot in requests:
+                if not slot['retried']:
+                    slot['retried'] = True
+                    self.pending.put((texts, slot))
+            return
+        except Exception as e:
+            self._fail(requests, e)
+            return
+        offset = 0
+        for texts, slot in requests:
+            slot['result'] = embeddings[offset:offset + len(texts)]
+            offset += len(texts)
+            slot['done'].set()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = orjson.loads(recv_frame(self.request))
+            except (ConnectionError, OSError):
+                return
+            if self.server.closing:
+                # Dropping the connection sends the client to another server or its fallback
+                return
+            try:
+                embeddings = self.server.batcher.embed(request['texts'], self.server.request_timeout)
+            except Exception as e:
+                logger.exception("Embedding batch failed")
+                frames = [orjson.dumps({'ok': False, 'error': str(e)})]
+            else:
+                count, dim = embeddings.shape if embeddings.size else (0, 0)
+                frames = [orjson.dumps({'ok': True, 'count': count, 'dim': dim}), embeddings.tobytes()]
+            try:
+                for frame in frames:
+                    send_frame(self.request, frame)
+            except OSError:
+                # Client went away mid-reply
+                return
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves embeddings to every web worker on the host
+
+    - WORKERS spawned processes each hold one copy of the model
+    - One thread per client connection; connections are long-lived
+    - Requests from all connections are batched before reaching the pool
+    - model_factory swaps in another model per process (picklable under
+      spawn, the default mp_context)
+    """
+
+    daemon_threads = True
+    # Unix sockets refuse connects (EAGAIN) once the backlog is full; every web thread may connect at once
+    request_queue_size = 256
+
+    def __init__(self, socket_path=None, workers=None, max_batch=None, batch_wait_ms=None,
+                 model_factory=None, mp_context=None):
+        config = _settings()
+        self.socket_path = socket_path or config.get('SOCKET_PATH')
+        self.workers = workers or config.get('WORKERS', 2)
+        self.request_timeout = config.get('TIMEOUT', 30)
+        self.closing = False
+        self.model_factory = model_factory
+        self.mp_context = mp_context or multiprocessing.get_context('spawn')
+
+        self.batcher = _Batcher(
+            self._new_executor,
+            self.workers,
+            max_batch or config.get('MAX_BATCH', 64),
+            (batch_wait_ms if batch_wait_ms is not None else config.get('BATCH_WAIT_MS', 5)) / 1000,
+            on_fatal=self._stop_soon,
+        )
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        super().__init__(self.socket_path, _RequestHandler)
+        os.chmod(self.socket_path, 0o660)
+
+    def _new_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self.mp_context,
+            initializer=_init_model_worker,
+            initargs=(self.model_factory,),
+        )
+        # Load the models up front so the first request doesn't pay for it
+        try:
+            list(executor.map(_embed_in_worker, [['warm up']] * self.workers))
+        except Exception:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor
+
+    def _stop_soon(self):
+        # shutdown() blocks until serve_forever returns, so it can't run on the batcher thread
+        self.closing = True
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self):
+        self.closing = True
+        super().server_close()
+        self.batcher.executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Embeddings client for the embedding server (EMBEDDING_BACKEND = 'remote')
+
+    Keeps one connection per thread. When the server is down and
+    FALLBACK_TO_LOCAL is set, it loads the model in-process instead of
+    failing the request; a server that is up but slower than TIMEOUT
+    raises EmbeddingServerError instead.
+    """
+
+    def __init__(self, socket_path=None, timeout=None, max_request=None, fallback=None):
+        config = _settings()
+        self.socket_path = socket_path or config.get('SOCKET_PATH')
+        self.timeout = timeout or config.get('TIMEOUT', 30)
+        self.max_request = max_request or config.get('MAX_REQUEST_TEXTS', 256)
+        self.fallback = config.get('FALLBACK_TO_LOCAL', True) if fallback is None else fallback
+        self._local = threading.local()
+        self._local_model = None
+        self._local_model_lock = threading.Lock()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        # One retry covers a connection the server dropped while idle
+        for attempt in (1, 2):
+            try:
+                sock = self._connection()
+                send_frame(sock, orjson.dumps({'texts': texts}))
+                header = orjson.loads(recv_frame(sock))
+                if not header['ok']:
+                    raise EmbeddingServerError(header['error'])
+                body = recv_frame(sock) if header['count'] else b''
+                return np.frombuffer(body, dtype='<f4').reshape(header['count'], header['dim'])
+            except UNREACHABLE_ERRORS as e:
+                self._close()
+                if attempt == 2:
+                    raise EmbeddingServerUnavailable(f"Embedding server unavailable: {e}") from e
+            except OSError as e:
+                # Read timeouts land here: the server is up but busy, and resending the batch
+                # or loading a model into this worker would only add load
+                self._close()
+                raise EmbeddingServerError(f"Embedding request failed: {e}") from e
+
+    def _embed_locally(self, texts: List[str]) -> List[List[float]]:
+        with self._local_model_lock:
+            if self._local_model is None:
+                logger.warning("Embedding server unreachable; loading the model in this process")
+                from health_app.services.embeddings import build_local_embeddings
+                self._local_model = build_local_embeddings()
+        return self._local_model.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            embeddings = []
+            for start in range(0, len(texts), self.max_request):
+                embeddings.extend(self._request(texts[start:start + self.max_request]).tolist())
+            return embeddings
+        except EmbeddingServerUnavailable:
+            if not self.fallback:
+                raise
+            return self._embed_locally(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,150 @@
+"""
+Shared embedding model for the conversation store and medical knowledge base
+Loads the model once per process and records embedding batch sizes
+"""
+import os
+from typing import List
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+from health_app.metrics import EMBEDDING_BATCH_SIZE, metrics_enabled
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """Embeddings wrapper that records the batch size of every call"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if metrics_enabled():
+            EMBEDDING_BATCH_SIZE.observe(len(texts), operation='documents')
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if metrics_enabled():
+            EMBEDDING_BATCH_SIZE.observe(1, operation='query')
+        return self.embeddings.embed_query(text)
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    Sentence-transformers MiniLM run through ONNX Runtime
+
+    Reproduces the sentence-transformers pipeline (WordPiece tokenizer,
+    256-token truncation, attention-masked mean pooling, L2 normalisation)
+    without importing PyTorch. Texts are batched by length so padding
+    stays short; results come back in input order.
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, threads: int = 2,
+                 batch_size: int = 32, max_length: int = 256):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        # tokenizer.json ships fixed 128-token padding; match sentence-transformers instead
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id('[PAD]') or 0, pad_token='[PAD]')
+        self.batch_size = batch_size
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., np.newaxis].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Same newline handling as HuggingFaceEmbeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed([texts[i] for i in batch])):
+                embeddings[i] = vector.tolist()
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _onnx_file(config: dict, name: str) -> str:
+    """A file of the model repo: from ONNX_MODEL_DIR when set, else the Hugging Face cache"""
+    model_dir = config.get('ONNX_MODEL_DIR')
+    if model_dir:
+        return os.path.join(model_dir, name)
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(config.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'), name)
+
+
+def build_onnx_embeddings(config: dict = None) -> OnnxMiniLMEmbeddings:
+    """ONNX Runtime MiniLM configured from VECTOR_STORE_SETTINGS"""
+    config = config if config is not None else getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+    if config.get('ONNX_QUANTIZED', False):
+        model_file = config.get('ONNX_QUANTIZED_MODEL_FILE', 'onnx/model_quint8_avx2.onnx')
+    else:
+        model_file = config.get('ONNX_MODEL_FILE', 'onnx/model.onnx')
+    return OnnxMiniLMEmbeddings(
+        _onnx_file(config, model_file),
+        _onnx_file(config, 'tokenizer.json'),
+        threads=config.get('ONNX_THREADS', 2),
+        batch_size=config.get('EMBEDDING_BATCH_SIZE', 32),
+        max_length=config.get('EMBEDDING_MAX_LENGTH', 256),
+    )
+
+
+def build_local_embeddings(config: dict = None) -> Embeddings:
+    """
+    The in-process model for EMBEDDING_BACKEND: ONNX Runtime or sentence-transformers
+
+    With the 'remote' backend this is what the embedding server (and the
+    client's fallback) loads, chosen by EMBEDDING_SERVER_SETTINGS['MODEL_BACKEND'].
+    """
+    config = config if config is not None else getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+    backend = config.get('EMBEDDING_BACKEND', 'huggingface')
+    if backend == 'remote':
+        backend = getattr(settings, 'EMBEDDING_SERVER_SETTINGS', {}).get('MODEL_BACKEND', 'onnx')
+    if backend == 'onnx':
+        return build_onnx_embeddings(config)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=config.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+    )
+
+
+_embedding_model = None
+
+
+def get_embedding_model() -> Embeddings:
+    """Get or create the shared embedding model singleton"""
+    global _embedding_model
+    if _embedding_model is None:
+        config = getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+        if config.get('EMBEDDING_BACKEND', 'huggingface') == 'remote':
+            from health_app.services.embedding_server import RemoteEmbeddings
+            model = RemoteEmbeddings()
+        else:
+            model = build_local_embeddings(config)
+        _embedding_model = InstrumentedEmbeddings(model)
+    return _embedding_model
@@ -0,0 +1,305 @@
+"""
+Background runner for DataExportRequest jobs
+Claims pending exports with SELECT ... FOR UPDATE SKIP LOCKED and writes the files to storage
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from health_app.gdpr import EXPORT_CONTENT_TYPES, DataExporter
+from health_app.models import DataExportRequest
+from health_app.ratelimit import get_rate_limit_backend
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('PENDING', 'PROCESSING')
+LEASE_KEY = 'export_jobs'
+# Shown to the user; the exception itself goes to the log only
+FAILED_MESSAGE = 'Export failed, please request a new export'
+
+
+def _settings():
+    return getattr(settings, 'EXPORT_JOB_SETTINGS', {})
+
+
+def request_export(user, export_format, compression=''):
+    """
+    Queue an export for the user, or return their matching job still in progress
+    Wakes this process's runner when RUN_IN_PROCESS is enabled
+    """
+    with transaction.atomic():
+        job = DataExportRequest.objects.select_for_update().filter(
+            user=user, export_format=export_format, compression=compression, status__in=ACTIVE_STATUSES
+        ).first()
+        if job is None:
+            job = DataExportRequest.objects.create(
+                user=user, export_format=export_format, compression=compression
+            )
+
+    if _settings().get('RUN_IN_PROCESS', True):
+        transaction.on_commit(get_export_runner().wake)
+    return job
+
+
+def claim_job(worker_id):
+    """
+    Move the oldest pending job to PROCESSING for this worker
+
+    SKIP LOCKED lets concurrent runners pick different rows without waiting
+    on each other; the guarded UPDATE keeps the claim exclusive on databases
+    without row locks (SQLite).
+    """
+    with transaction.atomic():
+        job = (
+            DataExportRequest.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('requested_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = DataExportRequest.objects.filter(pk=job.pk, status='PENDING').update(
+            status='PROCESSING',
+            started_at=timezone.now(),
+            worker=worker_id,
+            progress=0,
+            attempts=F('attempts') + 1,
+            error='',
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def reclaim_stale_jobs():
+    """Requeue jobs whose worker died mid-export; give up after MAX_ATTEMPTS"""
+    config = _settings()
+    cutoff = timezone.now() - timedelta(seconds=config.get('STALE_AFTER', 1800))
+    stale = DataExportRequest.objects.filter(status='PROCESSING', started_at__lt=cutoff)
+
+    failed = stale.filter(attempts__gte=config.get('MAX_ATTEMPTS', 3)).update(
+        status='FAILED', completed_at=timezone.now(), error='Export timed out'
+    )
+    requeued = stale.update(status='PENDING', worker='')
+    if failed or requeued:
+        logger.warning(f"Export jobs reclaimed: {requeued} requeued, {failed} failed")
+    return requeued
+
+
+class _ProgressReporter:
+    """Write the job's percent complete at most every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, job, total):
+        self.job = job
+        self.total = max(total, 1)
+        self.interval = _settings().get('PROGRESS_INTERVAL', 1.0)
+        self.last_percent = 0
+        self.last_write = 0.0
+
+    def __call__(self, rows_written):
+        # 99 at most: the job reaches 100 only once the file is stored
+        percent = min(99, rows_written * 100 // self.total)
+        now = time.monotonic()
+        if percent > self.last_percent and now - self.last_write >= self.interval:
+            DataExportRequest.objects.filter(pk=self.job.pk, worker=self.job.worker).update(progress=percent)
+            self.last_percent = percent
+            self.last_write = now
+
+
+def run_job(job):
+    """Generate the export into a temp file, store it and mark the job COMPLETED or FAILED"""
+    user = job.user
+    owned = DataExportRequest.objects.filter(pk=job.pk, status='PROCESSING', worker=job.worker)
+    _content_type, extension = EXPORT_CONTENT_TYPES[job.compression or None]
+    if job.export_format == 'PDF':
+        extension = '.pdf'
+    else:
+        extension = '.json' + extension
+
+    try:
+        with tempfile.TemporaryFile() as tmp:
+            if job.export_format == 'PDF':
+                progress = _ProgressReporter(job, DataExporter.count_user_pdf_rows(user))
+                DataExporter.write_user_data_pdf(user, tmp, progress=progress)
+            else:
+                progress = _ProgressReporter(job, DataExporter.count_user_rows(user))
+                DataExporter.write_user_data_json(user, tmp, job.compression or None, progress=progress)
+            tmp.seek(0)
+            job.file_path.save(f"health-data-{user.pk}-{job.pk}{extension}", File(tmp), save=False)
+    except Exception:
+        logger.exception(f"Export job {job.pk} failed")
+        owned.update(status='FAILED', completed_at=timezone.now(), error=FAILED_MESSAGE)
+        return False
+
+    if not owned.update(
+        status='COMPLETED', completed_at=timezone.now(), progress=100, file_path=job.file_path.name
+    ):
+        # Reclaimed as stale while we were working; the newer attempt owns the job
+        job.file_path.delete(save=False)
+        return False
+    return True
+
+
+def expire_exports(cutoff, chunk_size=500):
+    """
+    Delete the files of exports completed before cutoff and mark them EXPIRED
+
+    Rows whose file can't be deleted stay COMPLETED for the next run.
+
+    Returns:
+        Number of exports expired
+    """
+    storage = DataExportRequest._meta.get_field('file_path').storage
+    expired = 0
+    last_pk = 0
+    while True:
+        jobs = list(
+            DataExportRequest.objects.filter(status='COMPLETED', completed_at__lt=cutoff, pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'file_path')[:chunk_size]
+        )
+        if not jobs:
+            return expired
+        last_pk = jobs[-1][0]
+
+        deleted = []
+        for pk, name in jobs:
+            try:
+                if name:
+                    storage.delete(name)
+            except OSError as e:
+                logger.warning(f"Could not delete export file {name}: {e}")
+                continue
+            deleted.append(pk)
+        expired += DataExportRequest.objects.filter(pk__in=deleted, status='COMPLETED').update(
+            status='EXPIRED', file_path=''
+        )
+
+
+class ExportJobRunner:
+    """
+    Polls for pending export jobs and runs them on a small thread pool
+
+    - WORKERS threads per runner; MAX_CONCURRENT exports across every runner
+      on the rate limit backend (a lease per running export)
+    - Used in-process by web workers (RUN_IN_PROCESS) and by the
+      run_export_jobs management command for a dedicated worker
+    - wake() skips the poll delay when a job has just been queued
+    """
+
+    def __init__(self, workers=None, poll_interval=None, max_concurrent=None):
+        config = _settings()
+        self.workers = workers or config.get('WORKERS', 2)
+        self.poll_interval = poll_interval or config.get('POLL_INTERVAL', 5.0)
+        self.max_concurrent = max_concurrent or config.get('MAX_CONCURRENT', 2)
+        self.lease_seconds = config.get('STALE_AFTER', 1800)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._pid = None
+        self._thread = None
+        self._executor = None
+
+    def run_once(self):
+        """Claim as many jobs as free slots allow and submit them; returns how many were started"""
+        reclaim_stale_jobs()
+        started = 0
+        backend = get_rate_limit_backend()
+
+        while True:
+            with self._lock:
+                if self._running >= self.workers:
+                    break
+            token = backend.acquire_lease(LEASE_KEY, self.max_concurrent, self.lease_seconds)
+            if token is None:
+                break
+            job = claim_job(self.worker_id)
+            if job is None:
+                backend.release_lease(LEASE_KEY, token)
+                break
+
+            with self._lock:
+                self._running += 1
+            self._get_executor().submit(self._execute, job, token)
+            started += 1
+        return started
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._running > 0
+
+    def serve_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Export job runner poll failed")
+            finally:
+                close_old_connections()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the polling thread once per process (re-started after a fork)"""
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}"
+            self._executor = None
+            self._running = 0
+            self._thread = threading.Thread(
+                target=self.serve_forever, name='export-job-runner', daemon=True
+            )
+            self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export-job')
+        return self._executor
+
+    def _execute(self, job, token):
+        try:
+            run_job(job)
+        except Exception:
+            logger.exception(f"Export job {job.pk} crashed")
+        finally:
+            get_rate_limit_backend().release_lease(LEASE_KEY, token)
+            with self._lock:
+                self._running -= 1
+            connection.close()
+            self._wake.set()
+
+
+_runner = None
+
+
+def get_export_runner():
+    """Get or create the in-process export job runner singleton"""
+    global _runner
+    if _runner is None:
+        _runner = ExportJobRunner()
+    return _runner
@@ -0,0 +1,571 @@
+"""
+FAISS vector backend for conversation memory
+ID-mapped IVF/HNSW index memory-mapped from disk, with metadata and vectors in a SQLite side table
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+import orjson
+from django.conf import settings
+
+from health_app.metrics import FAISS_QUERY_LATENCY
+from health_app.ratelimit import get_rate_limit_backend
+from health_app.services.embeddings import get_embedding_model
+from health_app.services.vector_store_service import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'conversations.faiss'
+DATABASE_FILE = 'conversations.sqlite3'
+COMPACT_LEASE_KEY = 'faiss_compact'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    role TEXT,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    chat_log_id INTEGER,
+    metadata TEXT NOT NULL,
+    embedding BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vectors_user_session ON vectors (user_id, session_id);
+CREATE INDEX IF NOT EXISTS vectors_user_role ON vectors (user_id, role);
+CREATE INDEX IF NOT EXISTS vectors_created_at ON vectors (created_at);
+CREATE INDEX IF NOT EXISTS vectors_chat_log ON vectors (chat_log_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _settings():
+    return getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+
+
+def _pq_subquantizers(dim: int, wanted: int) -> int:
+    """Largest sub-quantizer count <= wanted that divides dim (PQ needs equal sub-vectors)"""
+    return next(m for m in range(min(wanted, dim), 0, -1) if dim % m == 0)
+
+
+def new_index(dim: int, count: int, index_type: str = 'IVF', quantization: Optional[str] = None,
+              hnsw_m: int = 32, pq_m: int = 48, ef_construction: int = 80):
+    """
+    Empty, ID-mapped index for count vectors of dim dimensions
+
+    quantization None keeps float32 codes; 'int8' stores one byte per
+    dimension (4x smaller); 'pq' stores pq_m bytes per vector. PQ needs
+    ~10k training vectors, so smaller stores fall back to int8.
+    """
+    if quantization == 'pq' and count < 256 * 39:
+        quantization = 'int8'
+    pq_m = _pq_subquantizers(dim, pq_m)
+
+    if index_type == 'HNSW':
+        if quantization == 'int8':
+            hnsw = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, hnsw_m)
+        elif quantization == 'pq':
+            hnsw = faiss.IndexHNSWPQ(dim, pq_m, hnsw_m)
+        else:
+            hnsw = faiss.IndexHNSWFlat(dim, hnsw_m)
+        hnsw.hnsw.efConstruction = ef_construction
+        return faiss.IndexIDMap2(hnsw)
+
+    # faiss wants ~39 training points per list; tiny stores skip the IVF layer
+    nlist = min(int(4 * math.sqrt(count)), count // 39)
+    if nlist < 8:
+        if quantization:
+            return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit))
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if quantization == 'int8':
+        return faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(dim), dim, nlist, faiss.ScalarQuantizer.QT_8bit)
+    if quantization == 'pq':
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, pq_m, 8)
+    return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+
+
+def training_size(index) -> int:
+    """Vectors to sample for train(): enough for the IVF lists and the 256-centroid PQ/SQ codebooks"""
+    try:
+        nlist = faiss.extract_index_ivf(index).nlist
+    except RuntimeError:
+        nlist = 0
+    return max(nlist * 256, 256 * 256)
+
+
+def search_params(index, selector=None, nprobe: int = 16, ef_search: int = 128):
+    """SearchParameters of the right subtype for the index, optionally restricted to selector's ids"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(nprobe, ivf.nlist))
+    except RuntimeError:
+        pass
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+
+def exact_distances(query_vector: np.ndarray, ids: np.ndarray, matrix: np.ndarray, k: int):
+    """[(id, squared L2 distance)] of the k nearest rows of matrix, nearest first"""
+    distances = ((matrix - query_vector) ** 2).sum(axis=1)
+    k = min(k, len(ids))
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    return [(int(ids[i]), float(distances[i])) for i in top]
+
+
+class FaissVectorStore(ConversationStore):
+    """
+    Conversation vectors in FAISS, selected with VECTOR_STORE_SETTINGS['BACKEND'] = 'faiss'
+
+    - The SQLite side table is the source of truth: metadata, filters and
+      the float32 vector of every row. Deleting a row there removes it
+      from every search, so the FAISS files never need in-place deletes.
+    - Searches are always per user. Users with few vectors are scored
+      exactly from the side table; larger sets search the index with an
+      IDSelector restricted to the user's live ids.
+    - The base index (IVF or HNSW) is written by merge() (run from
+      manage.py merge_vector_index) or compact() and opened memory-mapped
+      read-only; rows added since live in a small in-memory flat delta
+      that every process tops up from the side table.
+    - FAISS_QUANTIZATION ('int8' or 'pq') compresses the base index codes;
+      its top k * FAISS_RERANK_FACTOR candidates are re-scored against
+      the exact float32 vectors in the side table.
+    """
+
+    def __init__(self):
+        config = _settings()
+        self.directory = config.get('FAISS_PATH') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            'faiss_db'
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.database_path = os.path.join(self.directory, DATABASE_FILE)
+
+        self.embeddings = get_embedding_model()
+        self.base_collection_name = self.collection_name = config.get('COLLECTION_NAME', 'health_conversations')
+        self.index_type = config.get('FAISS_INDEX', 'IVF')
+        self.exact_limit = config.get('FAISS_EXACT_LIMIT', 4096)
+        self.nprobe = config.get('FAISS_NPROBE', 16)
+        self.hnsw_m = config.get('FAISS_HNSW_M', 32)
+        self.ef_search = config.get('FAISS_EF_SEARCH', 128)
+        self.merge_after = config.get('FAISS_MERGE_AFTER', 50000)
+        self.quantization = config.get('FAISS_QUANTIZATION')
+        self.pq_m = config.get('FAISS_PQ_M', 48)
+        self.rerank_factor = config.get('FAISS_RERANK_FACTOR', 4)
+
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._base = None
+        self._base_generation = None
+        self._base_max_id = 0
+        self._delta = None
+        self._delta_max_id = 0
+
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    # ──────── Side table ────────
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets searches read while another process writes"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.database_path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._db().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, db: sqlite3.Connection, **values) -> None:
+        db.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def _dimension(self) -> Optional[int]:
+        dim = self._meta('dimension')
+        return int(dim) if dim else None
+
+    # ──────── Public API (matches VectorStoreService) ────────
+
+    def add_conversation(
+        self,
+        user_id: int,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Dict[str, Any] = None
+    ) -> None:
+        """
+        Add a conversation message to the vector store
+
+        Args:
+            user_id: User ID
+            session_id: Conversation session ID
+            role: Message role (user/assistant)
+            content: Message content
+            metadata: Additional metadata
+        """
+        if not content or not content.strip():
+            return
+
+        doc_metadata = {
+            "user_id": str(user_id),
+            "session_id": session_id,
+            "role": role,
+            "created_at": time.time(),
+            **(metadata or {})
+        }
+        vector = np.asarray(self.embeddings.embed_documents([content])[0], dtype=np.float32)
+
+        with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='add'):
+            with self._db() as db:
+                if self._dimension() is None:
+                    self._set_meta(db, dimension=vector.shape[0])
+                db.execute(
+                    'INSERT INTO vectors (user_id, session_id, role, content, created_at, chat_log_id, metadata, embedding) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        doc_metadata['user_id'], session_id, role, content, doc_metadata['created_at'],
+                        doc_metadata.get('chat_log_id'), orjson.dumps(doc_metadata, default=str).decode(),
+                        vector.tobytes(),
+                    )
+                )
+
+    def search_similar_conversations(
+        self,
+        user_id: int,
+        query: str,
+        k: int = 5,
+        filter_role: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for similar past conversations
+
+        Args:
+            user_id: User ID to filter conversations
+            query: Search query
+            k: Number of results to return
+            filter_role: Optional role filter (user/assistant)
+
+        Returns:
+            List of similar conversation documents
+        """
+        if not query or not query.strip():
+            return []
+
+        try:
+            query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='search'):
+                hits = self._search(query_vector, str(user_id), filter_role, k)
+                rows = self._rows([vector_id for vector_id, _ in hits])
+
+            return [
+                {
+                    "content": rows[vector_id][0],
+                    "metadata": orjson.loads(rows[vector_id][1]),
+                    "similarity_score": float(distance)
+                }
+                for vector_id, distance in hits if vector_id in rows
+            ]
+        except Exception as e:
+            print(f"Error searching conversations: {e}")
+            return []
+
+    def get_session_messages(self, user_id: int, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Get all messages from a specific session
+
+        Args:
+            user_id: User ID
+            session_id: Session ID
+
+        Returns:
+            List of message dictionaries with content, role, and timestamp
+        """
+        try:
+            with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='get'):
+                rows = self._db().execute(
+                    'SELECT content, metadata FROM vectors WHERE user_id = ? AND session_id = ? ORDER BY id',
+                    (str(user_id), session_id)
+                ).fetchall()
+
+            messages = []
+            for content, raw_metadata in rows:
+                metadata = orjson.loads(raw_metadata)
+                messages.append({
+                    'content': content,
+                    'role': metadata.get('role', 'unknown'),
+                    'timestamp': metadata.get('timestamp', ''),
+                    'metadata': metadata
+                })
+
+            # Sort by timestamp if available
+            messages.sort(key=lambda x: x.get('timestamp', ''))
+            return messages
+
+        except Exception as e:
+            print(f"Error getting session messages: {e}")
+            return []
+
+    def delete_users_conversations(self, user_ids: List[int], batch_size: int = 5000) -> int:
+        """Delete every conversation vector belonging to any of the users; returns the count"""
+        user_ids = [str(user_id) for user_id in user_ids]
+        placeholders = ','.join('?' * len(user_ids))
+        return self._delete_where(f'user_id IN ({placeholders})', user_ids, batch_size)
+
+    def delete_conversations_before(self, cutoff: float, batch_size: int = 5000) -> int:
+        """Delete conversation vectors added before cutoff (epoch seconds); returns the count"""
+        return self._delete_where('created_at < ?', [cutoff], batch_size)
+
+    def delete_chat_log_conversations(self, chat_log_ids: List[int], batch_size: int = 5000) -> int:
+        """Delete vectors stored for specific chat log rows; returns the count"""
+        chat_log_ids = list(chat_log_ids)
+        placeholders = ','.join('?' * len(chat_log_ids))
+        return self._delete_where(f'chat_log_id IN ({placeholders})', chat_log_ids, batch_size)
+
+    def pending_merge(self) -> int:
+        """Rows added since the base index was built (searched through the flat delta)"""
+        max_id = self._db().execute('SELECT COALESCE(MAX(id), 0) FROM vectors').fetchone()[0]
+        return max_id - int(self._meta('base_max_id', '0'))
+
+    def merge(self, force: bool = False) -> bool:
+        """
+        Fold the delta into a new base index once FAISS_MERGE_AFTER rows are pending
+
+        The whole index is built in this process's memory, so this runs
+        from manage.py merge_vector_index, never from a web worker. The
+        side table is only read, so writers are not blocked.
+
+        Returns:
+            Whether a new base index was written
+        """
+        if not force and (not self.merge_after or self.pending_merge() < self.merge_after):
+            return False
+        with self._maintenance_lease() as token:
+            if token is None:
+                return False
+            with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='merge'):
+                self._build_base()
+            return True
+
+    def compact(self) -> int:
+        """
+        Rebuild the base index from the live rows and VACUUM the side table
+
+        Deleted rows drop out of the index files here. VACUUM holds the
+        SQLite write lock throughout, so this belongs to explicit
+        maintenance (retention, rebuilds), not the routine merge. Another
+        process merging or compacting at the same time makes this a no-op.
+
+        Returns:
+            Bytes reclaimed
+        """
+        with self._maintenance_lease() as token:
+            if token is None:
+                return 0
+            before = self._disk_usage()
+            with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='compact'):
+                self._build_base()
+                db = self._db()
+                db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                db.execute('VACUUM')
+            return before - self._disk_usage()
+
+    @contextmanager
+    def _maintenance_lease(self):
+        """Cross-process lease shared by merge() and compact(); yields None when another holds it"""
+        backend = get_rate_limit_backend()
+        token = backend.acquire_lease(COMPACT_LEASE_KEY, 1, _settings().get('FAISS_COMPACT_LEASE', 3600))
+        try:
+            yield token
+        finally:
+            if token is not None:
+                backend.release_lease(COMPACT_LEASE_KEY, token)
+
+    # ──────── Search ────────
+
+    def _search(self, query_vector: np.ndarray, user_id: str, role: Optional[str], k: int):
+        """[(vector id, squared L2 distance)] nearest first, restricted to the user (and role)"""
+        where, params = 'user_id = ?', [user_id]
+        if role:
+            where, params = where + ' AND role = ?', params + [role]
+        db = self._db()
+
+        count = db.execute(f'SELECT COUNT(*) FROM vectors WHERE {where}', params).fetchone()[0]
+        if count == 0:
+            return []
+        if count <= self.exact_limit:
+            rows = db.execute(f'SELECT id, embedding FROM vectors WHERE {where}', params).fetchall()
+            return self._exact(query_vector, rows, k)
+
+        ids = np.fromiter(
+            (row[0] for row in db.execute(f'SELECT id FROM vectors WHERE {where}', params)),
+            dtype=np.int64, count=count
+        )
+        selector = faiss.IDSelectorBatch(ids)
+        query = query_vector.reshape(1, -1)
+
+        hits = []
+        with self._lock:
+            self._sync()
+            if self._base is not None and self._base.ntotal:
+                candidates = k * self.rerank_factor if self.quantization else k
+                params = search_params(self._base, selector, self.nprobe, self.ef_search)
+                hits.extend(self._index_search(self._base, query, candidates, params))
+            if self._delta is not None and self._delta.ntotal:
+                hits.extend(self._index_search(self._delta, query, k, faiss.SearchParameters(sel=selector)))
+
+        if self.quantization and hits:
+            # Quantized distances only rank candidates; scores come from the float vectors
+            return self._rerank(query_vector, [vector_id for vector_id, _ in hits], k)
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    @staticmethod
+    def _index_search(index, query, k, params):
+        distances, labels = index.search(query, k, params=params)
+        return [(int(label), float(distance)) for label, distance in zip(labels[0], distances[0]) if label != -1]
+
+    def _rerank(self, query_vector: np.ndarray, ids: List[int], k: int):
+        placeholders = ','.join('?' * len(ids))
+        rows = self._db().execute(
+            f'SELECT id, embedding FROM vectors WHERE id IN ({placeholders})', ids
+        ).fetchall()
+        return self._exact(query_vector, rows, k) if rows else []
+
+    @staticmethod
+    def _exact(query_vector: np.ndarray, rows, k: int):
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        matrix = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        return exact_distances(query_vector, ids, matrix, k)
+
+    def _rows(self, ids: List[int]):
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        return {
+            row[0]: (row[1], row[2])
+            for row in self._db().execute(
+                f'SELECT id, content, metadata FROM vectors WHERE id IN ({placeholders})', ids
+            )
+        }
+
+    # ──────── Base and delta indexes ────────
+
+    def _sync(self) -> None:
+        """Reopen the base after another process compacted, then add rows newer than the delta"""
+        generation = self._meta('generation', '0')
+        if generation != self._base_generation:
+            self._base = self._read_base()
+            self._base_generation = generation
+            self._base_max_id = int(self._meta('base_max_id', '0'))
+            self._delta = None
+            self._delta_max_id = self._base_max_id
+
+        dim = self._dimension()
+        if dim is None:
+            return
+        if self._delta is None:
+            self._delta = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+        rows = self._db().execute(
+            'SELECT id, embedding FROM vectors WHERE id > ? ORDER BY id', (self._delta_max_id,)
+        ).fetchall()
+        if rows:
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            matrix = np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+            self._delta.add_with_ids(matrix, ids)
+            self._delta_max_id = int(ids[-1])
+
+    def _read_base(self):
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            return faiss.read_index(
+                self.index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            # Index types without mmap support are read into memory
+            return faiss.read_index(self.index_path)
+
+    def _build_base(self) -> None:
+        db = self._db()
+        dim = self._dimension()
+        max_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM vectors').fetchone()[0]
+        count = db.execute('SELECT COUNT(*) FROM vectors WHERE id <= ?', (max_id,)).fetchone()[0]
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+
+        if dim is not None and count:
+            index = new_index(
+                dim, count, self.index_type, self.quantization, self.hnsw_m, self.pq_m,
+                _settings().get('FAISS_EF_CONSTRUCTION', 80),
+            )
+            if not index.is_trained:
+                sample = db.execute(
+                    'SELECT embedding FROM vectors WHERE id <= ? ORDER BY RANDOM() LIMIT ?',
+                    (max_id, training_size(index))
+                ).fetchall()
+                index.train(np.frombuffer(b''.join(row[0] for row in sample), dtype=np.float32).reshape(-1, dim))
+
+            last_id = 0
+            chunk_size = _settings().get('FAISS_BUILD_CHUNK', 50000)
+            while True:
+                rows = db.execute(
+                    'SELECT id, embedding FROM vectors WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                    (last_id, max_id, chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+                index.add_with_ids(
+                    np.frombuffer(b''.join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dim), ids
+                )
+                last_id = int(ids[-1])
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+        elif os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+        with db:
+            generation = int(self._meta('generation', '0')) + 1
+            self._set_meta(db, generation=generation, base_max_id=max_id)
+        logger.info(f"FAISS base index rebuilt: {count} vectors, generation {generation}")
+
+    def _delete_where(self, where: str, params: list, batch_size: int) -> int:
+        removed = 0
+        db = self._db()
+        while True:
+            with FAISS_QUERY_LATENCY.time(collection=self.base_collection_name, operation='delete'):
+                with db:
+                    deleted = db.execute(
+                        f'DELETE FROM vectors WHERE id IN (SELECT id FROM vectors WHERE {where} LIMIT ?)',
+                        [*params, batch_size]
+                    ).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+    def _disk_usage(self) -> int:
+        total = 0
+        for name in os.listdir(self.directory):
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return total
@@ -5,11 +5,13 @@ Provides access to curated health research papers and medical literature
 import os
 from typing import List, Dict, Any, Optional
 from django.conf import settings
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from health_app.metrics import CHROMA_QUERY_LATENCY
+from health_app.services.embeddings import get_embedding_model
+
 
 class MedicalKnowledgeBase:
     """Medical research papers and health literature knowledge base using RAG"""
@@ -731,9 +733,7 @@ class MedicalKnowledgeBase:
         )
         
         # Use HuggingFace embeddings (free, local, no API key needed)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.embeddings = get_embedding_model()
         
         self.vectorstore = None
         self._initialize_knowledge_base()
@@ -816,11 +816,12 @@ class MedicalKnowledgeBase:
             if category:
                 where_filter = {"category": category}
             
-            results = self.vectorstore.similarity_search_with_relevance_scores(
-                query=query,
-                k=k,
-                filter=where_filter
-            )
+            with CHROMA_QUERY_LATENCY.time(collection='medical_knowledge', operation='search'):
+                results = self.vectorstore.similarity_search_with_relevance_scores(
+                    query=query,
+                    k=k,
+                    filter=where_filter
+                )
             
             formatted_results = []
             for doc, score in results:
@@ -867,9 +868,10 @@ class MedicalKnowledgeBase:
         
         return "\n".join(context_parts)
     
-    def get_available_categories(self) -> List[str]:
-        """Get list of available medical categories"""
-        return list(set(paper['category'] for paper in self.MEDICAL_RESEARCH_PAPERS))
+    @classmethod
+    def get_available_categories(cls) -> List[str]:
+        """Get sorted list of available medical categories (no vector store needed)"""
+        return sorted(set(paper['category'] for paper in cls.MEDICAL_RESEARCH_PAPERS))
 
 
 _medical_kb_instance = None
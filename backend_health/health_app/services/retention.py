@@ -0,0 +1,193 @@
+"""
+Retention enforcement for chats, conversation memory, vectors, audit logs and export files
+Deletes rows past DATA_RETENTION_DAYS / AUDIT_LOG_RETENTION_DAYS in chunks that follow the composite indexes
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from health_app.analytics import prune_activity_logs
+from health_app.health_records import invalidate_chat_history, invalidate_health_record
+from health_app.models import ChatLog, ConversationMemory, SecurityAuditLog
+from health_app.services.data_deletion import chunked_delete
+from health_app.services.export_jobs import expire_exports
+
+logger = logging.getLogger(__name__)
+
+# Many-to-many tables hanging off ChatLog, cleared before the rows themselves
+CHAT_LOG_M2M_FIELDS = ('symptom_references', 'diagnosis_references')
+
+
+def _settings():
+    return getattr(settings, 'RETENTION_SETTINGS', {})
+
+
+def _user_ids():
+    return get_user_model().objects.order_by('pk').values_list('pk', flat=True).iterator()
+
+
+def delete_chat_logs(pks):
+    """
+    Delete ChatLog rows by primary key along with their dependants and image files
+
+    Replies pointing at a deleted row keep their own content and lose
+    the link, matching related_message's SET_NULL.
+    """
+    images = list(
+        ChatLog.objects.filter(pk__in=pks).exclude(image='').exclude(image__isnull=True)
+        .values_list('image', flat=True)
+    )
+    with transaction.atomic():
+        ChatLog.objects.filter(related_message_id__in=pks).update(related_message=None)
+        ConversationMemory.objects.filter(chat_log_id__in=pks)._raw_delete(ConversationMemory.objects.db)
+        for field_name in CHAT_LOG_M2M_FIELDS:
+            field = ChatLog._meta.get_field(field_name)
+            field.remote_field.through.objects.filter(**{f"{field.m2m_field_name()}_id__in": pks}).delete()
+        removed = ChatLog.objects.filter(pk__in=pks)._raw_delete(ChatLog.objects.db)
+
+    # Files go only once the rows are gone for good
+    storage = ChatLog._meta.get_field('image').storage
+    for name in images:
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning(f"Could not delete {name}: {e}")
+    return removed
+
+
+def prune_chat_logs(cutoff, chunk_size, vector_store=None):
+    """
+    Per user, delete chats older than cutoff oldest first
+
+    Each chunk is a range scan on (user, timestamp). Vectors written
+    before created_at metadata existed are matched by chat_log_id.
+    """
+    removed = vectors = 0
+    for user_id in _user_ids():
+        user_removed = 0
+        while True:
+            pks = list(
+                ChatLog.objects.filter(user_id=user_id, timestamp__lt=cutoff)
+                .order_by('timestamp').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not pks:
+                break
+            user_removed += delete_chat_logs(pks)
+            if vector_store is not None:
+                vectors += vector_store.delete_chat_log_conversations(pks)
+        if user_removed:
+            invalidate_health_record(user_id)
+            invalidate_chat_history(user_id)
+            removed += user_removed
+    return removed, vectors
+
+
+def prune_conversation_memory(cutoff, chunk_size):
+    """Per user, delete memory rows older than cutoff using (user, timestamp)"""
+    removed = 0
+    for user_id in _user_ids():
+        removed += chunked_delete(
+            ConversationMemory.objects.filter(user_id=user_id, timestamp__lt=cutoff), chunk_size
+        )
+    return removed
+
+
+def prune_audit_logs(cutoff, chunk_size):
+    """Per event type, delete audit rows older than cutoff using (event_type, timestamp)"""
+    removed = 0
+    for event_type, _label in SecurityAuditLog.EVENT_TYPES:
+        removed += chunked_delete(
+            SecurityAuditLog.objects.filter(event_type=event_type, timestamp__lt=cutoff), chunk_size
+        )
+    return removed
+
+
+def _timed(report, name, func, *args):
+    started = time.monotonic()
+    result = func(*args)
+    report[name] = {'removed': result, 'seconds': round(time.monotonic() - started, 2)}
+    return result
+
+
+def enforce_retention(retention_days=None, audit_retention_days=None, chunk_size=None,
+                      prune_vectors=None, compact=None, export_retention_days=None):
+    """
+    Delete everything past its retention period and compact the vector store
+
+    Args:
+        retention_days: Days to keep chats, memory, vectors and activity (defaults to DATA_RETENTION_DAYS)
+        audit_retention_days: Days to keep audit logs (defaults to AUDIT_LOG_RETENTION_DAYS)
+        export_retention_days: Days to keep finished export files
+            (defaults to EXPORT_JOB_SETTINGS['FILE_RETENTION_DAYS'])
+        chunk_size: Rows deleted per statement
+        prune_vectors: Remove expired Chroma vectors (defaults to RETENTION_SETTINGS['PRUNE_VECTORS'])
+        compact: VACUUM the Chroma store afterwards (defaults to RETENTION_SETTINGS['COMPACT_VECTORS'])
+
+    Returns:
+        Dict with rows removed and seconds spent per target, plus totals
+    """
+    config = _settings()
+    retention_days = retention_days or settings.DATA_RETENTION_DAYS
+    audit_retention_days = audit_retention_days or settings.AUDIT_LOG_RETENTION_DAYS
+    chunk_size = chunk_size or config.get('CHUNK_SIZE', 5000)
+    prune_vectors = config.get('PRUNE_VECTORS', True) if prune_vectors is None else prune_vectors
+    compact = config.get('COMPACT_VECTORS', True) if compact is None else compact
+    export_retention_days = export_retention_days or getattr(settings, 'EXPORT_JOB_SETTINGS', {}).get(
+        'FILE_RETENTION_DAYS', 7
+    )
+
+    now = timezone.now()
+    cutoff = now - timedelta(days=retention_days)
+    audit_cutoff = now - timedelta(days=audit_retention_days)
+    started = time.monotonic()
+
+    vector_store = None
+    if prune_vectors:
+        try:
+            from health_app.services.vector_store_service import get_vector_store
+            vector_store = get_vector_store()
+        except Exception as e:
+            logger.warning(f"Vector store unavailable, skipping vector retention: {e}")
+
+    targets = {}
+    chats_started = time.monotonic()
+    chat_rows, chat_vectors = prune_chat_logs(cutoff, chunk_size, vector_store)
+    targets['chat_logs'] = {'removed': chat_rows, 'seconds': round(time.monotonic() - chats_started, 2)}
+    _timed(targets, 'conversation_memory', prune_conversation_memory, cutoff, chunk_size)
+    _timed(targets, 'audit_logs', prune_audit_logs, audit_cutoff, chunk_size)
+    _timed(targets, 'export_files', expire_exports, now - timedelta(days=export_retention_days))
+    targets['activity_logs'] = {
+        key: value for key, value in prune_activity_logs(retention_days, chunk_size).items()
+        if key in ('removed', 'seconds')
+    }
+
+    bytes_reclaimed = 0
+    if vector_store is not None:
+        _timed(
+            targets, 'vectors', vector_store.delete_conversations_before,
+            cutoff.timestamp(), config.get('VECTOR_BATCH_SIZE', 5000),
+        )
+        targets['vectors']['removed'] += chat_vectors
+        if compact:
+            compact_started = time.monotonic()
+            bytes_reclaimed = vector_store.compact()
+            targets['vectors']['seconds'] = round(
+                targets['vectors']['seconds'] + time.monotonic() - compact_started, 2
+            )
+
+    elapsed = time.monotonic() - started
+    removed = sum(target['removed'] for target in targets.values())
+    logger.info(f"Retention removed {removed} rows/vectors in {elapsed:.2f}s")
+    return {
+        'targets': targets,
+        'removed': removed,
+        'bytes_reclaimed': bytes_reclaimed,
+        'seconds': round(elapsed, 2),
+        'cutoff': cutoff.isoformat(),
+        'audit_cutoff': audit_cutoff.isoformat(),
+    }
@@ -0,0 +1,82 @@
+"""
+Recall, latency and size benchmark for the FAISS conversation index modes
+Compares float, int8 and PQ codes (with and without float re-ranking) against exact search
+"""
+import time
+
+import faiss
+import numpy as np
+
+from health_app.services.faiss_store import exact_distances, new_index, search_params, training_size
+
+
+def synthetic_vectors(count, dim=384, clusters=256, seed=0):
+    """Unit-length vectors around random centres, shaped like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def store_vectors(store, limit):
+    """Up to limit float vectors from a FaissVectorStore side table"""
+    rows = store._db().execute('SELECT embedding FROM vectors ORDER BY id LIMIT ?', (limit,)).fetchall()
+    if not rows:
+        return None
+    return np.frombuffer(b''.join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), -1).copy()
+
+
+def _recall(found, truth, k):
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+
+
+def benchmark(vectors, queries, k=10, index_type='IVF', modes=(None, 'int8', 'pq'), rerank_factor=4,
+              nprobe=16, ef_search=128, hnsw_m=32, pq_m=48):
+    """
+    Build each index mode over vectors and score queries against brute-force ground truth
+
+    Returns:
+        One dict per (mode, re-rank) with recall@k, p50 query ms, index
+        bytes per vector and build seconds
+    """
+    count, dim = vectors.shape
+    ids = np.arange(count, dtype=np.int64)
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    results = []
+
+    for mode in modes:
+        started = time.monotonic()
+        index = new_index(dim, count, index_type, mode, hnsw_m=hnsw_m, pq_m=pq_m)
+        if not index.is_trained:
+            sample = vectors[np.random.default_rng(1).permutation(count)[:training_size(index)]]
+            index.train(sample)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.monotonic() - started
+        bytes_per_vector = len(faiss.serialize_index(index)) / count
+        params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+        for rerank in ((False, True) if mode else (False,)):
+            candidates = k * rerank_factor if rerank else k
+            found, timings = [], []
+            for query in queries:
+                query_started = time.perf_counter()
+                _, labels = index.search(query.reshape(1, -1), candidates, params=params)
+                labels = labels[0][labels[0] != -1]
+                if rerank:
+                    hits = exact_distances(query, labels, vectors[labels], k)
+                    labels = [vector_id for vector_id, _ in hits]
+                timings.append((time.perf_counter() - query_started) * 1000)
+                found.append(list(labels[:k]))
+
+            results.append({
+                'mode': mode or 'float32',
+                'rerank': rerank,
+                'recall': round(_recall(found, truth, k), 4),
+                'p50_ms': round(float(np.median(timings)), 3),
+                'bytes_per_vector': round(bytes_per_vector, 1),
+                'build_seconds': round(build_seconds, 2),
+            })
+    return results
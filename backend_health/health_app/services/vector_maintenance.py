@@ -0,0 +1,319 @@
+"""
+Rebuild of the conversation vector collection from ConversationMemory
+Re-embeds on a process pool into a fresh collection, then swaps the active-collection pointer
+
+Diagnosis vectors written straight from a ChatLog (no ConversationMemory
+row) are copied across with their stored embeddings instead.
+"""
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+from itertools import islice
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_worker_embeddings = None
+
+
+def _settings():
+    return getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+
+
+def _init_embedding_worker():
+    """Pool initializer: spawned children set up Django and load their own model once"""
+    global _worker_embeddings
+    import django
+    django.setup()
+    from health_app.services.embeddings import get_embedding_model
+    _worker_embeddings = get_embedding_model()
+
+
+def memory_vector_id(pk):
+    """Stable vector id per ConversationMemory row, so re-runs upsert instead of duplicating"""
+    return f"memory-{pk}"
+
+
+def embed_rows(rows, embeddings=None):
+    """
+    Turn ConversationMemory value rows into Chroma add() arguments
+
+    Runs in a pool worker unless an embeddings model is passed in.
+    Metadata matches VectorStoreService.add_conversation.
+    """
+    embeddings = embeddings or _worker_embeddings
+    ids, documents, metadatas = [], [], []
+    for pk, user_id, session_id, role, content, timestamp, chat_log_id in rows:
+        metadata = {
+            "user_id": str(user_id),
+            "session_id": session_id,
+            "role": role,
+            "created_at": timestamp.timestamp(),
+            "timestamp": timestamp.isoformat(),
+            "memory_id": pk,
+        }
+        if chat_log_id is not None:
+            metadata["chat_log_id"] = chat_log_id
+        ids.append(memory_vector_id(pk))
+        documents.append(content)
+        metadatas.append(metadata)
+    return {
+        'ids': ids,
+        'documents': documents,
+        'metadatas': metadatas,
+        'embeddings': embeddings.embed_documents(documents),
+    }
+
+
+def _row_batches(queryset, batch_size):
+    rows = queryset.order_by('pk').values_list(
+        'pk', 'user_id', 'session_id', 'role', 'content', 'timestamp', 'chat_log_id'
+    ).iterator(chunk_size=batch_size)
+    batch = []
+    for row in rows:
+        if row[4] and row[4].strip():
+            batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_memory(collection, queryset, batch_size, pool=None, embeddings=None, workers=1):
+    """
+    Embed and upsert the queryset's rows into collection; returns (vectors, last pk)
+
+    At most two batches per worker are in flight, so memory stays
+    bounded whatever the table size.
+    """
+    copied = 0
+    last_pk = None
+    window = workers * 2 if pool is not None else 1
+    batches = _row_batches(queryset, batch_size)
+    while True:
+        chunk = list(islice(batches, window))
+        if not chunk:
+            return copied, last_pk
+        if pool is not None:
+            results = pool.imap(embed_rows, chunk)
+        else:
+            results = (embed_rows(rows, embeddings) for rows in chunk)
+        for rows, result in zip(chunk, results):
+            collection.upsert(**result)
+            copied += len(result['ids'])
+            last_pk = rows[-1][0]
+
+
+def _collection_pages(collection, batch_size, include):
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=batch_size, offset=offset)
+        if not page['ids']:
+            return
+        yield page
+        offset += len(page['ids'])
+
+
+def copy_unbacked_vectors(old, new, batch_size):
+    """
+    Copy vectors tied to a ChatLog that has no ConversationMemory row; returns the count
+
+    These come from the diagnosis views, so there is nothing to re-embed
+    them from. Vectors without a chat_log_id were written alongside a
+    ConversationMemory row and are rebuilt from it.
+    """
+    from health_app.models import ConversationMemory
+
+    copied = 0
+    for page in _collection_pages(old, batch_size, ['embeddings', 'documents', 'metadatas']):
+        candidates = [
+            i for i, metadata in enumerate(page['metadatas'])
+            if metadata and 'memory_id' not in metadata and metadata.get('chat_log_id') is not None
+        ]
+        backed = set(ConversationMemory.objects.filter(
+            chat_log_id__in={page['metadatas'][i]['chat_log_id'] for i in candidates}
+        ).values_list('chat_log_id', flat=True))
+        keep = [i for i in candidates if page['metadatas'][i]['chat_log_id'] not in backed]
+        if keep:
+            new.upsert(
+                ids=[page['ids'][i] for i in keep],
+                embeddings=[page['embeddings'][i] for i in keep],
+                documents=[page['documents'][i] for i in keep],
+                metadatas=[page['metadatas'][i] for i in keep],
+            )
+            copied += len(keep)
+    return copied
+
+
+def drop_deleted_vectors(collection, batch_size):
+    """
+    Delete vectors whose ConversationMemory or ChatLog row is gone; returns the count
+
+    Retention runs don't take the deletion lease, so rows they delete
+    mid-rebuild would otherwise come back with the copied vectors.
+    """
+    from health_app.models import ChatLog, ConversationMemory
+
+    stale = []
+    for page in _collection_pages(collection, batch_size, ['metadatas']):
+        memory_ids, chat_log_ids = {}, {}
+        for vector_id, metadata in zip(page['ids'], page['metadatas']):
+            metadata = metadata or {}
+            if 'memory_id' in metadata:
+                memory_ids[vector_id] = metadata['memory_id']
+            elif metadata.get('chat_log_id') is not None:
+                chat_log_ids[vector_id] = metadata['chat_log_id']
+        live_memory = set(ConversationMemory.objects.filter(
+            pk__in=set(memory_ids.values())
+        ).values_list('pk', flat=True))
+        live_chat_logs = set(ChatLog.objects.filter(
+            pk__in=set(chat_log_ids.values())
+        ).values_list('pk', flat=True))
+        stale.extend(vector_id for vector_id, pk in memory_ids.items() if pk not in live_memory)
+        stale.extend(vector_id for vector_id, pk in chat_log_ids.items() if pk not in live_chat_logs)
+    for start in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[start:start + batch_size])
+    return len(stale)
+
+
+def directory_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def measure_query_latency(collection, samples, k=5):
+    """p50/p95 milliseconds of filtered k-NN queries, embeddings precomputed so only the index is timed"""
+    if not samples or collection.count() == 0:
+        return {'p50_ms': None, 'p95_ms': None}
+    timings = []
+    for user_id, embedding in samples:
+        started = time.perf_counter()
+        collection.query(query_embeddings=[embedding], n_results=k, where={"user_id": str(user_id)}, include=[])
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+    }
+
+
+def rebuild_collection(workers=None, batch_size=None, samples=None, keep_old=False):
+    """
+    Rebuild the conversation collection from ConversationMemory and swap it in
+
+    1. Embed every row into a new collection (workers > 1 uses a spawn pool)
+       and copy the diagnosis vectors that have no row to embed from
+    2. Catch up on rows added meanwhile, swap the pointer file, catch up again
+    3. Drop vectors whose rows were deleted meanwhile, then the old
+       collection, and VACUUM the store
+
+    Holds the data deletion lease throughout so a purge can't delete from
+    the old collection after its vectors were copied. Processes notice the
+    pointer change on their next vector store call.
+
+    Returns:
+        Dict with vector counts, on-disk size and query latency before and after
+    """
+    from health_app.services.data_deletion import LEASE_KEY
+    from health_app.services.vector_store_service import VectorStoreService, get_vector_store
+    from health_app.ratelimit import get_rate_limit_backend
+
+    config = _settings()
+    workers = config.get('REBUILD_WORKERS', 2) if workers is None else workers
+    batch_size = batch_size or config.get('REBUILD_BATCH_SIZE', 256)
+    samples = config.get('REBUILD_LATENCY_SAMPLES', 50) if samples is None else samples
+
+    store = get_vector_store()
+    if not isinstance(store, VectorStoreService):
+        raise ValueError("Only the Chroma backend is rebuilt this way; FAISS rebuilds its index in compact()")
+
+    backend = get_rate_limit_backend()
+    deletion_settings = getattr(settings, 'DATA_DELETION_SETTINGS', {})
+    token = backend.acquire_lease(LEASE_KEY, 1, deletion_settings.get('LEASE_SECONDS', 3600))
+    if token is None:
+        raise ValueError("A data deletion run is in progress; rebuild once it finishes")
+    try:
+        return _rebuild(store, workers, batch_size, samples, keep_old)
+    finally:
+        backend.release_lease(LEASE_KEY, token)
+
+
+def _rebuild(store, workers, batch_size, samples, keep_old):
+    from health_app.models import ConversationMemory
+    from health_app.services.vector_store_service import write_active_collection
+
+    old = store.vectorstore._collection
+    client = store.vectorstore._client
+    batch_size = min(batch_size, client.get_max_batch_size())
+    new_name = f"{store.base_collection_name}_{time.strftime('%Y%m%d%H%M%S')}"
+
+    sample_rows = list(
+        ConversationMemory.objects.exclude(content='').order_by('-pk').values_list('user_id', 'content')[:samples]
+    )
+    sample_embeddings = store.embeddings.embed_documents([content for _, content in sample_rows]) if sample_rows else []
+    sample_queries = [(user_id, embedding) for (user_id, _), embedding in zip(sample_rows, sample_embeddings)]
+
+    report = {
+        'old_collection': old.name,
+        'new_collection': new_name,
+        'before': {
+            'vectors': old.count(),
+            'bytes': directory_size(store.persist_directory),
+            **measure_query_latency(old, sample_queries),
+        },
+    }
+
+    started = time.monotonic()
+    new = client.create_collection(new_name, metadata=old.metadata)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_embedding_worker)
+    try:
+        copied, last_pk = copy_memory(new, ConversationMemory.objects.all(), batch_size, pool, store.embeddings, workers)
+        caught_up, pk = copy_memory(
+            new, ConversationMemory.objects.filter(pk__gt=last_pk or 0), batch_size, pool, store.embeddings, workers
+        )
+        last_pk = pk or last_pk
+        copy_unbacked_vectors(old, new, batch_size)
+    except Exception:
+        client.delete_collection(new_name)
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    write_active_collection(store.persist_directory, new_name)
+    # Rows and diagnosis vectors written to the old collection between the catch-up and the swap
+    late, _ = copy_memory(
+        new, ConversationMemory.objects.filter(pk__gt=last_pk or 0), batch_size, embeddings=store.embeddings
+    )
+    report['embedded'] = copied + caught_up + late
+    report['copied_unbacked'] = copy_unbacked_vectors(old, new, batch_size)
+    report['dropped_deleted'] = drop_deleted_vectors(new, batch_size)
+    report['seconds'] = round(time.monotonic() - started, 2)
+
+    if not keep_old:
+        client.delete_collection(old.name)
+    store.compact()
+
+    report['after'] = {
+        'vectors': new.count(),
+        'bytes': directory_size(store.persist_directory),
+        **measure_query_latency(new, sample_queries),
+    }
+    logger.info(
+        f"Rebuilt {old.name} into {new_name}: {report['embedded']} vectors embedded, "
+        f"{report['copied_unbacked']} copied, {report['dropped_deleted']} dropped in {report['seconds']}s"
+    )
+    return report
@@ -2,35 +2,131 @@
 Vector Store Service using ChromaDB for conversation embeddings
 """
 import os
-from typing import List, Dict, Any
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional
 from django.conf import settings
 import chromadb
 from chromadb.config import Settings
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 
+from health_app.metrics import CHROMA_QUERY_LATENCY
+from health_app.services.embeddings import get_embedding_model
 
-class VectorStoreService:
+
+ACTIVE_COLLECTION_FILE = 'ACTIVE_COLLECTION'
+
+
+def read_active_collection(persist_directory: str) -> Optional[str]:
+    """Name of the collection a rebuild swapped in, or None before the first rebuild"""
+    try:
+        with open(os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_active_collection(persist_directory: str, name: str) -> None:
+    """Point every process at another collection; os.replace makes the switch atomic"""
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ConversationStore:
+    """Behaviour shared by the conversation vector backends (Chroma, FAISS)"""
+    
+    def get_conversation_context(
+        self,
+        user_id: int,
+        current_message: str,
+        max_context_items: int = 3
+    ) -> str:
+        """
+        Get relevant conversation context for the current message
+        
+        Args:
+            user_id: User ID
+            current_message: Current user message
+            max_context_items: Maximum context items to retrieve
+        
+        Returns:
+            Formatted context string
+        """
+        similar_conversations = self.search_similar_conversations(
+            user_id=user_id,
+            query=current_message,
+            k=max_context_items
+        )
+        
+        if not similar_conversations:
+            return ""
+        
+        context_parts = ["Based on your previous conversations:\n"]
+        
+        for idx, conv in enumerate(similar_conversations, 1):
+            role = conv['metadata'].get('role', 'unknown')
+            content = conv['content']
+            context_parts.append(f"{idx}. [{role}]: {content}")
+        
+        return "\n".join(context_parts)
+    
+    def delete_user_conversations(self, user_id: int) -> None:
+        """
+        Delete all conversations for a specific user
+        
+        Args:
+            user_id: User ID
+        """
+        try:
+            self.delete_users_conversations([user_id])
+        except Exception as e:
+            print(f"Error deleting user conversations: {e}")
+
+
+class VectorStoreService(ConversationStore):
     """Service for managing conversation embeddings in ChromaDB"""
     
     def __init__(self):
-        self.persist_directory = os.path.join(
+        config = getattr(settings, 'VECTOR_STORE_SETTINGS', {})
+        self.persist_directory = config.get('CHROMA_DB_PATH') or os.path.join(
             os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
             'chroma_db'
         )
         
         # Use HuggingFace embeddings (free, local, no API key needed)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.embeddings = get_embedding_model()
         
-        self.vectorstore = Chroma(
+        self.base_collection_name = config.get('COLLECTION_NAME', 'health_conversations')
+        self._open_collection()
+    
+    def _pointer_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(self.persist_directory, ACTIVE_COLLECTION_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _open_collection(self) -> None:
+        self._opened_pointer = self._pointer_mtime()
+        self.collection_name = read_active_collection(self.persist_directory) or self.base_collection_name
+        self._vectorstore = Chroma(
             persist_directory=self.persist_directory,
             embedding_function=self.embeddings,
-            collection_name="health_conversations"
+            collection_name=self.collection_name
         )
     
+    @property
+    def vectorstore(self) -> Chroma:
+        """The active collection, reopened when a rebuild has swapped the pointer file"""
+        if self._pointer_mtime() != self._opened_pointer:
+            self._open_collection()
+        return self._vectorstore
+    
     def add_conversation(
         self,
         user_id: int,
@@ -56,6 +152,8 @@ class VectorStoreService:
             "user_id": str(user_id),
             "session_id": session_id,
             "role": role,
+            # Epoch seconds: Chroma range filters only work on numbers
+            "created_at": time.time(),
             **(metadata or {})
         }
         
@@ -93,11 +191,12 @@ class VectorStoreService:
             where_filter["role"] = filter_role
         
         try:
-            results = self.vectorstore.similarity_search_with_score(
-                query=query,
-                k=k,
-                filter=where_filter
-            )
+            with CHROMA_QUERY_LATENCY.time(collection=self.base_collection_name, operation='search'):
+                results = self.vectorstore.similarity_search_with_score(
+                    query=query,
+                    k=k,
+                    filter=where_filter
+                )
             
             formatted_results = []
             for doc, score in results:
@@ -112,54 +211,84 @@ class VectorStoreService:
             print(f"Error searching conversations: {e}")
             return []
     
-    def get_conversation_context(
-        self,
-        user_id: int,
-        current_message: str,
-        max_context_items: int = 3
-    ) -> str:
+    def delete_users_conversations(self, user_ids: List[int], batch_size: int = 5000) -> int:
         """
-        Get relevant conversation context for the current message
+        Delete every conversation vector belonging to any of the users
+        
+        Ids are fetched and deleted batch_size at a time, so a purge over
+        thousands of accounts never loads the whole match set at once.
         
         Args:
-            user_id: User ID
-            current_message: Current user message
-            max_context_items: Maximum context items to retrieve
+            user_ids: User IDs
+            batch_size: Vectors removed per delete call
         
         Returns:
-            Formatted context string
+            Number of vectors deleted
         """
-        similar_conversations = self.search_similar_conversations(
-            user_id=user_id,
-            query=current_message,
-            k=max_context_items
-        )
+        where = {"user_id": {"$in": [str(user_id) for user_id in user_ids]}}
+        return self._delete_where(where, batch_size)
+    
+    def delete_conversations_before(self, cutoff: float, batch_size: int = 5000) -> int:
+        """
+        Delete conversation vectors added before a point in time
         
-        if not similar_conversations:
-            return ""
+        Args:
+            cutoff: Epoch seconds; vectors whose created_at is older are removed
+            batch_size: Vectors removed per delete call
         
-        context_parts = ["Based on your previous conversations:\n"]
+        Returns:
+            Number of vectors deleted
+        """
+        return self._delete_where({"created_at": {"$lt": cutoff}}, batch_size)
+    
+    def delete_chat_log_conversations(self, chat_log_ids: List[int], batch_size: int = 5000) -> int:
+        """
+        Delete vectors stored for specific chat log rows
         
-        for idx, conv in enumerate(similar_conversations, 1):
-            role = conv['metadata'].get('role', 'unknown')
-            content = conv['content']
-            context_parts.append(f"{idx}. [{role}]: {content}")
+        Covers vectors written before created_at was recorded, which only
+        carry the chat_log_id of the message they came from.
         
-        return "\n".join(context_parts)
+        Args:
+            chat_log_ids: ChatLog primary keys
+            batch_size: Vectors removed per delete call
+        
+        Returns:
+            Number of vectors deleted
+        """
+        return self._delete_where({"chat_log_id": {"$in": list(chat_log_ids)}}, batch_size)
     
-    def delete_user_conversations(self, user_id: int) -> None:
+    def compact(self) -> int:
         """
-        Delete all conversations for a specific user
+        VACUUM the collection's SQLite store so space freed by deletes returns to disk
         
-        Args:
-            user_id: User ID
+        Returns:
+            Bytes reclaimed
         """
-        try:
-            self.vectorstore.delete(
-                where={"user_id": str(user_id)}
-            )
-        except Exception as e:
-            print(f"Error deleting user conversations: {e}")
+        path = os.path.join(self.persist_directory, 'chroma.sqlite3')
+        if not os.path.exists(path):
+            return 0
+        
+        before = os.path.getsize(path)
+        with CHROMA_QUERY_LATENCY.time(collection=self.base_collection_name, operation='compact'):
+            conn = sqlite3.connect(path, timeout=60)
+            try:
+                conn.execute('VACUUM')
+            finally:
+                conn.close()
+        return before - os.path.getsize(path)
+    
+    def _delete_where(self, where: Dict[str, Any], batch_size: int) -> int:
+        """Fetch matching ids batch_size at a time and delete them; returns the count"""
+        collection = self.vectorstore._collection
+        removed = 0
+        while True:
+            with CHROMA_QUERY_LATENCY.time(collection=self.base_collection_name, operation='get'):
+                ids = collection.get(where=where, limit=batch_size, include=[])['ids']
+            if not ids:
+                return removed
+            with CHROMA_QUERY_LATENCY.time(collection=self.base_collection_name, operation='delete'):
+                collection.delete(ids=ids)
+            removed += len(ids)
     
     def get_session_messages(self, user_id: int, session_id: str) -> List[Dict[str, Any]]:
         """
@@ -173,14 +302,15 @@ class VectorStoreService:
             List of message dictionaries with content, role, and timestamp
         """
         try:
-            results = self.vectorstore.get(
-                where={
-                    "$and": [
-                        {"user_id": str(user_id)},
-                        {"session_id": session_id}
-                    ]
-                }
-            )
+            with CHROMA_QUERY_LATENCY.time(collection=self.base_collection_name, operation='get'):
+                results = self.vectorstore.get(
+                    where={
+                        "$and": [
+                            {"user_id": str(user_id)},
+                            {"session_id": session_id}
+                        ]
+                    }
+                )
             
             messages = []
             if results and 'documents' in results:
@@ -205,9 +335,14 @@ class VectorStoreService:
 _vector_store_instance = None
 
 
-def get_vector_store() -> VectorStoreService:
+def get_vector_store() -> ConversationStore:
     """Get or create vector store singleton instance"""
     global _vector_store_instance
     if _vector_store_instance is None:
-        _vector_store_instance = VectorStoreService()
+        backend = getattr(settings, 'VECTOR_STORE_SETTINGS', {}).get('BACKEND', 'chroma')
+        if backend == 'faiss':
+            from health_app.services.faiss_store import FaissVectorStore
+            _vector_store_instance = FaissVectorStore()
+        else:
+            _vector_store_instance = VectorStoreService()
     return _vector_store_instance
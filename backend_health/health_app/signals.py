@@ -0,0 +1,75 @@
+"""
+Model signal receivers
+Invalidate cached health records and chat history ETags when the rows behind them change
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .health_records import invalidate_chat_history, invalidate_health_record
+from .models import AIDiagnosisResponse, ChatLog, UserProfile, UserSymptomLog
+
+RECORD_MODELS = (UserProfile, UserSymptomLog, AIDiagnosisResponse, ChatLog)
+
+# Many-to-many fields serialized into the record, keyed by through model
+RECORD_M2M_FIELDS = {
+    getattr(model, field_name).through: (model, field_name)
+    for model, field_name in (
+        (AIDiagnosisResponse, 'symptoms'),
+        (AIDiagnosisResponse, 'probable_conditions'),
+        (ChatLog, 'symptom_references'),
+        (ChatLog, 'diagnosis_references'),
+    )
+}
+
+
+def schedule_invalidation(user_ids, chats=False):
+    """
+    Invalidate after the surrounding transaction commits
+
+    Bumping the version earlier would let a concurrent request cache
+    pre-commit rows under the new version. chats also moves the chat
+    history version.
+    """
+    for user_id in set(user_ids):
+        if user_id is not None:
+            transaction.on_commit(partial(invalidate_health_record, user_id))
+            if chats:
+                transaction.on_commit(partial(invalidate_chat_history, user_id))
+
+
+def record_row_changed(sender, instance, **kwargs):
+    schedule_invalidation([instance.user_id], chats=sender is ChatLog)
+
+
+def record_row_deleted(sender, instance, **kwargs):
+    # Deleting a diagnosis nulls ChatLog.diagnosis and drops its references without ChatLog signals
+    schedule_invalidation([instance.user_id], chats=sender in (ChatLog, AIDiagnosisResponse))
+
+
+def record_m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    owner, field_name = RECORD_M2M_FIELDS[sender]
+    chats = owner is ChatLog
+
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_invalidation([instance.user_id], chats=chats)
+        return
+
+    # Changed from the Symptom/condition/diagnosis side: find the owning rows' users
+    if action in ('post_add', 'post_remove'):
+        user_ids = owner.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+    elif action == 'pre_clear':
+        user_ids = owner.objects.filter(**{field_name: instance}).values_list('user_id', flat=True)
+    else:
+        return
+    schedule_invalidation(list(user_ids), chats=chats)
+
+
+def connect_signals():
+    for model in RECORD_MODELS:
+        post_save.connect(record_row_changed, sender=model, dispatch_uid=f'health_record_save_{model.__name__}')
+        post_delete.connect(record_row_deleted, sender=model, dispatch_uid=f'health_record_delete_{model.__name__}')
+    for through in RECORD_M2M_FIELDS:
+        m2m_changed.connect(record_m2m_changed, sender=through, dispatch_uid=f'health_record_m2m_{through.__name__}')
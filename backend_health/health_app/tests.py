@@ -1 +1,334 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from langchain_core.embeddings import Embeddings
+from rest_framework.test import APIClient
+
+from .models import AIDiagnosisResponse, ChatLog, Symptom
+from .renderers import ORJSONRenderer
+from .services import faiss_store
+from .services.embedding_server import (
+    EmbeddingServer, EmbeddingServerError, EmbeddingServerUnavailable, RemoteEmbeddings,
+)
+
+
+class ChatHistoryQueryCountTests(TestCase):
+    """Chat history must cost the same number of queries whatever the page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='history@example.com', password='pass1234')
+        symptoms = [Symptom.objects.create(name=f"symptom-{i}") for i in range(3)]
+        diagnosis = AIDiagnosisResponse.objects.create(user=cls.user, ai_notes='notes')
+
+        previous = None
+        for i in range(60):
+            chat = ChatLog.objects.create(
+                user=cls.user,
+                message=f"message {i}",
+                is_user=i % 2 == 0,
+                diagnosis=diagnosis if i % 3 == 0 else None,
+                related_message=previous,
+            )
+            chat.symptom_references.set(symptoms[:i % 3 + 1])
+            chat.diagnosis_references.set([diagnosis])
+            previous = chat
+
+    def setUp(self):
+        # Anything a request writes to storage lands in a throwaway directory, not the tree
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _history_queries(self, limit):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/chat/history/', {'limit': limit}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), limit)
+        return len(queries)
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.assertEqual(self._history_queries(5), self._history_queries(50))
+
+    def test_references_are_serialized_as_ids(self):
+        response = self.client.get('/chat/history/', {'limit': 3}, secure=True)
+        latest = response.json()[-1]
+        chat = ChatLog.objects.get(pk=latest['id'])
+
+        self.assertEqual(
+            sorted(latest['symptom_references']),
+            sorted(chat.symptom_references.values_list('id', flat=True))
+        )
+        self.assertEqual(latest['diagnosis_references'], [chat.diagnosis_references.get().id])
+        self.assertEqual(latest['related_message_id'], chat.related_message_id)
+        self.assertEqual(latest['diagnosis_id'], chat.diagnosis_id)
+
+    def test_update_returns_new_references(self):
+        chat = ChatLog.objects.filter(user=self.user).first()
+        symptom = Symptom.objects.create(name='replacement')
+
+        response = self.client.patch(
+            f'/api/chatlog/{chat.pk}/', {'symptom_references': [symptom.pk]}, format='json', secure=True
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['symptom_references'], [symptom.pk])
+        self.assertEqual(list(chat.symptom_references.values_list('id', flat=True)), [symptom.pk])
+
+    def test_edit_in_place_changes_history_etag(self):
+        first = self.client.get('/chat/history/', {'limit': 3}, secure=True)
+        chat = ChatLog.objects.get(pk=first.json()[-1]['id'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chat.message = 'edited'
+            chat.save(update_fields=['message'])
+        second = self.client.get('/chat/history/', {'limit': 3}, HTTP_IF_NONE_MATCH=first['ETag'], secure=True)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()[-1]['message'], 'edited')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """ORJSONRenderer must keep JSONRenderer's output and its strict float contract"""
+
+    def test_matches_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        data = {'id': 1, 'score': 0.25, 'note': 'caf\u00e9 \u2028', 'tags': [None, True], 'nested': {'n': 2.0}}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_rejects_non_finite_floats(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'rows': [{'score': value}]})
+
+
+class OnnxEmbeddingEquivalenceTests(SimpleTestCase):
+    """The ONNX Runtime MiniLM backend must reproduce the sentence-transformers embeddings"""
+
+    TEXTS = [
+        "I have had a headache and mild fever since yesterday.",
+        "Chest pain\nwhen climbing stairs",
+        "ok",
+        " ".join(["persistent cough with yellow phlegm"] * 80),  # past the 256-token limit
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import onnxruntime  # noqa: F401
+            import sentence_transformers  # noqa: F401
+            import tokenizers  # noqa: F401
+            from langchain_huggingface import HuggingFaceEmbeddings
+        except ImportError as e:
+            raise unittest.SkipTest(f"embedding dependencies unavailable: {e}")
+
+        from .services.embeddings import build_onnx_embeddings
+
+        config = dict(getattr(settings, 'VECTOR_STORE_SETTINGS', {}))
+        try:
+            cls.reference = HuggingFaceEmbeddings(
+                model_name=config.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+            )
+            cls.onnx = build_onnx_embeddings({**config, 'ONNX_QUANTIZED': False})
+            cls.quantized = build_onnx_embeddings({**config, 'ONNX_QUANTIZED': True})
+        except Exception as e:
+            raise unittest.SkipTest(f"model files unavailable: {e}")
+        super().setUpClass()
+
+    def _compare(self, model):
+        expected = np.array(self.reference.embed_documents(self.TEXTS))
+        actual = np.array(model.embed_documents(self.TEXTS))
+        self.assertEqual(actual.shape, expected.shape)
+        return expected, actual, (expected * actual).sum(axis=1)
+
+    def test_float_model_matches_within_tolerance(self):
+        expected, actual, cosine = self._compare(self.onnx)
+        np.testing.assert_allclose(actual, expected, atol=1e-4)
+        self.assertTrue((cosine > 0.9999).all(), cosine)
+
+    def test_quantized_model_stays_close(self):
+        _expected, _actual, cosine = self._compare(self.quantized)
+        self.assertTrue((cosine > 0.98).all(), cosine)
+
+    def test_query_matches_document_embedding(self):
+        np.testing.assert_allclose(
+            self.onnx.embed_query(self.TEXTS[0]), self.onnx.embed_documents(self.TEXTS[:1])[0], atol=1e-6
+        )
+
+
+class StandInEmbeddings(Embeddings):
+    """Deterministic stand-in model: [length, spaces, 1]; '__crash__' kills its process, '__slow__' takes 1s"""
+
+    def embed_documents(self, texts):
+        if '__crash__' in texts:
+            os._exit(1)
+        if '__slow__' in texts:
+            time.sleep(1)
+        return [[float(len(text)), float(text.count(' ')), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@unittest.skipUnless(
+    hasattr(socket, 'AF_UNIX') and 'fork' in multiprocessing.get_all_start_methods(),
+    "needs Unix sockets and fork"
+)
+class EmbeddingServerTests(SimpleTestCase):
+    """Round trips through the embedding server socket, with the stand-in model in forked processes"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'embeddings.sock')
+        self.server = EmbeddingServer(
+            self.socket_path, workers=2, batch_wait_ms=20,
+            model_factory=StandInEmbeddings, mp_context=multiprocessing.get_context('fork'),
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = RemoteEmbeddings(self.socket_path, timeout=10, fallback=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        self.assertEqual(self.client.embed_documents(['a b', 'hello']), [[3.0, 1.0, 1.0], [5.0, 0.0, 1.0]])
+        self.assertEqual(self.client.embed_query('x y z'), [5.0, 2.0, 1.0])
+        self.assertEqual(self.client.embed_documents([]), [])
+
+    def test_concurrent_requests_are_batched(self):
+        batch_sizes = []
+        submit = self.server.batcher._submit
+        self.server.batcher._submit = lambda texts: batch_sizes.append(len(texts)) or submit(texts)
+
+        with ThreadPoolExecutor(20) as pool:
+            results = list(pool.map(self.client.embed_query, [' ' * i for i in range(40)]))
+
+        self.assertEqual(results, [[float(i), float(i), 1.0] for i in range(40)])
+        self.assertLess(len(batch_sizes), 40)
+
+    def test_recovers_from_a_dead_model_process(self):
+        with self.assertLogs('health_app.services.embedding_server', 'ERROR'):
+            with self.assertRaises(EmbeddingServerError):
+                self.client.embed_query('__crash__')
+            self.assertEqual(self.client.embed_query('a b'), [3.0, 1.0, 1.0])
+
+    def test_slow_server_is_an_error_not_a_fallback(self):
+        client = RemoteEmbeddings(self.socket_path, timeout=0.2, fallback=True)
+        with mock.patch('health_app.services.embeddings.build_local_embeddings') as build_local:
+            with self.assertRaises(EmbeddingServerError) as raised:
+                client.embed_query('__slow__')
+        self.assertNotIsInstance(raised.exception, EmbeddingServerUnavailable)
+        build_local.assert_not_called()
+        self.assertEqual(client.embed_query('a b'), [3.0, 1.0, 1.0])
+
+    def test_falls_back_to_local_model_when_server_is_down(self):
+        missing = os.path.join(self.directory, 'missing.sock')
+        with self.assertRaises(EmbeddingServerUnavailable):
+            RemoteEmbeddings(missing, fallback=False).embed_query('a b')
+
+        with mock.patch('health_app.services.embeddings.build_local_embeddings', StandInEmbeddings), \
+                self.assertLogs('health_app.services.embedding_server', 'WARNING'):
+            self.assertEqual(RemoteEmbeddings(missing, fallback=True).embed_query('a b'), [3.0, 1.0, 1.0])
+
+
+class FaissVectorStoreTests(SimpleTestCase):
+    """Add, search and delete round trips on the FAISS backend, scored exactly and through the index"""
+
+    texts = ['a', 'bb bb', 'ccc ccc ccc', 'dddd dddd dddd dddd']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        model = mock.patch.object(faiss_store, 'get_embedding_model', StandInEmbeddings)
+        model.start()
+        self.addCleanup(model.stop)
+
+    def make_store(self, exact_limit, index_type='IVF'):
+        path = tempfile.mkdtemp(dir=self.directory)
+        with override_settings(VECTOR_STORE_SETTINGS={
+            **settings.VECTOR_STORE_SETTINGS,
+            'BACKEND': 'faiss',
+            'FAISS_PATH': path,
+            'FAISS_INDEX': index_type,
+            'FAISS_EXACT_LIMIT': exact_limit,
+        }):
+            return faiss_store.FaissVectorStore()
+
+    def add_texts(self, store):
+        for chat_log_id, text in enumerate(self.texts, start=1):
+            store.add_conversation(1, 's1', 'user', text, metadata={'chat_log_id': chat_log_id})
+        store.add_conversation(2, 's2', 'user', 'a')
+
+    def assertNearest(self, store, user_id, query, expected):
+        results = store.search_similar_conversations(user_id, query, k=len(self.texts))
+        self.assertEqual([result['content'] for result in results][:1], expected[:1])
+        self.assertCountEqual([result['content'] for result in results], expected)
+        if query in expected:
+            self.assertEqual(results[0]['similarity_score'], 0.0)
+        for result in results:
+            self.assertEqual(result['metadata']['user_id'], str(user_id))
+
+    def check_round_trip(self, store):
+        for text in self.texts:
+            self.assertNearest(store, 1, text, [text] + [other for other in self.texts if other != text])
+
+        self.assertEqual(store.delete_chat_log_conversations([1]), 1)
+        self.assertNearest(store, 1, 'a', ['bb bb', 'ccc ccc ccc', 'dddd dddd dddd dddd'])
+        self.assertNearest(store, 2, 'a', ['a'])
+
+        self.assertEqual(store.delete_users_conversations([1]), 3)
+        self.assertNearest(store, 1, 'bb bb', [])
+        self.assertNearest(store, 2, 'a', ['a'])
+
+    def test_exact_search(self):
+        store = self.make_store(exact_limit=4096)
+        self.add_texts(store)
+        self.check_round_trip(store)
+
+    def test_index_search(self):
+        store = self.make_store(exact_limit=1)
+        self.add_texts(store)
+        self.check_round_trip(store)
+
+    def test_after_merge(self):
+        for exact_limit in (4096, 1):
+            for index_type in ('IVF', 'HNSW'):
+                with self.subTest(exact_limit=exact_limit, index_type=index_type):
+                    store = self.make_store(exact_limit, index_type)
+                    self.add_texts(store)
+                    self.assertTrue(store.merge(force=True))
+                    self.assertEqual(store.pending_merge(), 0)
+                    self.check_round_trip(store)
+
+    def test_merge_then_add(self):
+        store = self.make_store(exact_limit=1)
+        store.add_conversation(1, 's1', 'user', self.texts[0], metadata={'chat_log_id': 1})
+        self.assertTrue(store.merge(force=True))
+        for chat_log_id, text in enumerate(self.texts[1:], start=2):
+            store.add_conversation(1, 's1', 'user', text, metadata={'chat_log_id': chat_log_id})
+        store.add_conversation(2, 's2', 'user', 'a')
+        self.assertEqual(store.pending_merge(), len(self.texts))
+        self.check_round_trip(store)
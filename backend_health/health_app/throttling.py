@@ -2,10 +2,98 @@
 Custom throttling classes for API rate limiting
 Enterprise-grade rate limiting for different user tiers
 """
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+import functools
 
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle, UserRateThrottle, AnonRateThrottle
 
-class BurstRateThrottle(UserRateThrottle):
+from .metrics import THROTTLE_REJECTIONS, estimate_tokens, metrics_enabled
+from .middleware import on_stream_complete
+from .ratelimit import get_rate_limit_backend
+
+
+class GCRAThrottleMixin:
+    """
+    Replaces SimpleRateThrottle's cached request history with an atomic
+    GCRA check against the shared rate limit backend
+    O(1) state (one timestamp) and work per key, whatever the rate
+    """
+    
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        
+        emission_interval = self.duration / self.num_requests
+        # A request costing more than the whole budget could never pass
+        cost = min(self.get_cost(request, view), self.num_requests)
+        allowed, self._retry_after = get_rate_limit_backend().gcra(
+            self.key,
+            emission_interval,
+            self.duration,
+            cost=cost
+        )
+        if allowed:
+            return True
+        return self.throttle_failure()
+    
+    def get_cost(self, request, view):
+        """Units charged against the quota for this request"""
+        return 1
+    
+    def wait(self):
+        return getattr(self, '_retry_after', None)
+
+
+class CostWeightedThrottleMixin:
+    """
+    Charge each request an estimated cost instead of a flat 1
+    Cost grows with prompt tokens, uploaded image size and the LLM model
+    behind the endpoint; see AI_QUOTA_SETTINGS. The rate is then a budget
+    of cost units per period (a short text prompt costs 1 unit)
+    """
+    
+    def get_cost(self, request, view):
+        config = getattr(settings, 'AI_QUOTA_SETTINGS', {})
+        
+        tokens = config.get('CONTEXT_TOKENS', 500) + estimate_tokens(self.get_prompt_text(request))
+        units = tokens / config.get('TOKENS_PER_UNIT', 1000)
+        
+        image = request.FILES.get('image')
+        if image is not None:
+            units += image.size / config.get('IMAGE_BYTES_PER_UNIT', 1024 * 1024)
+        
+        match = getattr(request, 'resolver_match', None)
+        model = config.get('ENDPOINT_MODELS', {}).get(match.url_name if match else None)
+        units *= config.get('MODEL_COST_MULTIPLIERS', {}).get(model, 1.0)
+        
+        return max(1.0, units)
+    
+    def get_prompt_text(self, request):
+        """Text the endpoint will send to the model"""
+        data = request.data
+        parts = [str(data.get('message', ''))]
+        symptom_names = data.get('symptom_names') or []
+        if isinstance(symptom_names, (list, tuple)):
+            parts.extend(str(name) for name in symptom_names)
+        return ' '.join(parts)
+
+
+class ThrottleMetricsMixin:
+    """
+    Count rejected requests per throttle scope
+    """
+    
+    def throttle_failure(self):
+        if metrics_enabled():
+            THROTTLE_REJECTIONS.inc(scope=self.scope)
+        return super().throttle_failure()
+
+
+class BurstRateThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
     """
     Allows burst requests - 60 requests per minute for authenticated users
     """
@@ -13,7 +101,7 @@ class BurstRateThrottle(UserRateThrottle):
     rate = '60/min'
 
 
-class SustainedRateThrottle(UserRateThrottle):
+class SustainedRateThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
     """
     Sustained rate limiting - 1000 requests per hour for authenticated users
     """
@@ -21,7 +109,7 @@ class SustainedRateThrottle(UserRateThrottle):
     rate = '1000/hour'
 
 
-class AnonymousUserThrottle(AnonRateThrottle):
+class AnonymousUserThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, AnonRateThrottle):
     """
     Rate limiting for anonymous users - 20 requests per hour
     """
@@ -29,7 +117,7 @@ class AnonymousUserThrottle(AnonRateThrottle):
     rate = '20/hour'
 
 
-class PremiumUserThrottle(UserRateThrottle):
+class PremiumUserThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
     """
     Higher limits for premium users - 5000 requests per hour
     """
@@ -37,16 +125,16 @@ class PremiumUserThrottle(UserRateThrottle):
     rate = '5000/hour'
 
 
-class AIAnalysisThrottle(UserRateThrottle):
+class AIAnalysisThrottle(ThrottleMetricsMixin, CostWeightedThrottleMixin, GCRAThrottleMixin, UserRateThrottle):
     """
-    Special rate limiting for AI analysis endpoints - 20 requests per hour
+    Special rate limiting for AI analysis endpoints - 20 cost units per hour
     Prevents abuse of expensive AI operations
     """
     scope = 'ai_analysis'
     rate = '20/hour'
 
 
-class ImageUploadThrottle(UserRateThrottle):
+class ImageUploadThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
     """
     Rate limiting for image uploads - 10 uploads per hour
     """
@@ -54,7 +142,15 @@ class ImageUploadThrottle(UserRateThrottle):
     rate = '10/hour'
 
 
-class AdminAPIThrottle(UserRateThrottle):
+class DataExportThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
+    """
+    Rate limiting for personal data exports - 10 exports per hour
+    """
+    scope = 'data_export'
+    rate = '10/hour'
+
+
+class AdminAPIThrottle(ThrottleMetricsMixin, GCRAThrottleMixin, UserRateThrottle):
     """
     Relaxed throttling for admin users - 10000 requests per hour
     """
@@ -65,3 +161,74 @@ class AdminAPIThrottle(UserRateThrottle):
         if request.user and request.user.is_staff:
             return True
         return super().allow_request(request, view)
+
+
+class ConcurrentStreamThrottle(BaseThrottle):
+    """
+    Cap the number of LLM streams a user has in flight at once
+    Holds a lease in the rate limit backend until the response body is
+    finished; views must be wrapped with hold_stream_slot to release it.
+    Leases expire after STREAM_LEASE_SECONDS in case a worker dies mid-stream
+    """
+    scope = 'concurrent_streams'
+    
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+        if getattr(request._request, 'stream_lease', None):
+            return True
+        
+        config = getattr(settings, 'AI_QUOTA_SETTINGS', {})
+        key = f"throttle_{self.scope}_{request.user.pk}"
+        token = get_rate_limit_backend().acquire_lease(
+            key,
+            config.get('MAX_CONCURRENT_STREAMS', 2),
+            config.get('STREAM_LEASE_SECONDS', 300)
+        )
+        if token is None:
+            if metrics_enabled():
+                THROTTLE_REJECTIONS.inc(scope=self.scope)
+            return False
+        
+        request._request.stream_lease = (key, token)
+        return True
+    
+    def wait(self):
+        return getattr(settings, 'AI_QUOTA_SETTINGS', {}).get('STREAM_RETRY_AFTER', 5)
+
+
+# Throttles for endpoints that stream an LLM response
+AI_ENDPOINT_THROTTLES = [
+    BurstRateThrottle,
+    SustainedRateThrottle,
+    AIAnalysisThrottle,
+    ConcurrentStreamThrottle,
+]
+
+
+def release_stream_slot(request):
+    """Release the request's concurrent stream lease, if it holds one"""
+    http_request = getattr(request, '_request', request)
+    lease = getattr(http_request, 'stream_lease', None)
+    if lease:
+        http_request.stream_lease = None
+        get_rate_limit_backend().release_lease(*lease)
+
+
+def hold_stream_slot(view_func):
+    """
+    Keep the ConcurrentStreamThrottle lease until a streamed body finishes
+    Regular responses and errors release it as soon as the view returns
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            release_stream_slot(request)
+            raise
+        
+        if not on_stream_complete(request, response, lambda stream: release_stream_slot(request)):
+            release_stream_slot(request)
+        return response
+    return wrapper
@@ -16,6 +16,11 @@ from .views import (
     diagnose_stream_view,
     UserProfileUpdateView,
     HealthRecordView,
+    UserDataExportView,
+    DataExportJobView,
+    DataExportJobStatusView,
+    DataExportDownloadView,
+    metrics_view,
 )
 
 from .views_enhanced import (
@@ -58,5 +63,11 @@ urlpatterns = [
     
     path('user/profile/', UserProfileUpdateView.as_view(), name='user-profile-update'),
     path('health/records/', HealthRecordView.as_view(), name='health-records'),
+    path('user/export/', UserDataExportView.as_view(), name='user-data-export'),
+    path('user/export/jobs/', DataExportJobView.as_view(), name='data-export-jobs'),
+    path('user/export/jobs/<int:job_id>/', DataExportJobStatusView.as_view(), name='data-export-job'),
+    path('user/export/jobs/<int:job_id>/download/', DataExportDownloadView.as_view(), name='data-export-download'),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -8,6 +8,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from health_app.services.vector_store_service import get_vector_store
 from health_app.services.medical_knowledge_base import get_medical_knowledge_base
+from health_app.utils import openai_helper
+from health_app.utils.llm_router import route_stream
 import uuid
 
 
@@ -188,10 +190,12 @@ Remember: You are a supportive first-line health resource, not a replacement for
         
         assistant_response = ""
         try:
-            for chunk in self.chat_model.stream(messages):
-                if hasattr(chunk, 'content') and chunk.content:
-                    assistant_response += chunk.content
-                    yield chunk.content
+            for text in route_stream([
+                ('gemini', lambda: (chunk.content for chunk in self.chat_model.stream(messages))),
+                ('openai', lambda: openai_helper.stream_chat(self.system_prompt, enhanced_prompt)),
+            ]):
+                assistant_response += text
+                yield text
             
             try:
                 self.vector_store.add_conversation(
@@ -0,0 +1,381 @@
+"""
+LLM backend routing with per-backend circuit breakers
+Fails over from Gemini to OpenAI on errors or slow first tokens, with optional hedging
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from health_app.exceptions import LLMBackendUnavailable
+from health_app.metrics import (
+    LLM_BACKEND_CALLS,
+    LLM_CIRCUIT_STATE,
+    LLM_HEDGED_REQUESTS,
+    metrics_enabled,
+)
+from health_app.services.admission import get_admission_controller
+
+logger = logging.getLogger(__name__)
+
+# Settings holding each backend's API key; backends without a key are skipped
+BACKEND_API_KEYS = {
+    'gemini': 'GEMINI_API_KEY',
+    'openai': 'OPENAI_API_KEY',
+}
+
+
+def _router_settings():
+    return getattr(settings, 'LLM_ROUTER_SETTINGS', {})
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for one LLM backend
+
+    - Closed: calls pass; outcomes are kept for WINDOW_SECONDS
+    - Opens after CONSECUTIVE_FAILURES failures in a row, or when at least
+      MIN_REQUESTS calls in the window failed at FAILURE_RATE_THRESHOLD or more.
+      A first token slower than SLOW_TTFT_THRESHOLD counts as a failure
+    - Open: calls are skipped for OPEN_SECONDS, then one probe is let through
+      (half-open); its outcome closes or re-opens the circuit
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name,
+        failure_rate_threshold=0.5,
+        consecutive_failures=3,
+        min_requests=5,
+        window_seconds=60,
+        slow_ttft_threshold=8.0,
+        open_seconds=30,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.consecutive_failures = consecutive_failures
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.slow_ttft_threshold = slow_ttft_threshold
+        self.open_seconds = open_seconds
+
+        self.state = self.CLOSED
+        self._outcomes = deque()
+        self._failure_streak = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may be sent to this backend now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_first_token(self, ttft):
+        """Record a call that produced output, judged by its time to first token"""
+        if ttft > self.slow_ttft_threshold:
+            self.record_failure('slow')
+        else:
+            self.record_success()
+
+    def record_success(self):
+        self._count('success')
+        with self._lock:
+            self._failure_streak = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                logger.info(f"LLM circuit for {self.name} closed")
+                self._outcomes.clear()
+                self._set_state(self.CLOSED)
+            self._append(False)
+
+    def record_cancelled(self):
+        """Record a hedged call abandoned because another backend answered first"""
+        self._count('cancelled')
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, reason='error'):
+        self._count(reason)
+        with self._lock:
+            self._probe_in_flight = False
+            self._failure_streak += 1
+            self._append(True)
+            if self.state == self.HALF_OPEN or self._should_open():
+                if self.state != self.OPEN:
+                    logger.warning(f"LLM circuit for {self.name} opened ({reason})")
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _should_open(self):
+        if self._failure_streak >= self.consecutive_failures:
+            return True
+        if len(self._outcomes) < self.min_requests:
+            return False
+        failures = sum(1 for _, failed in self._outcomes if failed)
+        return failures / len(self._outcomes) >= self.failure_rate_threshold
+
+    def _append(self, failed):
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _set_state(self, state):
+        self.state = state
+        if metrics_enabled():
+            LLM_CIRCUIT_STATE.set(self.STATE_VALUES[state], backend=self.name)
+
+    def _count(self, outcome):
+        if metrics_enabled():
+            LLM_BACKEND_CALLS.inc(backend=self.name, outcome=outcome)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """Get or create the circuit breaker for a backend"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                config = _router_settings()
+                breaker = CircuitBreaker(
+                    name,
+                    failure_rate_threshold=config.get('FAILURE_RATE_THRESHOLD', 0.5),
+                    consecutive_failures=config.get('CONSECUTIVE_FAILURES', 3),
+                    min_requests=config.get('MIN_REQUESTS', 5),
+                    window_seconds=config.get('WINDOW_SECONDS', 60),
+                    slow_ttft_threshold=config.get('SLOW_TTFT_THRESHOLD', 8.0),
+                    open_seconds=config.get('OPEN_SECONDS', 30),
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+_DONE = object()
+
+
+class _StreamAttempt:
+    """One backend stream pumped from a background thread (used when hedging)"""
+
+    def __init__(self, backend, open_stream, ready):
+        self.backend = backend
+        self.breaker = get_circuit_breaker(backend)
+        self.open_stream = open_stream
+        self.ready = ready
+        self.chunks = queue.SimpleQueue()
+        self.cancelled = threading.Event()
+        self.error = None
+        self.started = None
+        self.ttft = None
+        self.thread = threading.Thread(target=self._pump, name=f"llm-{backend}", daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _pump(self):
+        stream = None
+        try:
+            stream = self.open_stream()
+            for text in stream:
+                if self.cancelled.is_set():
+                    break
+                if not text:
+                    continue
+                if self.ttft is None:
+                    self.ttft = time.monotonic() - self.started
+                    self.ready.put(self)
+                self.chunks.put(text)
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+            if self.ttft is None:
+                self.ready.put(self)
+            self.chunks.put(_DONE)
+
+    def drain(self):
+        while True:
+            text = self.chunks.get()
+            if text is _DONE:
+                break
+            yield text
+        if self.error is not None:
+            self.breaker.record_failure('error')
+            raise self.error
+
+
+def route_stream(candidates):
+    """
+    Stream text from the first healthy backend, failing over on errors
+
+    Args:
+        candidates: List of (backend name, callable returning a text iterator),
+            tried in LLM_ROUTER_SETTINGS['BACKENDS'] order
+
+    A backend is abandoned for the next one if it errors or ends before its
+    first token. Once text has been streamed, a later error is raised to the
+    caller. With HEDGE_AFTER set, the next backend is also started when no
+    token has arrived after that many seconds and the first to answer wins.
+    The whole call holds one LLM admission slot.
+    """
+    config = _router_settings()
+    order = config.get('BACKENDS', list(BACKEND_API_KEYS))
+    candidates = sorted(
+        [
+            (backend, open_stream) for backend, open_stream in candidates
+            if backend in order and getattr(settings, BACKEND_API_KEYS.get(backend, ''), True)
+        ],
+        key=lambda candidate: order.index(candidate[0])
+    )
+
+    with get_admission_controller().admit():
+        if config.get('HEDGE_AFTER'):
+            yield from _hedged_stream(candidates, config['HEDGE_AFTER'])
+        else:
+            yield from _failover_stream(candidates)
+
+
+def _failover_stream(candidates):
+    last_error = None
+    for backend, open_stream in candidates:
+        breaker = get_circuit_breaker(backend)
+        if not breaker.allow():
+            continue
+
+        started = time.monotonic()
+        emitted = False
+        stream = None
+        try:
+            stream = open_stream()
+            for text in stream:
+                if not text:
+                    continue
+                if not emitted:
+                    breaker.record_first_token(time.monotonic() - started)
+                    emitted = True
+                yield text
+        except Exception as e:
+            breaker.record_failure('error')
+            if emitted:
+                raise
+            logger.warning(f"LLM backend {backend} failed before streaming, failing over: {e}")
+            last_error = e
+            continue
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+        if emitted:
+            return
+        breaker.record_failure('empty')
+        logger.warning(f"LLM backend {backend} returned an empty response, failing over")
+
+    raise LLMBackendUnavailable(message=f"No LLM backend available: {last_error}" if last_error else None)
+
+
+def _hedged_stream(candidates, hedge_after):
+    pending = list(candidates)
+    ready = queue.SimpleQueue()
+    running = []
+    winner = None
+
+    def launch(hedge=False):
+        """Start the next backend whose circuit allows a call"""
+        while pending:
+            backend, open_stream = pending.pop(0)
+            if not get_circuit_breaker(backend).allow():
+                continue
+            if hedge and metrics_enabled():
+                LLM_HEDGED_REQUESTS.inc(backend=backend)
+            attempt = _StreamAttempt(backend, open_stream, ready)
+            running.append(attempt)
+            attempt.start()
+            return True
+        return False
+
+    try:
+        if not launch():
+            raise LLMBackendUnavailable()
+        while winner is None:
+            try:
+                attempt = ready.get(timeout=hedge_after if pending else None)
+            except queue.Empty:
+                logger.info(f"No LLM token after {hedge_after}s, hedging to {pending[0][0]}")
+                launch(hedge=True)
+                continue
+
+            if attempt.ttft is not None:
+                winner = attempt
+                break
+
+            # Finished without a token: record it and make sure something is still running
+            running.remove(attempt)
+            attempt.breaker.record_failure('error' if attempt.error else 'empty')
+            logger.warning(f"LLM backend {attempt.backend} failed before streaming: {attempt.error}")
+            if not running and not launch():
+                raise LLMBackendUnavailable()
+
+        winner.breaker.record_first_token(winner.ttft)
+        for attempt in running:
+            if attempt is not winner:
+                attempt.cancel()
+                elapsed = time.monotonic() - attempt.started
+                if elapsed > attempt.breaker.slow_ttft_threshold:
+                    attempt.breaker.record_failure('slow')
+                else:
+                    attempt.breaker.record_cancelled()
+        yield from winner.drain()
+    finally:
+        for attempt in running:
+            attempt.cancel()
+
+
+# ──────── Task helpers ────────
+
+def stream_ai_diagnosis(symptoms, context=""):
+    """Stream a symptom diagnosis from the first healthy backend"""
+    from . import gemini_helper, openai_helper
+
+    return route_stream([
+        ('gemini', lambda: gemini_helper.stream_ai_diagnosis(symptoms, context=context)),
+        ('openai', lambda: openai_helper.stream_ai_diagnosis(symptoms, context=context)),
+    ])
+
+
+def stream_ai_image_analysis(image_file, context=""):
+    """Stream a medical image analysis from the first healthy backend"""
+    from . import gemini_helper, openai_helper
+
+    # Read once so hedged attempts don't share the file position
+    image_file.seek(0)
+    image_data = image_file.read()
+    image_file.seek(0)
+    return route_stream([
+        ('gemini', lambda: gemini_helper.stream_ai_image_analysis(image_data, context=context)),
+        ('openai', lambda: openai_helper.stream_ai_image_analysis(image_data, context=context)),
+    ])
@@ -1,68 +1,89 @@
-from openai import OpenAI
 from django.conf import settings
 import base64
 
-client = OpenAI(
-    api_key=settings.OPENAI_API_KEY,
-    base_url=settings.OPENAI_BASE_URL
+DIAGNOSIS_SYSTEM_PROMPT = "You are a friendly and helpful health assistant. Speak directly to the user and keep the tone supportive and informative."
+
+IMAGE_SYSTEM_PROMPT = (
+    "You are a medical imaging assistant. Analyze the provided medical image and "
+    "provide insights about potential findings. Be professional but compassionate. "
+    "Note that you're not a substitute for professional medical advice. "
+    "Point out any notable features but avoid definitive diagnoses. "
+    "If it's a symptom, tell the user about it and the medication. "
+    "If it's medicine, explain when to take it and recommend consulting a professional."
 )
 
-def stream_ai_diagnosis(symptoms):
-    prompt = f"I’m experiencing: {', '.join(symptoms)}. What could be the possible reasons also provide the medication as well as the precautions?"
+_client = None
 
-    try:
-        stream = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a friendly and helpful health assistant. Speak directly to the user and keep the tone supportive and informative."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            stream=True,
-        )
-        return stream
-    except Exception as e:
-        print("OpenAI streaming error:", e)
-        return iter([
-            {"choices": [{"delta": {"content": "[Error occurred while streaming response]"}}]}
-        ])
-
-
-def stream_ai_image_analysis(image_file):
-    try:
-        encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-        image_file.seek(0)
-
-        stream = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a medical imaging assistant. Analyze the provided medical image and "
-                        "provide insights about potential findings. Be professional but compassionate. "
-                        "Note that you're not a substitute for professional medical advice. "
-                        "Point out any notable features but avoid definitive diagnoses. "
-                        "If it's a symptom, tell the user about it and the medication. "
-                        "If it's medicine, explain when to take it and recommend consulting a professional."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Please analyze this medical image and describe what you see."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-                    ]
-                }
-            ],
-            temperature=0.3,
-            max_tokens=1000,
-            stream=True
+
+def get_openai_client():
+    """Get or create the OpenAI client singleton"""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None
         )
+    return _client
+
+
+def _stream_text(**request):
+    stream = get_openai_client().chat.completions.create(stream=True, **request)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def stream_ai_diagnosis(symptoms, context=""):
+    """Stream AI diagnosis text; upstream errors are raised so the LLM router can fail over"""
+    prompt = f"I’m experiencing: {', '.join(symptoms)}. What could be the possible reasons also provide the medication as well as the precautions?"
+
+    system_message = DIAGNOSIS_SYSTEM_PROMPT
+    if context and context.strip():
+        system_message += f"\n\nBased on the user's medical history and previous conversations:\n{context}\n\nPlease consider this context when providing your response, but focus on the current symptoms."
+
+    yield from _stream_text(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+    )
+
+
+def stream_ai_image_analysis(image_data, context=""):
+    """Stream AI image analysis text; upstream errors are raised so the LLM router can fail over"""
+    encoded_image = base64.b64encode(image_data).decode('utf-8')
+
+    system_message = IMAGE_SYSTEM_PROMPT
+    if context and context.strip():
+        system_message += f"\n\nBased on the user's previous medical images and conversations:\n{context}\n\nPlease consider this context when analyzing the current image."
+
+    yield from _stream_text(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": system_message},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Please analyze this medical image and describe what you see."},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
+                ]
+            }
+        ],
+        temperature=0.3,
+        max_tokens=1000,
+    )
+
 
-        return stream
-    except Exception as e:
-        print("Image stream error:", e)
-        return iter([
-            {"choices": [{"delta": {"content": "[Image analysis failed. Please try again.]"}}]}
-        ])
+def stream_chat(system_prompt, prompt):
+    """Stream a chat completion for a system prompt and a single user turn"""
+    yield from _stream_text(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+    )
@@ -8,7 +8,8 @@ from django.contrib.auth import get_user_model
 
 from django.contrib.auth.password_validation import validate_password
 from django.http import StreamingHttpResponse
-from .utils.gemini_helper import stream_ai_diagnosis, stream_ai_image_analysis
+from django.utils.decorators import method_decorator
+from .utils.llm_router import stream_ai_diagnosis, stream_ai_image_analysis
 
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
@@ -18,6 +19,16 @@ from datetime import datetime
 
 # Import vector store for learning capabilities
 from .services.vector_store_service import get_vector_store
+from .metrics import track_stream
+from .analytics import track
+from .fast_serializers import chat_log_values, serialize_chat_logs
+from .conditional import (
+    chat_history_validator,
+    conditional_get,
+    health_record_validator,
+    profile_validator,
+)
+from .health_records import get_health_record, get_record_version, get_section_params
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +123,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+@method_decorator(conditional_get(profile_validator), name='list')
+@method_decorator(conditional_get(profile_validator), name='retrieve')
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
@@ -167,7 +180,19 @@ class ChatLogViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return ChatLog.objects.filter(user=self.request.user)
+        queryset = ChatLog.objects.filter(user=self.request.user)
+        # The to_attr lists outlive a save, so writes must read the relations fresh
+        if self.action == 'retrieve':
+            queryset = ChatLogSerializer.prefetch(queryset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path from .values() rows; writes and detail keep ChatLogSerializer
+        queryset = chat_log_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_chat_logs(page, request))
+        return Response(serialize_chat_logs(queryset, request))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -181,14 +206,20 @@ class MedicationViewSet(viewsets.ModelViewSet):
 
 
 # ──────── Diagnose  ──────── 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from django.http import StreamingHttpResponse
+from .services.admission import admit_llm_request
+from .pagination import KeysetPagination
+from .throttling import AI_ENDPOINT_THROTTLES, DataExportThrottle, ImageUploadThrottle, hold_stream_slot
 import logging
 
 logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(AI_ENDPOINT_THROTTLES)
+@hold_stream_slot
+@admit_llm_request
 def diagnose_stream_view(request):
     try:
         symptom_names = request.data.get('symptom_names', [])
@@ -206,6 +237,7 @@ def diagnose_stream_view(request):
             is_user=True
         )
         user_log.symptom_references.set(symptoms)
+        track(request.user, 'SYMPTOM_DIAGNOSIS', {'chat_log_id': user_log.id, 'symptom_count': len(symptoms)})
 
         # Initialize vector store for learning
         try:
@@ -244,13 +276,9 @@ def diagnose_stream_view(request):
             try:
                 # Pass context to AI for enhanced responses
                 stream = stream_ai_diagnosis([s.name for s in symptoms], context=context)
-                for chunk in stream:
-                    if not chunk.choices:
-                        continue
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, "content") and delta.content:
-                        bot_response += delta.content
-                        yield delta.content
+                for text in stream:
+                    bot_response += text
+                    yield text
 
                 bot_log = ChatLog.objects.create(
                     user=request.user,
@@ -287,7 +315,10 @@ def diagnose_stream_view(request):
                     is_user=False
                 )
 
-        return StreamingHttpResponse(stream_response(), content_type="text/plain")
+        return StreamingHttpResponse(
+            track_stream(stream_response(), endpoint='diagnose'),
+            content_type="text/plain"
+        )
 
     except Exception as outer_error:
         logger.exception("Outer error in diagnose_stream_view")
@@ -297,7 +328,10 @@ def diagnose_stream_view(request):
 
 class DiagnoseImageAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = AI_ENDPOINT_THROTTLES + [ImageUploadThrottle]
 
+    @method_decorator(hold_stream_slot)
+    @method_decorator(admit_llm_request)
     def post(self, request):
         try:
             if 'image' not in request.FILES:
@@ -311,6 +345,7 @@ class DiagnoseImageAPIView(APIView):
                 is_user=True,
                 image=image_file
             )
+            track(request.user, 'IMAGE_ANALYSIS', {'chat_log_id': user_chat_msg.id})
 
             # Initialize vector store for learning
             try:
@@ -350,11 +385,9 @@ class DiagnoseImageAPIView(APIView):
                 try:
                     # Pass context to AI for enhanced image analysis
                     stream = stream_ai_image_analysis(image_file, context=context)
-                    for chunk in stream:
-                        if chunk.choices and chunk.choices[0].delta.content:
-                            content = chunk.choices[0].delta.content
-                            bot_response += content
-                            yield content
+                    for text in stream:
+                        bot_response += text
+                        yield text
                     
                     diagnosis = AIDiagnosisResponse.objects.create(
                         user=request.user,
@@ -400,7 +433,10 @@ class DiagnoseImageAPIView(APIView):
                         is_user=False
                     )
 
-            return StreamingHttpResponse(generate(), content_type="text/plain")
+            return StreamingHttpResponse(
+                track_stream(generate(), endpoint='img-diagnose'),
+                content_type="text/plain"
+            )
             
         except Exception as e:
             return Response({'error': str(e)}, status=500)
@@ -408,23 +444,20 @@ class DiagnoseImageAPIView(APIView):
 class ChatHistoryView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(conditional_get(chat_history_validator))
     def get(self, request):
-        # Add pagination support and limit default to 100 most recent chats
-        # Use select_related to optimize database queries
-        limit = request.query_params.get('limit', 100)
-        try:
-            limit = int(limit)
-            if limit > 500:  # Cap at 500 to prevent abuse
-                limit = 500
-        except ValueError:
-            limit = 100
-            
-        chats = ChatLog.objects.filter(
-            user=request.user
-        ).select_related('user').order_by('timestamp')[:limit]
+        """
+        Newest chats first page, oldest-to-newest within the page
+        Use the X-Older-Cursor header as ?before= to load earlier history
+        """
+        chats = ChatLog.objects.filter(user=request.user)
+        session_id = request.query_params.get('session_id')
+        if session_id:
+            chats = chats.filter(session_id=session_id)
         
-        serializer = ChatLogSerializer(chats, many=True, context={'request': request})
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(chat_log_values(chats), request)
+        return paginator.get_paginated_response(serialize_chat_logs(page, request))
 
 class ChatDeleteView(APIView):
     permission_classes = [IsAuthenticated]
@@ -438,26 +471,19 @@ class ChatDeleteView(APIView):
             return Response({'error': 'Chat not found'}, status=status.HTTP_404_NOT_FOUND)
     
 class HealthRecordView(APIView):
+    """
+    Dashboard record: profile plus the newest page of symptoms, diagnoses and chats
+    Each section takes ?<section>_limit= and ?<section>_before=<cursor>; the
+    next older page's cursor is returned under 'cursors'
+    """
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(conditional_get(health_record_validator))
     def get(self, request):
         
-        profile = UserProfile.objects.get(user=request.user)
-        symptoms = UserSymptomLog.objects.filter(user=request.user)
-        diagnoses = AIDiagnosisResponse.objects.filter(user=request.user)
-        chats = ChatLog.objects.filter(user=request.user).order_by('-timestamp')[:20]  
-
-        profile_data = UserProfileSerializer(profile).data
-        symptoms_data = UserSymptomLogSerializer(symptoms, many=True).data
-        diagnoses_data = AIDiagnosisResponseSerializer(diagnoses, many=True).data
-        chat_data = ChatLogSerializer(chats, many=True, context={'request': request}).data
-        
-        return Response({
-            'profile': profile_data,
-            'symptoms': symptoms_data,
-            'diagnoses': diagnoses_data,
-            'chat_history': chat_data
-        })
+        params = get_section_params(request)
+        version = get_record_version(request.user.pk)
+        return Response(get_health_record(request, version, params))
 
 
 class UserProfileUpdateView(APIView):
@@ -509,4 +535,134 @@ class UserProfileUpdateView(APIView):
             
         except Exception as e:
             logger.error(f"Error updating profile: {str(e)}")
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# ──────── GDPR Export ────────
+from django.conf import settings
+import os
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from .gdpr import EXPORT_CONTENT_TYPES, DataExporter
+from .models import DataExportRequest
+from .security import SecurityAuditLogger
+from .serializers import DataExportRequestSerializer
+from .services.export_jobs import request_export
+
+
+class UserDataExportView(APIView):
+    """
+    Stream the user's data as JSON, compressed on the fly
+    ?compression=gzip|zstd|none (default GDPR_EXPORT_SETTINGS['DEFAULT_COMPRESSION'])
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [DataExportThrottle]
+    
+    def get(self, request):
+        
+        compression = request.query_params.get(
+            'compression', getattr(settings, 'GDPR_EXPORT_SETTINGS', {}).get('DEFAULT_COMPRESSION')
+        )
+        if compression in ('', 'none'):
+            compression = None
+        if compression not in EXPORT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported compression '{compression}', use gzip, zstd or none"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        SecurityAuditLogger.log_data_export(request.user, 'JSON', request.META.get('REMOTE_ADDR', '0.0.0.0'))
+        return DataExporter.streaming_json_response(request.user, compression)
+
+
+class DataExportJobView(APIView):
+    """
+    Queue a background export: POST {"format": "JSON"|"PDF", "compression": "gzip"|"zstd"|""}
+    Returns 202 with the job; poll status_url until download_url is set
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [DataExportThrottle]
+    
+    def post(self, request):
+        
+        export_format = str(request.data.get('format', 'JSON')).upper()
+        compression = request.data.get('compression') or ''
+        if compression == 'none':
+            compression = ''
+        
+        if export_format not in ('JSON', 'PDF'):
+            return Response({'error': "format must be JSON or PDF"}, status=status.HTTP_400_BAD_REQUEST)
+        if compression and (export_format == 'PDF' or compression not in EXPORT_CONTENT_TYPES):
+            return Response(
+                {'error': "compression must be gzip, zstd or none (JSON only)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        job = request_export(request.user, export_format, compression)
+        SecurityAuditLogger.log_data_export(request.user, export_format, request.META.get('REMOTE_ADDR', '0.0.0.0'))
+        
+        response = Response(
+            DataExportRequestSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+        response['Location'] = reverse('data-export-job', kwargs={'job_id': job.pk})
+        return response
+
+
+class DataExportJobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id):
+        
+        job = get_object_or_404(DataExportRequest, pk=job_id, user=request.user)
+        response = Response(DataExportRequestSerializer(job, context={'request': request}).data)
+        if job.status in ('PENDING', 'PROCESSING'):
+            response['Retry-After'] = str(getattr(settings, 'EXPORT_JOB_SETTINGS', {}).get('POLL_AFTER', 2))
+        return response
+
+
+class DataExportDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, job_id):
+        
+        job = get_object_or_404(DataExportRequest, pk=job_id, user=request.user)
+        if job.status != 'COMPLETED' or not job.file_path:
+            return Response(
+                {'error': f"Export is {job.status.lower()}"},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return FileResponse(
+            job.file_path.open('rb'),
+            as_attachment=True,
+            filename=os.path.basename(job.file_path.name),
+        )
+
+
+# ──────── Metrics ────────
+import hmac
+from django.http import HttpResponse
+from .metrics import REGISTRY
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint aggregating every gunicorn worker
+    Requires a Bearer token when METRICS_SETTINGS['AUTH_TOKEN'] is set;
+    without one, scrapes are only served with DEBUG on
+    """
+    token = settings.METRICS_SETTINGS.get('AUTH_TOKEN')
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    elif not hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(), f"Bearer {token}".encode()
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    
+    return HttpResponse(
+        REGISTRY.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
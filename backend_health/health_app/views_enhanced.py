@@ -1,13 +1,18 @@
 """
 Enhanced chat views using LangChain with vector database memory
 """
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.http import StreamingHttpResponse
 from .models import ChatLog, Symptom, UserProfile, ConversationMemory
 from .utils.langchain_helper import get_langchain_service
-from .services.medical_knowledge_base import get_medical_knowledge_base
+from .services.medical_knowledge_base import MedicalKnowledgeBase, get_medical_knowledge_base
+from .conditional import conditional_get, research_categories_validator
+from .metrics import track_stream
+from .analytics import track
+from .services.admission import admit_llm_request
+from .throttling import AI_ENDPOINT_THROTTLES, hold_stream_slot
 import logging
 import uuid
 
@@ -16,6 +21,9 @@ logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(AI_ENDPOINT_THROTTLES)
+@hold_stream_slot
+@admit_llm_request
 def chat_with_memory_view(request):
     """
     Enhanced chat endpoint that uses LangChain and vector database for conversation memory
@@ -57,6 +65,8 @@ def chat_with_memory_view(request):
             vectorized=False  
         )
         
+        track(request.user, 'CHAT_MESSAGE', {'chat_log_id': user_chat.id}, session_id=session_id)
+        
         langchain_service = get_langchain_service()
         
         def stream_response():
@@ -99,7 +109,10 @@ def chat_with_memory_view(request):
                     session_id=session_id
                 )
         
-        return StreamingHttpResponse(stream_response(), content_type="text/plain")
+        return StreamingHttpResponse(
+            track_stream(stream_response(), endpoint='chat'),
+            content_type="text/plain"
+        )
         
     except Exception as outer_error:
         logger.exception("Outer error in chat_with_memory_view")
@@ -108,6 +121,9 @@ def chat_with_memory_view(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(AI_ENDPOINT_THROTTLES)
+@hold_stream_slot
+@admit_llm_request
 def diagnose_with_memory_view(request):
     """
     Enhanced symptom diagnosis endpoint with conversation memory
@@ -161,6 +177,13 @@ def diagnose_with_memory_view(request):
             vectorized=False
         )
         
+        track(
+            request.user,
+            'SYMPTOM_DIAGNOSIS',
+            {'chat_log_id': user_log.id, 'symptom_count': len(symptoms)},
+            session_id=session_id
+        )
+        
         langchain_service = get_langchain_service()
         
         def stream_response():
@@ -204,7 +227,10 @@ def diagnose_with_memory_view(request):
                     session_id=session_id
                 )
         
-        return StreamingHttpResponse(stream_response(), content_type="text/plain")
+        return StreamingHttpResponse(
+            track_stream(stream_response(), endpoint='diagnose-enhanced'),
+            content_type="text/plain"
+        )
         
     except Exception as outer_error:
         logger.exception("Outer error in diagnose_with_memory_view")
@@ -285,13 +311,13 @@ def search_medical_research_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(research_categories_validator)
 def get_medical_categories_view(request):
     """
     Get available medical research categories
     """
     try:
-        medical_kb = get_medical_knowledge_base()
-        categories = medical_kb.get_available_categories()
+        categories = MedicalKnowledgeBase.get_available_categories()
         
         return Response({
             'categories': categories,